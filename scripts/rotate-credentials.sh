@@ -55,7 +55,7 @@ OPTIONS:
     -d, --database DB           Database name (default: \$DATABASE)
     -n, --namespace NS          Kubernetes namespace (default: \$NAMESPACE)
     -l, --app-label LABEL       App label for pod selection (default: \$APP_LABEL)
-    -r, --rollback TIMESTAMP    Rollback to specific backup (YYYYMMDD_HHMMSS)
+    -r, --rollback TARGET       Rollback to 'latest', a rotated username or a KV version
     --dry-run                   Perform dry run without changes
     --check-prereqs             Check prerequisites and exit
     -h, --help                  Show this help message
@@ -69,7 +69,7 @@ ENVIRONMENT VARIABLES:
     NAMESPACE                   Kubernetes namespace
     APP_LABEL                   App label for pod selection
     DRY_RUN                     Set to 'true' for dry run
-    ROLLBACK_TIMESTAMP          Backup timestamp for rollback
+    ROLLBACK_TIMESTAMP          Rollback target (latest, username or version)
 
 EXAMPLES:
     # Dry run with environment variables
@@ -80,8 +80,8 @@ EXAMPLES:
     # Manual rotation with parameters
     $0 -u "https://vault.company.com" -t "hvs.XXXXXXXXXX" -p "workouttracker/secrets"
 
-    # Rollback to previous backup
-    $0 --rollback "20250108_0200"
+    # Undo the most recent rotation
+    $0 --rollback latest
 
     # Check prerequisites
     $0 --check-prereqs
@@ -123,10 +123,6 @@ check_prerequisites() {
         missing_deps+=("python package: kubernetes")
     fi
     
-    if ! python3 -c "import cryptography" &> /dev/null; then
-        missing_deps+=("python package: cryptography")
-    fi
-    
     # Check kubectl access
     if ! kubectl auth can-i get pods &> /dev/null; then
         missing_deps+=("kubectl cluster access")
@@ -289,7 +285,7 @@ main() {
     
     if [ -n "$ROLLBACK_TIMESTAMP" ]; then
         python_cmd+=(--rollback "$ROLLBACK_TIMESTAMP")
-        log_warn "Rolling back to timestamp: $ROLLBACK_TIMESTAMP"
+        log_warn "Rolling back to: $ROLLBACK_TIMESTAMP"
     fi
     
     # Execute Python script
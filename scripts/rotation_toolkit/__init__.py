@@ -0,0 +1,11 @@
+"""
+SQL Server credential rotation toolkit
+
+Rotates SQL Server credentials stored in HashiCorp Vault and referenced as
+Kubernetes external secrets, rolls them back, and checks the health of the
+rotation system. Run it as ``python -m rotation_toolkit <command>``; see
+cli.py for the commands.
+
+Importing the package is cheap: hvac, pyodbc and the kubernetes client are
+only imported by the code paths that use them (see backends.py).
+"""
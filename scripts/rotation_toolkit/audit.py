@@ -0,0 +1,211 @@
+"""
+Non-blocking log pipeline: redaction, JSON-lines audit file and a background writer
+
+Callers only put records on a queue. One writer thread takes them off in
+batches, redacts secrets with a single precompiled pattern, and writes each
+batch to every handler in one write and one flush, so worker threads never
+wait on the console or the audit file.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from . import tracing
+
+# Audit file size bound: AUDIT_LOG_MAX_BYTES per file, AUDIT_LOG_BACKUPS rotated files kept
+AUDIT_LOG_MAX_BYTES = 10 * 1024 * 1024
+AUDIT_LOG_BACKUPS = 5
+
+# Records written per batch at most
+BATCH_SIZE = 256
+
+REDACTED = '***'
+
+# Key names whose value is a secret; a key may carry a prefix (new_password, old_password)
+SECRET_KEYS = r'(?:\w*_)?(?:password|pwd|passwd|secret|client[_-]?secret|token|vault[_-]?token|x-vault-token)'
+
+# One pass catches key=value secrets (connection strings, query strings),
+# "key": value secrets (JSON, Python reprs), Vault tokens and bearer tokens.
+# Only a quoted key may be followed by ':', so prose such as "Vault secret:
+# check-and-set ..." keeps its cause. A quoted or {}-quoted value is masked
+# as one token, doubled or escaped quotes included; an unquoted value after
+# '=' is masked up to the ';' separator (or the end of the line), since
+# generated passwords contain '&' and ','; after ':' it ends at whitespace.
+REDACTION_PATTERN = re.compile(
+    r'(?P<key>(?:\b' + SECRET_KEYS + r'\s*(?P<equals>=)|(?P<quote>["\'])\b' + SECRET_KEYS + r'(?P=quote)\s*[:=])\s*)'
+    r'(?P<value>"(?:[^"\\]|\\.|"")*"|\'(?:[^\'\\]|\\.|\'\')*\'|\{(?:[^}]|\}\})*\}'
+    r'|(?(equals)[^;\r\n]*|[^\s;]+))'
+    r'|\b(?:hv[sbr]|s)\.[A-Za-z0-9_-]{20,}'
+    r'|(?P<bearer>\bBearer\s+)[A-Za-z0-9._~+/=-]+',
+    re.IGNORECASE
+)
+
+
+def _redact_match(match: re.Match) -> str:
+    value = match.group('value')
+    if value and value[0] in '"\'{':
+        # Keep the quotes so JSON and quoted connection strings stay well-formed
+        return match.group('key') + value[0] + REDACTED + value[-1]
+    return (match.group('key') or match.group('bearer') or '') + REDACTED
+
+
+def redact(message: str) -> str:
+    """Mask passwords, tokens and connection-string secrets in a message"""
+    return REDACTION_PATTERN.sub(_redact_match, message)
+
+
+class TraceContextFilter(logging.Filter):
+    """Attach the active trace ID in the logging thread, before the record is queued"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = tracing.current_trace_id()
+        return True
+
+
+class JSONLineFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'trace_id', None):
+            entry['trace_id'] = record.trace_id
+        return json.dumps(entry)
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """A StreamHandler that can write a batch of records in one write and one flush"""
+
+    def emit_batch(self, records: List[logging.LogRecord]):
+        records = [record for record in records if record.levelno >= self.level and self.filter(record)]
+        if not records:
+            return
+        try:
+            text = ''.join(self.format(record) + self.terminator for record in records)
+            with self.lock:
+                self.stream.write(text)
+                self.stream.flush()
+        except Exception:
+            self.handleError(records[0])
+
+
+class AuditFileHandler(logging.handlers.RotatingFileHandler):
+    """Size-bounded audit log written in batches; every file is created with mode 600"""
+
+    def __init__(self, filename: str, max_bytes: int = AUDIT_LOG_MAX_BYTES, backup_count: int = AUDIT_LOG_BACKUPS):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+
+    def _open(self):
+        fd = os.open(self.baseFilename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        return os.fdopen(fd, self.mode, encoding=self.encoding, errors=self.errors)
+
+    def emit_batch(self, records: List[logging.LogRecord]):
+        records = [record for record in records if record.levelno >= self.level and self.filter(record)]
+        if not records:
+            return
+        try:
+            lines = [self.format(record) + self.terminator for record in records]
+            with self.lock:
+                if self.stream is None:
+                    self.stream = self._open()
+                size = self.stream.tell()
+                pending = []
+                for line in lines:
+                    if self.maxBytes and size and size + len(line) > self.maxBytes:
+                        self.stream.write(''.join(pending))
+                        pending = []
+                        self.doRollover()
+                        size = 0
+                    pending.append(line)
+                    size += len(line)
+                self.stream.write(''.join(pending))
+                self.stream.flush()
+        except Exception:
+            self.handleError(records[0])
+
+
+class BackgroundLogWriter:
+    """Drains the log queue on one thread and hands records to the handlers in batches
+
+    Each record is redacted once here, before any handler formats it.
+    """
+
+    _STOP = object()
+
+    def __init__(self, handlers: List[logging.Handler], batch_size: int = BATCH_SIZE):
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+
+    def start(self) -> 'BackgroundLogWriter':
+        self.thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Write everything queued so far, then stop the writer thread"""
+        if self.thread is not None:
+            self.queue.put(self._STOP)
+            self.thread.join()
+            self.thread = None
+        for handler in self.handlers:
+            handler.close()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = any(record is self._STOP for record in batch)
+            records = [record for record in batch if record is not self._STOP]
+            for record in records:
+                # QueueHandler already merged args and traceback into msg
+                record.msg = redact(record.msg)
+            for handler in self.handlers:
+                handler.emit_batch(records)
+            if stopping:
+                return
+
+
+def start_logging(console_format: str, audit_file: Optional[str] = None,
+                  level: int = logging.INFO) -> BackgroundLogWriter:
+    """Route the root logger through a queue to the console and, if given, a JSON-lines audit file
+
+    Returns the running writer; call stop() before exiting so queued records are written.
+    """
+    console = BatchStreamHandler()
+    console.setFormatter(logging.Formatter(console_format))
+    handlers = [console]
+
+    if audit_file:
+        audit = AuditFileHandler(audit_file)
+        audit.setFormatter(JSONLineFormatter())
+        handlers.insert(0, audit)
+
+    writer = BackgroundLogWriter(handlers).start()
+
+    queue_handler = logging.handlers.QueueHandler(writer.queue)
+    queue_handler.addFilter(TraceContextFilter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    return writer
@@ -0,0 +1,66 @@
+"""
+Lazy access to the client libraries used by the rotation toolkit
+
+hvac, pyodbc and the kubernetes client are imported the first time a command
+actually talks to Vault, SQL Server or the Kubernetes API, so `--help`,
+`--dry-run` and single health checks do not pay for backends they never use.
+"""
+
+import importlib
+import importlib.util
+from typing import Iterable
+
+INSTALL_HINT = "Install with: pip install -r scripts/requirements-rotation.txt"
+
+# Stand-ins served in place of a client library, e.g. by the offline benchmarks
+_substitutes = {}
+
+
+class MissingDependencyError(ImportError):
+    """A client library needed by the current command is not installed"""
+
+
+def substitute(module_name: str, module):
+    """Serve module wherever module_name would be loaded; None removes the substitute"""
+    if module is None:
+        _substitutes.pop(module_name, None)
+    else:
+        _substitutes[module_name] = module
+
+
+def _load(module_name: str):
+    if module_name in _substitutes:
+        return _substitutes[module_name]
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise MissingDependencyError(f"Missing required dependency: {e}") from e
+
+
+def require(modules: Iterable[str]):
+    """Fail fast if any of the given top-level modules is not installed, without importing them"""
+    missing = [name for name in modules
+               if name not in _substitutes and importlib.util.find_spec(name) is None]
+    if missing:
+        raise MissingDependencyError(f"Missing required dependency: {', '.join(missing)}")
+
+
+def hvac():
+    return _load('hvac')
+
+
+def pyodbc():
+    return _load('pyodbc')
+
+
+def kubernetes_client():
+    return _load('kubernetes.client')
+
+
+def kubernetes_config():
+    return _load('kubernetes.config')
+
+
+def api_exception():
+    """Return the kubernetes ApiException class"""
+    return _load('kubernetes.client.rest').ApiException
@@ -0,0 +1,17 @@
+"""
+Offline benchmarks for the rotation toolkit
+
+Runs SQLCredentialRotator.rotate_credentials and
+RotationHealthChecker.generate_report against local stand-ins:
+
+- FakeVaultServer: a KV v2 HTTP server spoken to by the real hvac client
+- FakeKubernetesServer: an API server with list/watch/patch and scripted
+  ExternalSecret syncs and Deployment rollouts, spoken to by the real
+  kubernetes client
+- FakeSQLBackend: a pyodbc-compatible module substituted for pyodbc
+
+Each stand-in injects a configurable latency per request and counts round
+trips. Run with ``python -m rotation_toolkit.bench``; see runner.py.
+``python -m rotation_toolkit.bench.dryrun`` runs the rotate command's dry
+run against them.
+"""
@@ -0,0 +1,83 @@
+"""
+Connection-string micro-benchmark
+
+Times parsing, reading the login, swapping the credentials and writing back
+representative connection strings, and checks that each one round-trips
+unchanged and keeps every setting other than the login.
+
+Usage:
+    python -m rotation_toolkit.bench.connstr [--number 20000] [--repeat 5] [--json]
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from typing import Dict
+
+from ..connection import parse_connection_string
+
+SAMPLES = {
+    'standard': "Server=sql.example.com;Database=WorkoutTrackerWeb;TrustServerCertificate=True;"
+                "integrated security=False;User ID=workout_app_20260101;Password=Q7x!m@2#Lp9$Rt4&",
+    'pool-tuned': "Server=tcp:sql.example.com,1433;Initial Catalog=WorkoutTrackerWeb;User ID=workout_app_20260101;"
+                  "Password=Q7x!m@2#Lp9$Rt4&;Encrypt=True;TrustServerCertificate=False;Connect Timeout=30;"
+                  "Min Pool Size=5;Max Pool Size=200;MultipleActiveResultSets=True;Application Name=hangfire;",
+    'odbc-quoted': "Driver={ODBC Driver 18 for SQL Server};Server=sql.example.com;Database=WorkoutTrackerWeb;"
+                   "UID=workout_app_20260101;PWD={p;w}}d};Encrypt=yes",
+}
+
+OPERATIONS = {
+    'parse': lambda text: parse_connection_string(text),
+    'read login': lambda text: parse_connection_string(text).get('user_id'),
+    'swap credentials': lambda text: str(parse_connection_string(text).with_credentials(
+        'workout_app_20260201', 'N3w!p@ss#Word$42')),
+}
+
+
+def check(text: str) -> bool:
+    """The string round-trips exactly, and a credential swap changes nothing else"""
+    parsed = parse_connection_string(text)
+    if str(parsed) != text:
+        return False
+    swapped = parse_connection_string(str(parsed.with_credentials('u2', 'p;2')))
+    others = [(key, value) for key, value in parsed.items() if key.lower() not in ('user id', 'uid', 'password', 'pwd')]
+    kept = [(key, value) for key, value in swapped.items() if key.lower() not in ('user id', 'uid', 'password', 'pwd')]
+    return others == kept and swapped['user_id'] == 'u2' and swapped['password'] == 'p;2'
+
+
+def measure(number: int, repeat: int) -> Dict:
+    """Best-of-repeat microseconds per call for every operation and sample"""
+    results = {}
+    for sample, text in SAMPLES.items():
+        timings = {}
+        for name, operation in OPERATIONS.items():
+            best = min(timeit.repeat(lambda: operation(text), number=number, repeat=repeat))
+            timings[name] = round(best / number * 1e6, 2)
+        results[sample] = {'us_per_call': timings, 'round_trip_ok': check(text)}
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time connection-string parsing and credential swaps")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per timing")
+    parser.add_argument("--repeat", type=int, default=5, help="Timings per operation; the best is reported")
+    parser.add_argument("--json", action="store_true", help="Output in JSON format")
+    args = parser.parse_args()
+
+    results = measure(args.number, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"Connection strings (best of {args.repeat} x {args.number} calls)")
+        for sample, result in results.items():
+            status = "OK" if result['round_trip_ok'] else "ROUND TRIP FAILED"
+            timings = '  '.join(f"{name} {us:6.2f} us" for name, us in result['us_per_call'].items())
+            print(f"  {sample + ':':<14}{timings}  {status}")
+
+    return 0 if all(result['round_trip_ok'] for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+A dry run of the rotate command against fresh local stand-ins
+
+Starts the stand-ins without added latency, seeded as for the benchmarks,
+points a temporary kubeconfig at the Kubernetes stand-in and runs
+``rotation_toolkit rotate --dry-run`` through the real command line. Any
+further arguments are passed on, e.g. --no-preflight. The startup budget
+times it end to end.
+
+Usage:
+    python -m rotation_toolkit.bench.dryrun [rotate options]
+"""
+
+import json
+import os
+import sys
+import tempfile
+from typing import List, Optional
+
+from .. import cli
+from .runner import APP_LABEL, DATABASE, EXTERNAL_SECRET, NAMESPACE, SECRET_PATH, SQL_SERVER, BenchEnvironment
+
+SETTINGS = {
+    'vault_latency_ms': 0.0,
+    'kube_latency_ms': 0.0,
+    'sql_latency_ms': 0.0,
+    'sync_delay_ms': 0.0,
+    'rollout_step_ms': 0.0,
+    'replicas': 3,
+    'session_linger_ms': 0.0,
+    'wave_size': 0,
+    'fault_every': 0,
+    'capacity_probe': False,
+    'ag_secondaries': 0,
+    'wait_for_quiet': False,
+}
+
+
+def write_kubeconfig(path: str, server: str):
+    """A kubeconfig whose only context is the Kubernetes stand-in (JSON is valid YAML)"""
+    with open(path, 'w') as f:
+        json.dump({
+            'apiVersion': 'v1',
+            'kind': 'Config',
+            'clusters': [{'name': 'bench', 'cluster': {'server': server}}],
+            'users': [{'name': 'bench', 'user': {'token': 'bench-token'}}],
+            'contexts': [{'name': 'bench', 'context': {'cluster': 'bench', 'user': 'bench'}}],
+            'current-context': 'bench',
+        }, f)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    with tempfile.TemporaryDirectory() as directory, BenchEnvironment(SETTINGS) as env:
+        kubeconfig = os.path.join(directory, 'kubeconfig')
+        write_kubeconfig(kubeconfig, env.kube.url)
+        # Never fall through to a real cluster when run inside a pod
+        os.environ.pop('KUBERNETES_SERVICE_HOST', None)
+        os.environ['KUBECONFIG'] = kubeconfig
+
+        return cli.main([
+            'rotate', '--dry-run',
+            '--vault-url', env.vault.url, '--vault-token', 'bench-token',
+            '--secret-path', SECRET_PATH, '--sql-server', SQL_SERVER, '--database', DATABASE,
+            '--namespace', NAMESPACE, '--app-label', APP_LABEL, '--external-secret', EXTERNAL_SECRET,
+        ] + (sys.argv[1:] if argv is None else argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""
+Kubernetes API stand-in for the benchmarks
+"""
+
+import copy
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from ..kube import EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL
+from .server import FakeHTTPServer
+
+# Idle watches send a bookmark this often so abandoned streams notice the client is gone
+BOOKMARK_INTERVAL = 1.0
+
+
+def _merge(target: dict, patch: dict):
+    """Apply a JSON merge patch in place"""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+def _parse_selector(selector: Optional[str]) -> Dict[str, str]:
+    """Parse an equality-based selector such as 'app=web,tier=frontend'"""
+    terms = {}
+    for term in (selector or '').split(','):
+        if term.strip():
+            key, _, value = term.partition('=')
+            terms[key.strip()] = value.lstrip('=').strip()
+    return terms
+
+
+class FakeKubernetesServer(FakeHTTPServer):
+    """An in-memory API server: get, paged list, watch and merge patch for any resource
+
+    Objects are stored per (API group, plural) and every change is appended to
+    an event log, so watches started from a resourceVersion replay what they
+    missed and then block for new events. Two controllers are scripted:
+
+    - patching an ExternalSecret's annotations marks it synced after
+      sync_delay seconds and updates its target Secret;
+    - patching a Deployment's spec starts a rollout that replaces one replica
+      every rollout_step seconds, calling on_replica_replaced(namespace, name)
+      for each old replica it retires;
+    - evicting a pod deletes it unless a PodDisruptionBudget covering it
+      allows no disruption (429), calls on_replica_replaced for its
+      Deployment and starts a Ready replacement after rollout_step seconds.
+
+    PodDisruptionBudgets' disruptionsAllowed follows the Ready pods they cover.
+    SelfSubjectAccessReviews are allowed unless (group, resource, subresource,
+    verb) is in denied.
+    """
+
+    def __init__(self, latency: float = 0.0, sync_delay: float = 0.2, rollout_step: float = 0.1):
+        super().__init__(latency)
+        self.sync_delay = sync_delay
+        self.rollout_step = rollout_step
+        self.objects = {}
+        self.events = []
+        self.resource_version = 1000
+        self.changed = threading.Condition(self.lock)
+        self.stopped = threading.Event()
+        self.on_replica_replaced = None
+        self.denied = set()
+
+    # Seeding
+
+    def add(self, group: str, plural: str, obj: dict) -> dict:
+        """Store an object without counting a request"""
+        with self.lock:
+            obj = copy.deepcopy(obj)
+            obj['metadata'].setdefault('generation', 1)
+            obj['metadata'].setdefault('labels', {})
+            return self._store(group, plural, obj, 'ADDED')
+
+    def add_deployment(self, namespace: str, name: str, labels: Dict[str, str], replicas: int = 3,
+                       pod_labels: Optional[Dict[str, str]] = None) -> dict:
+        pod_labels = dict(pod_labels or labels)
+        return self.add('apps', 'deployments', {
+            'metadata': {'name': name, 'namespace': namespace, 'labels': dict(labels)},
+            'spec': {'replicas': replicas, 'selector': {'matchLabels': pod_labels},
+                     'template': {'metadata': {'labels': pod_labels}}},
+            'status': {'observedGeneration': 1, 'replicas': replicas, 'updatedReplicas': replicas,
+                       'availableReplicas': replicas},
+        })
+
+    def add_pods(self, namespace: str, prefix: str, labels: Dict[str, str], count: int):
+        for i in range(count):
+            self.add('', 'pods', self._pod(namespace, f"{prefix}-{i}", labels))
+
+    def add_pdb(self, namespace: str, name: str, selector: Dict[str, str], min_available: int) -> dict:
+        self.add('policy', 'poddisruptionbudgets', {
+            'metadata': {'name': name, 'namespace': namespace},
+            'spec': {'minAvailable': min_available, 'selector': {'matchLabels': dict(selector)}},
+            'status': {},
+        })
+        with self.lock:
+            self._update_budgets(namespace)
+        return self.get('policy', 'poddisruptionbudgets', namespace, name)
+
+    def add_secret(self, namespace: str, name: str) -> dict:
+        return self.add('', 'secrets', {'metadata': {'name': name, 'namespace': namespace}, 'data': {}})
+
+    def add_external_secret(self, namespace: str, name: str, target: str) -> dict:
+        return self.add(EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, {
+            'metadata': {'name': name, 'namespace': namespace},
+            'spec': {'target': {'name': target}},
+            'status': {'refreshTime': None, 'conditions': [{'type': 'Ready', 'status': 'True'}]},
+        })
+
+    def add_cronjob(self, namespace: str, name: str, labels: Dict[str, str], schedule: str):
+        return self.add('batch', 'cronjobs', {
+            'metadata': {'name': name, 'namespace': namespace, 'labels': dict(labels)},
+            'spec': {'schedule': schedule, 'suspend': False},
+            'status': {},
+        })
+
+    def get(self, group: str, plural: str, namespace: str, name: str) -> Optional[dict]:
+        with self.lock:
+            obj = self.objects.get((group, plural), {}).get((namespace, name))
+            return copy.deepcopy(obj)
+
+    def _store(self, group: str, plural: str, obj: dict, event_type: str) -> dict:
+        """Record a change; callers hold the lock"""
+        self.resource_version += 1
+        obj['metadata']['resourceVersion'] = str(self.resource_version)
+        key = (obj['metadata'].get('namespace'), obj['metadata']['name'])
+        if event_type == 'DELETED':
+            self.objects.get((group, plural), {}).pop(key, None)
+        else:
+            self.objects.setdefault((group, plural), {})[key] = obj
+        self.events.append((self.resource_version, group, plural, event_type, copy.deepcopy(obj)))
+        self.changed.notify_all()
+        if (group, plural) == ('', 'pods'):
+            self._update_budgets(key[0])
+        return copy.deepcopy(obj)
+
+    def _pod(self, namespace: str, name: str, labels: Dict[str, str]) -> dict:
+        return {'metadata': {'name': name, 'namespace': namespace, 'labels': dict(labels),
+                             'creationTimestamp': datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")},
+                'status': {'phase': 'Running', 'conditions': [{'type': 'Ready', 'status': 'True'}]}}
+
+    def _covers(self, selector: Dict[str, str], labels: Dict[str, str]) -> bool:
+        return all(labels.get(key) == value for key, value in selector.items())
+
+    def _update_budgets(self, namespace: str):
+        """Recompute disruptionsAllowed for the namespace's budgets; callers hold the lock"""
+        pods = [pod for (pod_namespace, _), pod in self.objects.get(('', 'pods'), {}).items()
+                if pod_namespace == namespace]
+        for (budget_namespace, _), budget in list(self.objects.get(('policy', 'poddisruptionbudgets'), {}).items()):
+            if budget_namespace != namespace:
+                continue
+            selector = budget['spec']['selector']['matchLabels']
+            healthy = sum(1 for pod in pods if self._covers(selector, pod['metadata']['labels']))
+            status = {'currentHealthy': healthy, 'desiredHealthy': budget['spec']['minAvailable'],
+                      'disruptionsAllowed': max(0, healthy - budget['spec']['minAvailable'])}
+            if budget['status'] != status:
+                budget = copy.deepcopy(budget)
+                budget['status'] = status
+                self._store('policy', 'poddisruptionbudgets', budget, 'MODIFIED')
+
+    # Request handling
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Optional[dict]) -> Tuple[int, object]:
+        parts = path.strip('/').split('/')
+        if parts[0] == 'api':
+            group, rest = '', parts[2:]
+        elif parts[0] == 'apis':
+            group, rest = parts[1], parts[3:]
+        else:
+            return 404, self._status(404, 'NotFound')
+
+        namespace = None
+        if len(rest) >= 3 and rest[0] == 'namespaces':
+            namespace, rest = rest[1], rest[2:]
+        plural = rest[0]
+        name = rest[1] if len(rest) > 1 else None
+
+        if method == 'GET' and name:
+            self.count(f"get {plural}")
+            obj = self.get(group, plural, namespace, name)
+            return (200, obj) if obj else (404, self._status(404, 'NotFound'))
+
+        if method == 'GET' and str(query.get('watch', '')).lower() in ('true', '1'):
+            self.count(f"watch {plural}")
+            return 200, self._watch(group, plural, namespace, query)
+
+        if method == 'GET':
+            self.count(f"list {plural}")
+            return 200, self._list(group, plural, namespace, query)
+
+        if method == 'POST' and plural == 'selfsubjectaccessreviews':
+            self.count("create selfsubjectaccessreviews")
+            attributes = body['spec']['resourceAttributes']
+            requested = tuple(attributes.get(key) or '' for key in ('group', 'resource', 'subresource', 'verb'))
+            return 201, {**body, 'status': {'allowed': requested not in self.denied}}
+
+        if method == 'POST' and plural == 'pods' and rest[2:] == ['eviction']:
+            self.count("evict pods")
+            return self._evict(namespace, name)
+
+        if method == 'PATCH' and name:
+            self.count(f"patch {plural}")
+            return self._patch(group, plural, namespace, name, body)
+
+        return 405, self._status(405, 'MethodNotAllowed')
+
+    def _status(self, code: int, reason: str) -> dict:
+        return {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'code': code, 'reason': reason}
+
+    def _matches(self, obj: dict, namespace: Optional[str], query: Dict[str, str]) -> bool:
+        metadata = obj['metadata']
+        if namespace is not None and metadata.get('namespace') != namespace:
+            return False
+        for key, value in _parse_selector(query.get('labelSelector')).items():
+            if metadata.get('labels', {}).get(key) != value:
+                return False
+        for key, value in _parse_selector(query.get('fieldSelector')).items():
+            if str(metadata.get(key.split('.', 1)[-1])) != value:
+                return False
+        return True
+
+    def _list(self, group: str, plural: str, namespace: Optional[str], query: Dict[str, str]) -> dict:
+        with self.lock:
+            items = [copy.deepcopy(obj) for _, obj in sorted(self.objects.get((group, plural), {}).items(),
+                                                             key=lambda entry: (entry[0][0] or '', entry[0][1]))
+                     if self._matches(obj, namespace, query)]
+            resource_version = str(self.resource_version)
+
+        offset = int(query.get('continue') or 0)
+        limit = int(query.get('limit') or 0) or len(items)
+        page = items[offset:offset + limit]
+        token = str(offset + limit) if offset + limit < len(items) else ''
+        return {'kind': 'List', 'apiVersion': 'v1', 'items': page,
+                'metadata': {'resourceVersion': resource_version, 'continue': token}}
+
+    def _watch(self, group: str, plural: str, namespace: Optional[str], query: Dict[str, str]) -> Iterator[dict]:
+        position = int(query.get('resourceVersion') or 0)
+        deadline = time.monotonic() + float(query.get('timeoutSeconds') or 60)
+
+        while not self.stopped.is_set():
+            # Never yield while holding the lock: the client may abandon the stream at any point
+            with self.changed:
+                pending = [(event_type, obj) for rv, event_group, event_plural, event_type, obj in self.events
+                           if rv > position and (event_group, event_plural) == (group, plural)
+                           and self._matches(obj, namespace, query)]
+                latest = self.resource_version
+                notified = True
+                if not pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    notified = self.changed.wait(min(remaining, BOOKMARK_INTERVAL))
+
+            if pending:
+                for event_type, obj in pending:
+                    yield {'type': event_type, 'object': copy.deepcopy(obj)}
+                position = latest
+            elif not notified:
+                yield {'type': 'BOOKMARK', 'object': {'metadata': {'resourceVersion': str(latest)}}}
+                position = latest
+
+    def _patch(self, group: str, plural: str, namespace: str, name: str, patch: dict) -> Tuple[int, object]:
+        with self.lock:
+            obj = copy.deepcopy(self.objects.get((group, plural), {}).get((namespace, name)))
+            if obj is None:
+                return 404, self._status(404, 'NotFound')
+            _merge(obj, patch or {})
+            if 'spec' in (patch or {}):
+                obj['metadata']['generation'] += 1
+            stored = self._store(group, plural, obj, 'MODIFIED')
+
+        if (group, plural) == (EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL) and 'metadata' in (patch or {}):
+            self._after(self.sync_delay, self._sync_external_secret, namespace, name)
+        if (group, plural) == ('apps', 'deployments') and 'spec' in (patch or {}):
+            self._after(0, self._roll_out, namespace, name, stored['metadata']['generation'])
+        return 200, stored
+
+    def _evict(self, namespace: str, name: str) -> Tuple[int, object]:
+        with self.lock:
+            pod = self.objects.get(('', 'pods'), {}).get((namespace, name))
+            if pod is None:
+                return 404, self._status(404, 'NotFound')
+            labels = pod['metadata']['labels']
+            for (budget_namespace, _), budget in self.objects.get(('policy', 'poddisruptionbudgets'), {}).items():
+                if (budget_namespace == namespace and self._covers(budget['spec']['selector']['matchLabels'], labels)
+                        and budget['status'].get('disruptionsAllowed', 0) <= 0):
+                    return 429, self._status(429, 'TooManyRequests')
+            owner = next((deployment['metadata']['name']
+                          for (deployment_namespace, _), deployment in self.objects.get(('apps', 'deployments'), {}).items()
+                          if deployment_namespace == namespace
+                          and self._covers(deployment['spec']['selector']['matchLabels'], labels)), None)
+            self._store('', 'pods', copy.deepcopy(pod), 'DELETED')
+
+        if owner is not None:
+            if self.on_replica_replaced is not None:
+                self.on_replica_replaced(namespace, owner)
+            self._after(self.rollout_step, self._replace_pod, namespace, owner, labels)
+        return 201, {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Success', 'code': 201}
+
+    # Scripted controllers
+
+    def _after(self, delay: float, func, *args):
+        def run():
+            if not self.stopped.wait(delay):
+                func(*args)
+        threading.Thread(target=run, name='fake-controller', daemon=True).start()
+
+    def _sync_external_secret(self, namespace: str, name: str):
+        """Mark the ExternalSecret refreshed and rewrite its target Secret"""
+        with self.lock:
+            external_secret = copy.deepcopy(self.objects[(EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL)][(namespace, name)])
+            external_secret['status'] = {
+                'refreshTime': datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+                'conditions': [{'type': 'Ready', 'status': 'True', 'reason': 'SecretSynced'}],
+            }
+            self._store(EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, external_secret, 'MODIFIED')
+
+            target = external_secret['spec']['target']['name']
+            secret = copy.deepcopy(self.objects.get(('', 'secrets'), {}).get((namespace, target)))
+            if secret is not None:
+                secret['data'] = {'synced': external_secret['status']['refreshTime']}
+                self._store('', 'secrets', secret, 'MODIFIED')
+
+    def _replace_pod(self, namespace: str, owner: str, labels: Dict[str, str]):
+        """Start a Ready replacement for an evicted pod"""
+        with self.lock:
+            self._store('', 'pods', self._pod(namespace, f"{owner}-{self.resource_version + 1}", labels), 'ADDED')
+
+    def _roll_out(self, namespace: str, name: str, generation: int):
+        """Replace one replica every rollout_step seconds, surging by one"""
+        def update(**status) -> bool:
+            with self.lock:
+                deployment = copy.deepcopy(self.objects[('apps', 'deployments')][(namespace, name)])
+                if deployment['metadata']['generation'] != generation:
+                    return False  # superseded by a newer rollout
+                deployment['status'].update(status)
+                self._store('apps', 'deployments', deployment, 'MODIFIED')
+                return True
+
+        replicas = self.get('apps', 'deployments', namespace, name)['spec']['replicas']
+        if not update(observedGeneration=generation, updatedReplicas=0, replicas=replicas + 1):
+            return
+        for updated in range(1, replicas + 1):
+            if self.stopped.wait(self.rollout_step):
+                return
+            surge = 1 if updated < replicas else 0
+            if not update(updatedReplicas=updated, replicas=replicas + surge, availableReplicas=replicas):
+                return
+            if self.on_replica_replaced is not None:
+                self.on_replica_replaced(namespace, name)
+
+    def stop(self):
+        self.stopped.set()
+        with self.changed:
+            self.changed.notify_all()
+        super().stop()
@@ -0,0 +1,394 @@
+"""
+Benchmark runner: rotation and health checks against the local stand-ins
+
+Usage:
+    python -m rotation_toolkit.bench [--scenario rotate|health] [--runs 3] [--warmup 1]
+                                     [--vault-latency-ms 5] [--kube-latency-ms 5] [--sql-latency-ms 2]
+                                     [--wave-size 0] [--ag-secondaries 0] [--wait-for-quiet]
+                                     [--baseline <file>] [--update-baseline] [--tolerance 0.25]
+                                     [--trace-file <file>] [--json]
+
+Each run starts fresh stand-ins, so runs are independent. Step timings are
+the median over all runs; round trips come from the stand-ins' own request
+counters. The run fails if a step is slower than its baseline by more than
+the tolerance (plus NOISE_FLOOR_MS), or if any backend sees more round trips
+than the baseline recorded.
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from .. import backends, tracing, transport
+from ..vault import ROTATION_INDEX_PREFIX
+from .kube import FakeKubernetesServer
+from .sql import FakeSQLBackend
+from .vault import FakeVaultServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Differences smaller than this are scheduling noise, not regressions
+NOISE_FLOOR_MS = 25
+
+SCENARIOS = ('rotate', 'health')
+
+NAMESPACE = 'web'
+APP_LABEL = 'workouttracker'
+SECRET_PATH = 'workouttracker/sql'
+EXTERNAL_SECRET = 'ecs-workouttracker-secrets'
+TARGET_SECRET = 'workouttracker-secrets'
+SQL_SERVER = 'sql-bench'
+DATABASE = 'WorkoutTrackerWeb'
+
+# With --wait-for-quiet: a busy spell, then quiet traffic, as (seconds, requests/s, active sessions,
+# open transactions), and the thresholds and window the rotation waits for
+TRAFFIC_PHASES = ((0.5, 400.0, 8, 3), (None, 20.0, 1, 0))
+QUIET_LIMITS = {'quiet_max_sessions': 2, 'quiet_max_requests': 100, 'quiet_max_transactions': 1}
+QUIET_WINDOW_SECONDS = 0.2
+QUIET_INTERVAL_SECONDS = 0.05
+
+# Settings after the login in each stored connection string; a rotation must keep them
+APP_POOL_SETTINGS = {
+    'ConnectionStrings__WorkoutTrackerWebContext': ';Max Pool Size=100;Connect Timeout=30;Encrypt=True',
+    'ConnectionStrings__DefaultConnection': ';Min Pool Size=2;Max Pool Size=20;MultipleActiveResultSets=True',
+}
+
+
+class BenchEnvironment:
+    """One set of started stand-ins seeded like the production namespace"""
+
+    def __init__(self, settings: Dict):
+        self.settings = settings
+        self.vault = FakeVaultServer(latency=settings['vault_latency_ms'] / 1000)
+        self.kube = FakeKubernetesServer(latency=settings['kube_latency_ms'] / 1000,
+                                         sync_delay=settings['sync_delay_ms'] / 1000,
+                                         rollout_step=settings['rollout_step_ms'] / 1000)
+        self.sql = FakeSQLBackend(latency=settings['sql_latency_ms'] / 1000)
+        self.vault.fault_every = self.kube.fault_every = settings['fault_every']
+
+    def __enter__(self) -> 'BenchEnvironment':
+        self.vault.start()
+        self.kube.start()
+        backends.substitute('pyodbc', self.sql)
+        self.seed()
+        return self
+
+    def __exit__(self, *exc_info):
+        backends.substitute('pyodbc', None)
+        self.kube.stop()
+        self.vault.stop()
+
+    def seed(self):
+        # A login rotated yesterday, with the login it replaced still indexed for rollback
+        previous_user = f"{APP_LABEL}.{(datetime.now() - timedelta(days=31)).strftime('%Y%m%d%H%M')}"
+        current_user = f"{APP_LABEL}.{(datetime.now() - timedelta(days=1)).strftime('%Y%m%d%H%M')}"
+        for username in (previous_user, current_user):
+            conn_str = (f"Server={SQL_SERVER};Database={DATABASE};TrustServerCertificate=True;"
+                        f"integrated security=False;User ID={username};Password=bench-{username}")
+            version = self.vault.put(SECRET_PATH, {
+                key: conn_str + settings for key, settings in APP_POOL_SETTINGS.items()
+            })
+        self.vault.set_custom_metadata(SECRET_PATH, {
+            f"{ROTATION_INDEX_PREFIX}{version - 1}": json.dumps({'username': previous_user, 'previous_version': None}),
+            f"{ROTATION_INDEX_PREFIX}{version}": json.dumps({'username': current_user, 'previous_version': version - 1}),
+        })
+        for i in range(1, self.settings['ag_secondaries'] + 1):
+            self.sql.add_replica(f"{SQL_SERVER}-{i}", f"TCP://{SQL_SERVER}-{i}.bench:1433")
+        self.sql.add_login(current_user, f"bench-{current_user}")
+
+        # Every pod holds a pooled session under the current login until shortly after it is replaced, and
+        # read-routed sessions on each secondary close with the first pod replaced
+        self.sql.add_sessions(current_user, self.settings['replicas'] + 1)
+        for address in self.sql.replicas:
+            self.sql.add_sessions(current_user, 1, replica=address)
+
+        def replica_replaced(namespace: str, name: str):
+            linger = self.settings['session_linger_ms'] / 1000
+            self.sql.end_sessions(current_user, after=linger)
+            for address in self.sql.replicas:
+                self.sql.end_sessions(current_user, after=linger, replica=address)
+
+        self.kube.on_replica_replaced = replica_replaced
+
+        # The web app and the Hangfire worker share the app label; each has its own pods and budget, as in k8s/
+        labels = {'app': APP_LABEL}
+        for name, component, replicas, min_available in (
+                (APP_LABEL, 'web', self.settings['replicas'], 2),
+                (f"{APP_LABEL}-hangfire-worker", 'hangfire-worker', 1, 1)):
+            pod_labels = {**labels, 'component': component}
+            self.kube.add_deployment(NAMESPACE, name, labels, replicas=replicas, pod_labels=pod_labels)
+            self.kube.add_pods(NAMESPACE, name, pod_labels, replicas)
+            self.kube.add_pdb(NAMESPACE, f"{name}-pdb", pod_labels, min(min_available, replicas))
+        self.kube.add_secret(NAMESPACE, TARGET_SECRET)
+        self.kube.add_external_secret(NAMESPACE, EXTERNAL_SECRET, TARGET_SECRET)
+        self.kube.add_cronjob('default', 'sql-credential-rotation', {'app': 'credential-rotator'}, '0 2 * * 0')
+        if self.settings['wait_for_quiet']:
+            for phase in TRAFFIC_PHASES:
+                self.sql.add_traffic(*phase)
+
+    def api_client(self):
+        configuration = backends.kubernetes_client().Configuration()
+        configuration.host = self.kube.url
+        return transport.kubernetes_api_client(configuration)
+
+    def round_trips(self) -> Dict[str, int]:
+        return {'vault': self.vault.round_trips, 'kubernetes': self.kube.round_trips, 'sql': self.sql.round_trips}
+
+    def faults(self) -> Dict[str, int]:
+        return {'vault': self.vault.faults, 'kubernetes': self.kube.faults}
+
+    def requests(self) -> Dict[str, Dict[str, int]]:
+        return {'vault': dict(self.vault.requests), 'kubernetes': dict(self.kube.requests),
+                'sql': dict(self.sql.requests)}
+
+
+def run_rotate(env: BenchEnvironment, tracer: tracing.Tracer) -> Dict:
+    from ..rotator import SQLCredentialRotator
+
+    rotator = SQLCredentialRotator(
+        vault_url=env.vault.url,
+        vault_token='bench-token',
+        secret_path=SECRET_PATH,
+        sql_server=SQL_SERVER,
+        database=DATABASE,
+        namespace=NAMESPACE,
+        app_label=APP_LABEL,
+        external_secret_name=EXTERNAL_SECRET,
+        rollout_timeout=60,
+        wave_size=env.settings['wave_size'],
+        capacity_probe=env.settings['capacity_probe'],
+        wait_for_quiet=env.settings['wait_for_quiet'],
+        quiet_window=QUIET_WINDOW_SECONDS,
+        quiet_interval=QUIET_INTERVAL_SECONDS,
+        quiet_deadline=10,
+        skip_if_busy=True,
+        **QUIET_LIMITS,
+        tracer=tracer
+    )
+    rotator.initialize_clients(api_client=env.api_client())
+    success = rotator.rotate_credentials()
+
+    # The login changes; each application's own pool and timeout settings must not
+    stored = env.vault.latest(SECRET_PATH)
+    for key, settings in APP_POOL_SETTINGS.items():
+        if not stored[key].endswith(settings):
+            logger.error(f"{key} lost its settings: {settings.lstrip(';')}")
+            success = False
+
+    # Every secondary holds the new login, with the primary's SID, and no longer the old one
+    new_logins = dict(env.sql.sids)
+    for address in env.sql.replicas:
+        if env.sql.replica_logins(address) != new_logins:
+            logger.error(f"Logins on replica {address} do not match the primary")
+            success = False
+    return {'success': success, 'timings': rotator.timings}
+
+
+def run_health(env: BenchEnvironment, tracer: tracing.Tracer) -> Dict:
+    from ..health import RotationHealthChecker
+
+    checker = RotationHealthChecker(
+        vault_url=env.vault.url,
+        vault_token='bench-token',
+        secret_path=SECRET_PATH,
+        sql_server=SQL_SERVER,
+        namespace=NAMESPACE,
+        app_label=APP_LABEL,
+        api_client=env.api_client()
+    )
+    report = checker.generate_report()
+    return {'success': report['overall_health'] == 'HEALTHY', 'timings': report['timings'],
+            'issues': report['issues'], 'warnings': report['warnings']}
+
+
+RUNNERS = {'rotate': run_rotate, 'health': run_health}
+
+
+def run_scenario(name: str, settings: Dict, runs: int, warmup: int = 1,
+                 tracer: Optional[tracing.Tracer] = None) -> Dict:
+    """Run a scenario `runs` times on fresh stand-ins and summarise the results
+
+    The first `warmup` runs are discarded: they pay for importing the client
+    libraries, which the kubernetes client does lazily, API group by API group.
+    """
+    samples = []
+    for run in range(warmup + runs):
+        with BenchEnvironment(settings) as env:
+            try:
+                result = RUNNERS[name](env, tracer if tracer and run >= warmup else tracing.Tracer())
+            except Exception as e:
+                result = {'success': False, 'timings': {}, 'error': str(e)}
+            result['round_trips'] = env.round_trips()
+            result['faults'] = env.faults()
+            result['requests'] = env.requests()
+        if run >= warmup:
+            samples.append(result)
+
+    steps = []
+    for sample in samples:
+        steps.extend(step for step in sample['timings'] if step not in steps)
+
+    return {
+        'success': all(sample['success'] for sample in samples),
+        'errors': sorted({sample['error'] for sample in samples if sample.get('error')}),
+        'timings_ms': {step: round(statistics.median(sample['timings'][step] for sample in samples
+                                                     if step in sample['timings']) * 1000, 1)
+                       for step in steps},
+        'round_trips': {backend: max(sample['round_trips'][backend] for sample in samples)
+                        for backend in samples[0]['round_trips']},
+        'faults': {backend: max(sample['faults'][backend] for sample in samples)
+                   for backend in samples[0]['faults']},
+        'requests': samples[-1]['requests'],
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """Return one message per regression against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline['scenarios'].get(name)
+        if expected is None:
+            continue
+        for step, base_ms in expected['timings_ms'].items():
+            current_ms = result['timings_ms'].get(step)
+            if current_ms is not None and current_ms > base_ms * (1 + tolerance) + NOISE_FLOOR_MS:
+                regressions.append(f"{name}: {step} took {current_ms:.1f} ms (baseline {base_ms:.1f} ms)")
+        for backend, base_count in expected['round_trips'].items():
+            current_count = result['round_trips'].get(backend, 0)
+            if current_count > base_count:
+                regressions.append(f"{name}: {current_count} {backend} round trips (baseline {base_count})")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict], baseline: Dict):
+    for name, result in results.items():
+        expected = (baseline or {}).get('scenarios', {}).get(name, {})
+        status = "OK" if result['success'] else "FAILED"
+        print(f"\n{name} ({status})")
+        for error in result['errors']:
+            print(f"  error: {error}")
+        for step, ms in result['timings_ms'].items():
+            base_ms = expected.get('timings_ms', {}).get(step)
+            base_text = f"{base_ms:8.1f} ms" if base_ms is not None else "           -"
+            print(f"  {step + ':':<28}{ms:8.1f} ms   baseline {base_text}")
+        trips = ', '.join(f"{backend} {count}" for backend, count in result['round_trips'].items())
+        print(f"  round trips: {trips}")
+        if any(result['faults'].values()):
+            faults = ', '.join(f"{backend} {count}" for backend, count in result['faults'].items())
+            print(f"  injected 503s: {faults}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark rotation and health checks against local stand-ins")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="Discarded runs before the measured ones")
+    parser.add_argument("--vault-latency-ms", type=float, default=5.0, help="Latency added to each Vault request")
+    parser.add_argument("--kube-latency-ms", type=float, default=5.0,
+                        help="Latency added to each Kubernetes API request")
+    parser.add_argument("--sql-latency-ms", type=float, default=2.0, help="Latency added to each SQL round trip")
+    parser.add_argument("--sync-delay-ms", type=float, default=200.0,
+                        help="Time the scripted External Secrets Operator takes to sync")
+    parser.add_argument("--rollout-step-ms", type=float, default=100.0,
+                        help="Time the scripted Deployment controller takes per replica")
+    parser.add_argument("--replicas", type=int, default=3, help="Replicas of the web Deployment")
+    parser.add_argument("--wave-size", type=int, default=0,
+                        help="Roll pods out in waves of this many through the Eviction API (default: 0, rolling restart)")
+    parser.add_argument("--session-linger-ms", type=float, default=300.0,
+                        help="Time a replaced pod's pooled SQL session stays open")
+    parser.add_argument("--capacity-probe", action="store_true",
+                        help="Probe the new login's capacity before switching Vault")
+    parser.add_argument("--ag-secondaries", type=int, default=0,
+                        help="Secondary replicas in the database's availability group (default: 0, standalone)")
+    parser.add_argument("--wait-for-quiet", action="store_true",
+                        help=f"Script {TRAFFIC_PHASES[0][0]:g}s of busy SQL Server traffic and have the rotation "
+                             "wait for a quiet window first")
+    parser.add_argument("--fault-every", type=int, default=0,
+                        help="Answer every Nth Vault and Kubernetes GET with 503 and Retry-After: 0 (default: 0, never)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown per step as a fraction of the baseline")
+    parser.add_argument("--trace-file", help="Append the rotate scenario's trace spans to this JSON-lines file")
+    parser.add_argument("--json", action="store_true", help="Output in JSON format")
+    parser.add_argument("--verbose", action="store_true", help="Show the toolkit's own logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL,
+                        format='%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s')
+
+    try:
+        backends.require(('hvac', 'kubernetes'))
+    except backends.MissingDependencyError as e:
+        print(e)
+        print(backends.INSTALL_HINT)
+        return 1
+
+    settings = {
+        'vault_latency_ms': args.vault_latency_ms,
+        'kube_latency_ms': args.kube_latency_ms,
+        'sql_latency_ms': args.sql_latency_ms,
+        'sync_delay_ms': args.sync_delay_ms,
+        'rollout_step_ms': args.rollout_step_ms,
+        'replicas': args.replicas,
+        'session_linger_ms': args.session_linger_ms,
+        'wave_size': args.wave_size,
+        'fault_every': args.fault_every,
+        'capacity_probe': args.capacity_probe,
+        'ag_secondaries': args.ag_secondaries,
+        'wait_for_quiet': args.wait_for_quiet,
+    }
+    tracer = tracing.tracer_from_options(args.trace_file) if args.trace_file else None
+    results = {name: run_scenario(name, settings, args.runs, args.warmup, tracer) for name in (args.scenario or SCENARIOS)}
+    if not args.json:
+        for result in results.values():
+            del result['requests']
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        scenarios = dict((baseline or {}).get('scenarios', {})) if baseline and baseline['settings'] == settings else {}
+        for name, result in results.items():
+            scenarios[name] = {'timings_ms': result['timings_ms'], 'round_trips': result['round_trips']}
+        with open(args.baseline, 'w') as f:
+            json.dump({'settings': settings, 'scenarios': scenarios}, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0 if all(result['success'] for result in results.values()) else 1
+
+    regressions = []
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+    elif baseline['settings'] != settings:
+        print("Baseline was recorded with different settings; not comparing")
+        print(f"  baseline: {json.dumps(baseline['settings'], sort_keys=True)}")
+        baseline = None
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        print(json.dumps({'settings': settings, 'results': results, 'regressions': regressions}, indent=2))
+    else:
+        print_results(results, baseline)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+
+    failed = [name for name, result in results.items() if not result['success']]
+    for name in failed:
+        print(f"FAILED: scenario {name} did not complete successfully")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Shared HTTP plumbing for the benchmark stand-ins
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+class BenchHTTPServer(ThreadingHTTPServer):
+    # Pre-flight checks open a dozen connections at once;
+    # socketserver's default backlog of 5 drops the rest until the client's SYN retry
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakeHTTPServer:
+    """A threaded local HTTP server that delays every request and counts it by route
+
+    Subclasses implement handle(method, path, query, body) and return
+    (status, payload); a payload that is a generator is streamed with chunked
+    transfer encoding, one chunk per item, as the API server does for watches.
+
+    With fault_every set, every fault_every-th GET that is not a watch is
+    answered 503 with Retry-After: 0 before it reaches handle(), like a
+    server shedding load. Faults are counted apart from round trips.
+    """
+
+    def __init__(self, latency: float = 0.0, fault_every: int = 0):
+        self.latency = latency
+        self.fault_every = fault_every
+        self.faults = 0
+        self.gets = 0
+        self.requests = Counter()
+        self.lock = threading.RLock()
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def round_trips(self) -> int:
+        with self.lock:
+            return sum(self.requests.values())
+
+    def count(self, route: str):
+        with self.lock:
+            self.requests[route] += 1
+
+    def inject_fault(self, method: str, query: Dict[str, str]) -> bool:
+        if not self.fault_every or method != 'GET' or query.get('watch') == 'true':
+            return False
+        with self.lock:
+            self.gets += 1
+            if self.gets % self.fault_every:
+                return False
+            self.faults += 1
+            return True
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Optional[dict]) -> Tuple[int, object]:
+        raise NotImplementedError
+
+    def start(self) -> 'FakeHTTPServer':
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _dispatch(self, method: str):
+                url = urlsplit(self.path)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.inject_fault(method, query):
+                    data = b'{"errors":["service unavailable"]}'
+                    self.send_response(503)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.send_header('Retry-After', '0')
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                status, payload = server.handle(method, url.path, query, body)
+
+                if payload is not None and not isinstance(payload, (dict, list)):
+                    self._stream(status, payload)
+                    return
+                data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, status: int, items):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for item in items:
+                        data = json.dumps(item).encode('utf-8') + b'\n'
+                        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def do_PUT(self):
+                self._dispatch('PUT')
+
+            def do_PATCH(self):
+                self._dispatch('PATCH')
+
+            def do_DELETE(self):
+                self._dispatch('DELETE')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = BenchHTTPServer(('127.0.0.1', 0), Handler)
+        # A short poll interval keeps stop() from adding up to half a second to every run
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05},
+                                       name=type(self).__name__, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
@@ -0,0 +1,284 @@
+"""
+pyodbc-compatible SQL Server stand-in for the benchmarks
+"""
+
+import hashlib
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from ..connection import parse_connection_string
+from ..replicas import replica_address
+from ..sql import (DROP_LOGIN_SQL, PREFLIGHT_SQL, PROVISION_LOGIN_SQL, REPLICA_DISCOVERY_SQL, REPLICA_LOGIN_SQL,
+                   REPLICA_VERIFY_SQL, SESSION_COUNT_SQL, SQL_LOAD_SQL, TRAFFIC_SQL)
+
+
+class Error(Exception):
+    """Mirrors pyodbc.Error: args[0] is the SQLSTATE"""
+
+
+class FakeCursor:
+    def __init__(self, connection: 'FakeConnection'):
+        self.connection = connection
+        self.description = None
+        self.rows = []
+
+    def execute(self, sql: str, params: Tuple = ()):
+        rows = self.connection.backend.execute(self.connection, sql, tuple(params))
+        self.rows = rows or []
+        self.description = [('column',)] if rows is not None else None
+        return self
+
+    def fetchall(self) -> List[tuple]:
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchone(self) -> Optional[tuple]:
+        return self.rows.pop(0) if self.rows else None
+
+    def nextset(self) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, backend: 'FakeSQLBackend', username: str, replica: Optional[dict] = None):
+        self.backend = backend
+        self.username = username
+        self.replica = replica
+        self.closed = False
+
+    def cursor(self) -> FakeCursor:
+        if self.closed:
+            raise Error('08003', 'Connection is closed')
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.backend.disconnect(self)
+
+
+class FakeSQLBackend:
+    """A module-like stand-in for pyodbc backed by an in-memory set of logins
+
+    Pass it to backends.substitute('pyodbc', ...) and SQLSession, the health
+    checks and anything else that goes through backends.pyodbc() will use it.
+    Logins are checked on connect, the rotation batches create and drop them,
+    and every connect and execute is delayed by latency and counted.
+    add_sessions() stands in for application connection pools, which
+    end_sessions() closes, optionally after a delay. Every login holds the
+    permissions the pre-flight batch asks about except those in denied.
+
+    add_replica() adds a secondary of the database's availability group with
+    logins and sessions of its own; a connection whose Server is the
+    replica's address logs in and runs the replica batches there.
+
+    add_traffic() scripts the application's traffic, phase by phase, as the
+    traffic sample sees it.
+    """
+
+    Error = Error
+
+    def __init__(self, latency: float = 0.0, connect_latency: Optional[float] = None,
+                 roles: int = 2, permissions: int = 5, view_server_state: bool = True):
+        self.latency = latency
+        self.connect_latency = latency if connect_latency is None else connect_latency
+        self.roles = roles
+        self.permissions = permissions
+        self.view_server_state = view_server_state
+        self.denied = set()
+        self.logins = {}
+        self.sids = {}
+        self.replicas = {}
+        self.sessions = Counter()
+        self.login_count = 0
+        self.traffic = []
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def round_trips(self) -> int:
+        with self.lock:
+            return sum(self.requests.values())
+
+    def add_login(self, username: str, password: str):
+        """Create a login on the primary and every replica, with the same SID everywhere"""
+        with self.lock:
+            self.logins[username] = password
+            self.sids[username] = self._sid(username)
+            for replica in self.replicas.values():
+                replica['logins'][username] = (password, self.sids[username])
+
+    def add_replica(self, name: str, read_only_routing_url: Optional[str] = None):
+        with self.lock:
+            self.replicas[replica_address(name, read_only_routing_url)] = {
+                'name': name, 'read_only_routing_url': read_only_routing_url, 'logins': {}, 'sessions': Counter()}
+
+    def replica_logins(self, address: str) -> dict:
+        """username -> SID of the logins on a replica"""
+        with self.lock:
+            return {username: sid for username, (_, sid) in self.replicas[address]['logins'].items()}
+
+    @staticmethod
+    def _sid(username: str) -> bytes:
+        return hashlib.sha256(username.encode('utf-8')).digest()[:16]
+
+    def add_sessions(self, username: str, count: int, replica: Optional[str] = None):
+        """Open count application sessions under a login, on the primary or on the replica at that address"""
+        with self.lock:
+            (self.sessions if replica is None else self.replicas[replica]['sessions'])[username] += count
+
+    def add_traffic(self, seconds: Optional[float], requests_per_second: float, active_sessions: int,
+                    open_transactions: int):
+        """Append a phase of application traffic lasting seconds, or to the end if None; the first starts now
+
+        After the last phase ends there is no traffic.
+        """
+        with self.lock:
+            start = self.traffic[-1][1] if self.traffic else time.monotonic()
+            end = None if seconds is None else start + seconds
+            self.traffic.append((start, end, requests_per_second, active_sessions, open_transactions))
+
+    def traffic_now(self) -> Tuple[int, int, int]:
+        """(batch requests so far, active sessions, open transactions) of the scripted traffic"""
+        now = time.monotonic()
+        batches, active, transactions = 0.0, 0, 0
+        for start, end, rate, phase_active, phase_transactions in self.traffic:
+            batches += rate * ((now if end is None else min(now, end)) - start)
+            if end is None or now < end:
+                active, transactions = phase_active, phase_transactions
+                break
+        return int(batches), active, transactions
+
+    def end_sessions(self, username: str, count: int = 1, after: float = 0.0, replica: Optional[str] = None):
+        """Close count application sessions under a login, after `after` seconds"""
+        def close():
+            with self.lock:
+                sessions = self.sessions if replica is None else self.replicas[replica]['sessions']
+                sessions[username] = max(0, sessions[username] - count)
+
+        if after:
+            timer = threading.Timer(after, close)
+            timer.daemon = True
+            timer.start()
+        else:
+            close()
+
+    def connect(self, conn_str: str, timeout: int = 0, autocommit: bool = False, **kwargs) -> FakeConnection:
+        time.sleep(self.connect_latency)
+        components = parse_connection_string(conn_str)
+        username = components.get('user_id')
+        with self.lock:
+            self.requests['connect'] += 1
+            replica = self.replicas.get(components.get('server'))
+            if replica is not None:
+                if replica['logins'].get(username, (None,))[0] != components.get('password'):
+                    raise Error('28000', f"Login failed for user '{username}'")
+                return FakeConnection(self, username, replica)
+            if username not in self.logins or self.logins[username] != components.get('password'):
+                raise Error('28000', f"Login failed for user '{username}'")
+            self.sessions[username] += 1
+            self.login_count += 1
+        return FakeConnection(self, username)
+
+    def disconnect(self, connection: FakeConnection):
+        if connection.replica is not None:
+            return
+        with self.lock:
+            self.sessions[connection.username] -= 1
+
+    def execute(self, connection: FakeConnection, sql: str, params: Tuple) -> Optional[List[tuple]]:
+        """Run one batch; returns the rows of its last result set, or None if it has none"""
+        time.sleep(self.latency)
+        with self.lock:
+            if connection.replica is not None:
+                return self._execute_on_replica(connection, sql, params)
+
+            if PROVISION_LOGIN_SQL in sql:
+                self.requests['provision_login'] += 1
+                new_user, new_password, _ = params
+                # A login provisioned before (a resumed rotation) is already complete
+                applied = 0 if new_user in self.logins else self.roles + self.permissions
+                self.logins[new_user] = new_password
+                self.sids.setdefault(new_user, self._sid(new_user))
+                return [(self.roles, self.permissions, applied, 0)]
+
+            if REPLICA_DISCOVERY_SQL in sql:
+                self.requests['discover_replicas'] += 1
+                login, discover = params
+                if login not in self.logins:
+                    return []
+                replicas = list(self.replicas.values()) if discover else []
+                return [(self.sids[login], None, replica['name'], replica['read_only_routing_url'])
+                        for replica in replicas] or [(self.sids[login], None, None, None)]
+
+            if SESSION_COUNT_SQL in sql:
+                self.requests['session_count'] += 1
+                # The DMVs never count the caller's own session
+                own = 1 if params[0] == connection.username else 0
+                return [(1 if self.view_server_state else 0, self.sessions[params[0]] - own, 0)]
+
+            if PREFLIGHT_SQL in sql:
+                self.requests['preflight'] += 1
+                permissions = (('ALTER ANY LOGIN', 1), ('ALTER ANY USER', 1), ('ALTER ANY ROLE', 1),
+                               ('VIEW SERVER STATE', 0))
+                return [(permission, 0 if permission in self.denied or (
+                    permission == 'VIEW SERVER STATE' and not self.view_server_state) else 1, required)
+                        for permission, required in permissions]
+
+            if SQL_LOAD_SQL in sql:
+                self.requests['server_load'] += 1
+                return [(1 if self.view_server_state else 0, self.login_count, sum(self.sessions.values()))]
+
+            if TRAFFIC_SQL in sql:
+                self.requests['traffic_sample'] += 1
+                return [(1 if self.view_server_state else 0, *self.traffic_now())]
+
+            if DROP_LOGIN_SQL in sql:
+                self.requests['drop_login'] += 1
+                username = params[0]
+                if self.sessions[username] > 0:
+                    raise Error('42000', f"Could not drop login '{username}' as the user is currently logged in")
+                self.logins.pop(username, None)
+                self.sids.pop(username, None)
+                return None
+
+            self.requests['query'] += 1
+            if sql.strip().upper() == 'SELECT 1':
+                return [(1,)]
+            return []
+
+    def _execute_on_replica(self, connection: FakeConnection, sql: str, params: Tuple) -> Optional[List[tuple]]:
+        logins = connection.replica['logins']
+        if REPLICA_LOGIN_SQL in sql:
+            self.requests['replica_login'] += 1
+            login, password, _, sid = params
+            if login in logins and logins[login][1] != sid:
+                raise Error('42000', 'Login exists on this replica with a different SID')
+            logins.setdefault(login, (password, sid))
+            return None
+
+        if REPLICA_VERIFY_SQL in sql:
+            self.requests['replica_login_check'] += 1
+            return [(logins[connection.username][1],)]
+
+        if SESSION_COUNT_SQL in sql:
+            self.requests['replica_session_count'] += 1
+            return [(1 if self.view_server_state else 0, connection.replica['sessions'][params[0]], 0)]
+
+        if DROP_LOGIN_SQL in sql:
+            self.requests['replica_drop_login'] += 1
+            if connection.replica['sessions'][params[0]] > 0:
+                raise Error('42000', f"Could not drop login '{params[0]}' as the user is currently logged in")
+            logins.pop(params[0], None)
+            return None
+
+        self.requests['replica_query'] += 1
+        return []
@@ -0,0 +1,118 @@
+"""
+KV v2 stand-in for the benchmarks
+"""
+
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from .server import FakeHTTPServer
+
+
+def _now() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class FakeVaultServer(FakeHTTPServer):
+    """The parts of the Vault HTTP API used by the toolkit: token lookup, capabilities and KV v2 data/metadata
+
+    Secrets live under one KV v2 mount. Writes honour check-and-set the way
+    Vault does, so CAS conflicts show up in benchmarks as they would in
+    production. The token holds DEFAULT_CAPABILITIES on every path unless
+    capabilities says otherwise; only capabilities-self reports them.
+    """
+
+    DEFAULT_CAPABILITIES = ('create', 'read', 'update', 'delete', 'list')
+
+    def __init__(self, latency: float = 0.0, mount_point: str = 'secret'):
+        super().__init__(latency)
+        self.mount_point = mount_point
+        self.secrets = {}
+        self.capabilities = {}
+
+    def put(self, path: str, data: Dict[str, str]) -> int:
+        """Seed a secret directly, bypassing latency and round-trip counting"""
+        with self.lock:
+            return self._write(path, data)
+
+    def set_custom_metadata(self, path: str, custom_metadata: Dict[str, str]):
+        """Seed a secret's custom_metadata directly"""
+        with self.lock:
+            self.secrets[path]['custom_metadata'] = dict(custom_metadata)
+
+    def latest(self, path: str) -> Dict[str, str]:
+        with self.lock:
+            entry = self.secrets[path]
+            return dict(entry['versions'][entry['current_version']]['data'])
+
+    def _write(self, path: str, data: Dict[str, str]) -> int:
+        entry = self.secrets.setdefault(path, {'current_version': 0, 'versions': {}, 'custom_metadata': None})
+        version = entry['current_version'] + 1
+        entry['versions'][version] = {'data': dict(data), 'created_time': _now()}
+        entry['current_version'] = version
+        return version
+
+    def _version_metadata(self, entry: dict, version: int) -> dict:
+        return {
+            'version': version,
+            'created_time': entry['versions'][version]['created_time'],
+            'deletion_time': '',
+            'destroyed': False,
+            'custom_metadata': entry['custom_metadata'],
+        }
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Optional[dict]) -> Tuple[int, object]:
+        if path == '/v1/auth/token/lookup-self':
+            self.count('token_lookup')
+            return 200, {'data': {'policies': ['sql-credential-rotation']}}
+
+        if path == '/v1/sys/capabilities-self' and method in ('POST', 'PUT'):
+            self.count('capabilities')
+            granted = {path: list(self.capabilities.get(path, self.DEFAULT_CAPABILITIES)) for path in body['paths']}
+            return 200, {**granted, 'data': granted}
+
+        prefix = f"/v1/{self.mount_point}/"
+        if not path.startswith(prefix):
+            return 404, {'errors': []}
+        kind, _, secret_path = path[len(prefix):].partition('/')
+
+        with self.lock:
+            entry = self.secrets.get(secret_path)
+
+            if kind == 'data' and method == 'GET':
+                self.count('kv_read')
+                version = int(query.get('version') or 0) or (entry or {}).get('current_version')
+                if not entry or version not in entry['versions']:
+                    return 404, {'errors': []}
+                return 200, {'data': {'data': dict(entry['versions'][version]['data']),
+                                      'metadata': self._version_metadata(entry, version)}}
+
+            if kind == 'data' and method in ('POST', 'PUT'):
+                self.count('kv_write')
+                cas = (body.get('options') or {}).get('cas')
+                current = entry['current_version'] if entry else 0
+                if cas is not None and cas != current:
+                    return 400, {'errors': ['check-and-set parameter did not match the current version']}
+                version = self._write(secret_path, body['data'])
+                return 200, {'data': self._version_metadata(self.secrets[secret_path], version)}
+
+            if kind == 'metadata' and method == 'GET':
+                self.count('metadata_read')
+                if not entry:
+                    return 404, {'errors': []}
+                return 200, {'data': {
+                    'current_version': entry['current_version'],
+                    'custom_metadata': entry['custom_metadata'],
+                    'versions': {str(version): {'created_time': info['created_time'], 'deletion_time': '',
+                                                'destroyed': False}
+                                 for version, info in entry['versions'].items()},
+                }}
+
+            if kind == 'metadata' and method in ('POST', 'PUT'):
+                self.count('metadata_write')
+                if not entry:
+                    return 404, {'errors': []}
+                if 'custom_metadata' in body:
+                    entry['custom_metadata'] = dict(body['custom_metadata'])
+                return 204, None
+
+        return 405, {'errors': [f"unsupported request: {method} {path}"]}
@@ -0,0 +1,138 @@
+"""
+Startup-time budget for the rotation toolkit
+
+Runs each entry in STARTUP_COMMANDS in a fresh interpreter and fails if its
+median wall-clock time exceeds the budget, or if it imports a backend client
+library (hvac, pyodbc, kubernetes, cryptography) before doing any work that
+needs one. Each entry in DRY_RUN_COMMANDS is a rotate --dry-run against the
+bench stand-ins; it has a budget of its own and may import only the backends
+it lists.
+
+The toolkit is byte-compiled first, as an installed copy would be, so that
+PYTHONDONTWRITEBYTECODE (set in many container images) does not leave every
+run compiling the sources again.
+
+Usage:
+    python -m rotation_toolkit.budget [--budget-ms 250] [--dry-run-budget-ms 3000] [--runs 5] [--json]
+"""
+
+import argparse
+import compileall
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ('backends', 'transport', 'tracing', 'audit', 'connection', 'vault', 'kube', 'sql', 'stats', 'probe',
+           'journal', 'standby', 'preflight', 'replicas', 'traffic', 'waves', 'rotator', 'targets', 'health',
+           'history', 'fleet', 'exporter', 'cli')
+
+# Interpreter arguments for each measured command line
+STARTUP_COMMANDS = {
+    'import all modules': ['-c', 'import ' + ', '.join(f'rotation_toolkit.{name}' for name in MODULES)],
+    '--help': ['-m', 'rotation_toolkit', '--help'],
+    'rotate --help': ['-m', 'rotation_toolkit', 'rotate', '--help'],
+    'standby --help': ['-m', 'rotation_toolkit', 'standby', '--help'],
+    'rollback --help': ['-m', 'rotation_toolkit', 'rollback', '--help'],
+    'health --help': ['-m', 'rotation_toolkit', 'health', '--help'],
+    'history --help': ['-m', 'rotation_toolkit', 'history', '--help'],
+}
+
+# Interpreter arguments for each dry run, and the backends it may import; pyodbc is the bench's stand-in
+DRY_RUN_COMMANDS = {
+    'rotate --dry-run --no-preflight': (['-m', 'rotation_toolkit.bench.dryrun', '--no-preflight'], ('hvac',)),
+    'rotate --dry-run': (['-m', 'rotation_toolkit.bench.dryrun'], ('hvac', 'kubernetes')),
+}
+
+BACKEND_MODULES = ('hvac', 'pyodbc', 'kubernetes', 'cryptography')
+DEFAULT_BUDGET_MS = 250
+# Importing the kubernetes client alone takes well over a second
+DEFAULT_DRY_RUN_BUDGET_MS = 3000
+
+
+def imported_modules(args: List[str]) -> Dict[str, int]:
+    """Return top-level package -> import time in microseconds, from -X importtime
+
+    A package's time is the sum of its outermost imports, so every submodule
+    counts once; a package imported only from inside another is listed with 0.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=PACKAGE_PARENT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        top_level = name.strip().split('.')[0]
+        outermost = not name[1:].startswith(' ')
+        modules[top_level] = modules.get(top_level, 0) + (int(cumulative) if outermost else 0)
+    return modules
+
+
+def measure(args: List[str], runs: int) -> Dict:
+    """Time one command line over several runs and list the backends it imports"""
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=PACKAGE_PARENT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        durations.append((time.perf_counter() - started) * 1000)
+
+    modules = imported_modules(args)
+    return {
+        'median_ms': round(statistics.median(durations), 1),
+        'max_ms': round(max(durations), 1),
+        'toolkit_import_ms': round(modules.get('rotation_toolkit', 0) / 1000, 1),
+        'backends': sorted(name for name in BACKEND_MODULES if name in modules),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the rotation toolkit's startup-time budget")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Maximum median wall-clock time per command")
+    parser.add_argument("--dry-run-budget-ms", type=float, default=DEFAULT_DRY_RUN_BUDGET_MS,
+                        help="Maximum median wall-clock time per dry run against the bench stand-ins")
+    parser.add_argument("--no-dry-runs", action="store_true", help="Only time the commands that need no backend")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command")
+    parser.add_argument("--json", action="store_true", help="Output in JSON format")
+    args = parser.parse_args()
+
+    # Write the bytecode, then warm the filesystem cache, so the first command is not penalised
+    compileall.compile_dir(os.path.join(PACKAGE_PARENT, 'rotation_toolkit'), quiet=1)
+    subprocess.run([sys.executable] + STARTUP_COMMANDS['import all modules'], cwd=PACKAGE_PARENT, check=True)
+
+    commands = {name: (command, (), args.budget_ms) for name, command in STARTUP_COMMANDS.items()}
+    if not args.no_dry_runs:
+        commands.update({name: (command, allowed, args.dry_run_budget_ms)
+                         for name, (command, allowed) in DRY_RUN_COMMANDS.items()})
+
+    results = {}
+    for name, (command, allowed, budget_ms) in commands.items():
+        result = measure(command, args.runs)
+        result['budget_ms'] = budget_ms
+        result['ok'] = result['median_ms'] <= budget_ms and set(result['backends']) <= set(allowed)
+        results[name] = result
+
+    if args.json:
+        print(json.dumps({'budget_ms': args.budget_ms, 'dry_run_budget_ms': args.dry_run_budget_ms,
+                          'results': results}, indent=2))
+    else:
+        print(f"Startup budget: {args.budget_ms:g} ms, dry runs {args.dry_run_budget_ms:g} ms "
+              f"(median of {args.runs} runs)")
+        for name, result in results.items():
+            status = "OK" if result['ok'] else "OVER BUDGET"
+            backends = ', '.join(result['backends']) or '-'
+            print(f"  {name + ':':<34}{result['median_ms']:8.1f} ms  toolkit {result['toolkit_import_ms']:6.1f} ms  "
+                  f"backends: {backends:<17} {status}")
+
+    return 0 if all(result['ok'] for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
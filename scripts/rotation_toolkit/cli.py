@@ -0,0 +1,582 @@
+"""
+Command-line interface: python -m rotation_toolkit {rotate,standby,rollback,health,history}
+
+Only argparse and the standard library are imported up front. Each command
+imports the modules it runs, and those import hvac, pyodbc or the kubernetes
+client on first use, so `--help` never loads a backend.
+"""
+
+import argparse
+import json
+import logging
+import os
+from typing import List, Optional
+
+from . import audit, backends
+
+ROTATION_LOG_FILE = '/tmp/sql-credential-rotation.log'
+ROTATION_LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s'
+HEALTH_LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(log_format: str, log_file: Optional[str] = None) -> audit.BackgroundLogWriter:
+    """Log to the console and, for commands that change credentials, to a private JSON-lines audit file
+
+    Records are queued and written by a background thread; stop the returned
+    writer before exiting.
+    """
+    return audit.start_logging(log_format, log_file)
+
+
+def add_target_arguments(parser: argparse.ArgumentParser):
+    """Options describing one rotation target"""
+    parser.add_argument("--secret-path", help="Path to secret in Vault")
+    parser.add_argument("--sql-server", help="SQL Server hostname/IP")
+    parser.add_argument("--database", default="WorkoutTrackerWeb", help="Database name")
+    parser.add_argument("--namespace", default="default", help="Kubernetes namespace")
+    parser.add_argument("--app-label", default="workouttracker", help="App label for Deployment selection")
+    parser.add_argument("--external-secret", default="workouttracker-secrets", help="ExternalSecret name to refresh")
+    parser.add_argument("--rollout-timeout", type=int, default=300,
+                        help="Seconds to wait for secret sync and Deployment rollout")
+    parser.add_argument("--drain-timeout", type=float, default=300,
+                        help="Seconds to wait for sessions under the old login to close before dropping it; "
+                             "the login is kept if they do not")
+    parser.add_argument("--standby-pool", type=int, default=0, metavar="N",
+                        help="Switch to a verified standby login when one is available, and keep N "
+                             "pre-provisioned standby logins in Vault (default: 0, no pool)")
+    parser.add_argument("--deployment", action="append", dest="deployments", metavar="NAME",
+                        help="Deployment to roll out, in order (repeatable; default: all with --app-label)")
+    parser.add_argument("--wave-size", type=int, default=0, metavar="N",
+                        help="Replace at most N pods per Deployment at a time through the Eviction API, "
+                             "within PodDisruptionBudgets (default: 0, rolling restart of every Deployment)")
+    parser.add_argument("--wave-pause", type=float, default=0, help="Seconds to wait between waves")
+    parser.add_argument("--max-login-rate", type=float,
+                        help="Hold the next wave while SQL Server accepts more logins per second than this")
+    parser.add_argument("--max-sql-sessions", type=int,
+                        help="Hold the next wave while SQL Server has more user sessions than this")
+    parser.add_argument("--replica", action="append", dest="replicas", metavar="SERVER",
+                        help="Secondary replica to create logins on as well, as host or host,port (repeatable; "
+                             "added to the replicas discovered from the database's availability group)")
+    parser.add_argument("--no-replica-discovery", action="store_true",
+                        help="Do not look up the availability group's replicas; only use --replica")
+    parser.add_argument("--no-preflight", action="store_true",
+                        help="Skip the read-only check of every Vault, Kubernetes and SQL Server permission "
+                             "the rotation needs before it changes anything")
+    parser.add_argument("--capacity-probe", action="store_true",
+                        help="Before switching Vault, open as many connections as the Deployments' pools can "
+                             "hold under the new login and compare its latencies with the current login's")
+    parser.add_argument("--probe-max-connections", type=int, default=200, metavar="N",
+                        help="Cap on the connections the capacity probe opens at once (default: 200)")
+    parser.add_argument("--probe-query", action="append", dest="probe_queries", metavar="SQL",
+                        help="Read query for the capacity probe (repeatable; default: a catalog read)")
+    parser.add_argument("--probe-budget", type=float, default=0.5,
+                        help="Allowed slowdown of the new login in the capacity probe, as a fraction "
+                             "of the current login's percentiles (default: 0.5)")
+    parser.add_argument("--wait-for-quiet", action="store_true",
+                        help="Before changing anything, sample SQL Server traffic and start once a whole "
+                             "--quiet-window is under every --quiet-max-* limit given")
+    parser.add_argument("--quiet-window", type=float, default=300,
+                        help="Seconds of traffic that must be quiet (default: 300)")
+    parser.add_argument("--quiet-interval", type=float, default=15,
+                        help="Seconds between traffic samples (default: 15)")
+    parser.add_argument("--quiet-deadline", type=float, default=14400,
+                        help="Seconds to defer the start at most (default: 14400)")
+    parser.add_argument("--quiet-max-sessions", type=float,
+                        help="Quiet only while the app login averages at most this many sessions running a request")
+    parser.add_argument("--quiet-max-requests", type=float,
+                        help="Quiet only while --database averages at most this many transactions per second")
+    parser.add_argument("--quiet-max-transactions", type=float,
+                        help="Quiet only while the app login's sessions average at most this many open transactions")
+    parser.add_argument("--skip-if-busy", action="store_true",
+                        help="Fail without rotating if no quiet window came before --quiet-deadline "
+                             "(default: start anyway)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="rotation_toolkit",
+                                     description="Rotate SQL Server credentials and check rotation health")
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    vault = argparse.ArgumentParser(add_help=False)
+    vault.add_argument("--vault-url", required=True, help="Vault server URL")
+    vault.add_argument("--vault-token", required=True, help="Vault authentication token")
+
+    trace = argparse.ArgumentParser(add_help=False)
+    trace.add_argument("--trace-file", help="Append a JSON line per trace span to this file")
+    trace.add_argument("--otlp-endpoint",
+                       help="OTLP/HTTP collector to export trace spans to, e.g. http://tempo:4318 "
+                            "(default: $OTEL_EXPORTER_OTLP_ENDPOINT)")
+
+    rotate = subparsers.add_parser("rotate", parents=[vault, trace], help="Rotate SQL Server credentials",
+                                   description="Rotate SQL Server credentials")
+    add_target_arguments(rotate)
+    rotate.add_argument("--dry-run", action="store_true", help="Perform dry run without changes")
+    rotate.add_argument("--no-resume", action="store_true",
+                        help="Start a new rotation even if an interrupted one is journaled in Vault")
+    rotate.add_argument("--rollback", help="Deprecated: use the rollback command")
+    rotate.add_argument("--targets", help="JSON manifest of targets to rotate concurrently")
+    rotate.add_argument("--max-workers", type=int, default=4, help="Concurrent rotations in --targets mode")
+    rotate.add_argument("--max-per-server", type=int, default=1,
+                        help="Concurrent rotations per SQL Server in --targets mode")
+    rotate.add_argument("--results-file", help="Write per-target results as JSON (--targets mode)")
+    rotate.set_defaults(handler=run_rotate, parser=rotate,
+                        log_format=ROTATION_LOG_FORMAT, log_file=ROTATION_LOG_FILE)
+
+    standby = subparsers.add_parser("standby", parents=[vault, trace], help="Top up the standby login pool",
+                                    description="Provision and verify standby logins until the pool holds "
+                                                "--standby-pool logins")
+    add_target_arguments(standby)
+    standby.set_defaults(handler=run_standby, parser=standby,
+                         log_format=ROTATION_LOG_FORMAT, log_file=ROTATION_LOG_FILE)
+
+    rollback = subparsers.add_parser("rollback", parents=[vault, trace], help="Roll back to earlier credentials",
+                                     description="Roll back to earlier credentials")
+    add_target_arguments(rollback)
+    rollback.add_argument("target", nargs="?", default="latest",
+                          help="'latest' (default), a rotated username, a KV version number, "
+                               "or a legacy backup timestamp (YYYYMMDD_HHMMSS)")
+    rollback.set_defaults(handler=run_rollback, parser=rollback,
+                          log_format=ROTATION_LOG_FORMAT, log_file=ROTATION_LOG_FILE)
+
+    health = subparsers.add_parser("health", parents=[vault], help="Check credential rotation system health",
+                                   description="Check credential rotation system health")
+    health.add_argument("--secret-path", help="Path to secret in Vault")
+    health.add_argument("--sql-server", help="SQL Server hostname/IP")
+    health.add_argument("--json", action="store_true", help="Output in JSON format")
+    health.add_argument("--exit-code", action="store_true", help="Exit with non-zero code on issues")
+    health.add_argument("--check-timeout", type=float, default=15.0, help="Timeout in seconds for each check")
+    health.add_argument("--check", action="append", metavar="NAME",
+                        help="Run only this check, e.g. sql_connectivity (repeatable); "
+                             "backends that only other checks need are not loaded")
+    health.add_argument("--namespace", default="default", help="Kubernetes namespace of the application")
+    health.add_argument("--app-label", default="workouttracker", help="App label for pod selection")
+    health.add_argument("--cronjob-selector", default="app=credential-rotator",
+                        help="Label selector for the rotation CronJob")
+    health.add_argument("--serve", action="store_true",
+                        help="Run as a daemon serving Prometheus metrics instead of checking once")
+    health.add_argument("--listen", default="127.0.0.1:9469", help="host:port for --serve")
+    health.add_argument("--interval", type=float, default=60.0,
+                        help="Seconds between check runs in --serve mode")
+    health.add_argument("--history-db", metavar="PATH",
+                        help="SQLite file each report is appended to "
+                             "(default: ~/.cache/rotation_toolkit/health-history.db)")
+    health.add_argument("--no-history", action="store_true", help="Do not record reports in the history file")
+    health.add_argument("--targets", help="JSON manifest of targets to check concurrently (fleet mode)")
+    health.add_argument("--max-workers", type=int, default=8, help="Targets checked at once in --targets mode")
+    health.add_argument("--max-per-endpoint", type=int, default=2,
+                        help="Targets checked at once against the same Vault server, cluster or SQL Server "
+                             "in --targets mode")
+    health.add_argument("--results-file", help="Write the merged fleet report as JSON (--targets mode)")
+    health.set_defaults(handler=run_health, parser=health,
+                        log_format=HEALTH_LOG_FORMAT, log_file=None)
+
+    history = subparsers.add_parser("history", help="Query recorded health reports",
+                                    description="Summarise recorded health check series over a time range: "
+                                                "count, min, max, mean, percentiles and latest value")
+    history.add_argument("--history-db", metavar="PATH",
+                         help="SQLite file written by the health command "
+                              "(default: ~/.cache/rotation_toolkit/health-history.db)")
+    history.add_argument("--target", metavar="SECRET_PATH", help="Only reports for this secret path")
+    history.add_argument("--check", help="Only this check, e.g. vault_snapshot or credential_info")
+    history.add_argument("--metric", help="Only this metric: seconds, up, age_days, versions, issues or warnings")
+    history.add_argument("--since", default="30d",
+                         help="Start of the range: ISO date/time or a duration ago such as 30d or 12h (default: 30d)")
+    history.add_argument("--until", help="End of the range (default: now)")
+    history.add_argument("--percentile", action="append", type=float, metavar="P",
+                         help="Percentile to report (repeatable; default: 50, 95 and 99)")
+    history.add_argument("--first-above", type=float, metavar="VALUE",
+                         help="Report when each selected series first exceeded VALUE in the range, "
+                              "e.g. --check credential_info --metric age_days --first-above 30")
+    history.add_argument("--runs", action="store_true",
+                         help="List the most recent runs with their issues and warnings instead")
+    history.add_argument("--limit", type=int, default=20, help="Runs to list with --runs")
+    history.add_argument("--json", action="store_true", help="Output in JSON format")
+    history.set_defaults(handler=run_history, parser=history,
+                         log_format=HEALTH_LOG_FORMAT, log_file=None)
+
+    return parser
+
+
+def build_tracer(args):
+    from .tracing import tracer_from_options
+
+    return tracer_from_options(args.trace_file, args.otlp_endpoint)
+
+
+def build_rotator(args):
+    from .rotator import SQLCredentialRotator
+
+    return SQLCredentialRotator(
+        vault_url=args.vault_url,
+        vault_token=args.vault_token,
+        secret_path=args.secret_path,
+        sql_server=args.sql_server,
+        database=args.database,
+        namespace=args.namespace,
+        app_label=args.app_label,
+        external_secret_name=args.external_secret,
+        rollout_timeout=args.rollout_timeout,
+        drain_timeout=args.drain_timeout,
+        standby_pool_size=args.standby_pool,
+        deployments=args.deployments,
+        wave_size=args.wave_size,
+        wave_pause=args.wave_pause,
+        max_login_rate=args.max_login_rate,
+        max_sql_sessions=args.max_sql_sessions,
+        capacity_probe=args.capacity_probe,
+        probe_max_connections=args.probe_max_connections,
+        probe_queries=args.probe_queries,
+        probe_budget=args.probe_budget,
+        preflight=not args.no_preflight,
+        replicas=args.replicas,
+        replica_discovery=not args.no_replica_discovery,
+        wait_for_quiet=args.wait_for_quiet,
+        quiet_window=args.quiet_window,
+        quiet_interval=args.quiet_interval,
+        quiet_deadline=args.quiet_deadline,
+        quiet_max_sessions=args.quiet_max_sessions,
+        quiet_max_requests=args.quiet_max_requests,
+        quiet_max_transactions=args.quiet_max_transactions,
+        skip_if_busy=args.skip_if_busy,
+        tracer=build_tracer(args),
+        resume=not getattr(args, 'no_resume', False)
+    )
+
+
+def run_targets(args, parser) -> int:
+    from .targets import load_targets, rotate_targets
+
+    if args.max_workers < 1 or args.max_per_server < 1:
+        parser.error("--max-workers and --max-per-server must be at least 1")
+
+    try:
+        targets = load_targets(args.targets, {
+            'secret_path': args.secret_path,
+            'sql_server': args.sql_server,
+            'database': args.database,
+            'namespace': args.namespace,
+            'app_label': args.app_label,
+            'external_secret': args.external_secret,
+            'rollout_timeout': args.rollout_timeout,
+            'drain_timeout': args.drain_timeout,
+            'standby_pool': args.standby_pool,
+            'deployments': args.deployments,
+            'wave_size': args.wave_size,
+            'wave_pause': args.wave_pause,
+            'max_login_rate': args.max_login_rate,
+            'max_sql_sessions': args.max_sql_sessions,
+            'capacity_probe': args.capacity_probe,
+            'probe_max_connections': args.probe_max_connections,
+            'probe_queries': args.probe_queries,
+            'probe_budget': args.probe_budget,
+            'preflight': not args.no_preflight,
+            'replicas': args.replicas,
+            'replica_discovery': not args.no_replica_discovery,
+            'wait_for_quiet': args.wait_for_quiet,
+            'quiet_window': args.quiet_window,
+            'quiet_interval': args.quiet_interval,
+            'quiet_deadline': args.quiet_deadline,
+            'quiet_max_sessions': args.quiet_max_sessions,
+            'quiet_max_requests': args.quiet_max_requests,
+            'quiet_max_transactions': args.quiet_max_transactions,
+            'skip_if_busy': args.skip_if_busy,
+        })
+        results = rotate_targets(args.vault_url, args.vault_token, targets, dry_run=args.dry_run,
+                                 max_workers=args.max_workers, max_per_server=args.max_per_server,
+                                 tracer=build_tracer(args), resume=not args.no_resume)
+    except Exception as e:
+        logger.error(f"Fatal error: {e}")
+        return 1
+
+    if args.results_file:
+        with open(args.results_file, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    failed = [result['name'] for result in results if not result['success']]
+    if failed:
+        logger.error(f"{len(failed)} of {len(results)} target(s) failed: {', '.join(failed)}")
+        return 1
+    logger.info(f"All {len(results)} target(s) rotated successfully")
+    return 0
+
+
+def run_rotate(args, parser) -> int:
+    if args.rollback:
+        if args.targets:
+            parser.error("--rollback cannot be combined with --targets")
+        logger.warning("rotate --rollback is deprecated; use the rollback command")
+        args.target = args.rollback
+        return run_rollback(args, parser)
+
+    # A dry run without pre-flight checks or traffic sampling stops after reading Vault
+    read_only = args.dry_run and args.no_preflight and not args.wait_for_quiet
+    backends.require(('hvac',) if read_only else ('hvac', 'pyodbc', 'kubernetes'))
+
+    if args.wave_size < 0:
+        parser.error("--wave-size must not be negative")
+    if args.probe_max_connections < 1:
+        parser.error("--probe-max-connections must be at least 1")
+    if args.quiet_interval <= 0 or args.quiet_window < args.quiet_interval:
+        parser.error("--quiet-interval must be positive and no longer than --quiet-window")
+
+    if args.targets:
+        return run_targets(args, parser)
+
+    if not args.secret_path or not args.sql_server:
+        parser.error("--secret-path and --sql-server are required unless --targets is given")
+    if args.wait_for_quiet and all(limit is None for limit in (args.quiet_max_sessions, args.quiet_max_requests,
+                                                                args.quiet_max_transactions)):
+        parser.error("--wait-for-quiet needs at least one of --quiet-max-sessions, --quiet-max-requests "
+                     "and --quiet-max-transactions")
+
+    rotator = build_rotator(args)
+
+    try:
+        rotator.initialize_clients()
+
+        if rotator.rotate_credentials(dry_run=args.dry_run):
+            logger.info("Operation completed successfully")
+            return 0
+        logger.error("Operation failed")
+        return 1
+
+    except Exception as e:
+        logger.error(f"Fatal error: {e}")
+        return 1
+
+
+def run_standby(args, parser) -> int:
+    # Standbys are cloned on SQL Server and recorded in Vault; Kubernetes is not touched
+    backends.require(('hvac', 'pyodbc'))
+
+    if not args.secret_path or not args.sql_server:
+        parser.error("--secret-path and --sql-server are required")
+    if args.standby_pool < 1:
+        parser.error("--standby-pool must be at least 1")
+
+    rotator = build_rotator(args)
+
+    try:
+        rotator.initialize_clients()
+        credentials = rotator.get_current_credentials()
+        try:
+            rotator.replenish_standby_pool(credentials)
+        finally:
+            rotator.close_sql_sessions()
+
+        if len(rotator.standby_pool.verified) >= args.standby_pool:
+            logger.info("Operation completed successfully")
+            return 0
+        logger.error("Operation failed")
+        return 1
+
+    except Exception as e:
+        logger.error(f"Fatal error: {e}")
+        return 1
+
+
+def run_rollback(args, parser) -> int:
+    # Rollback only rewrites the Vault secret
+    backends.require(('hvac',))
+
+    if not args.secret_path:
+        parser.error("--secret-path is required")
+
+    rotator = build_rotator(args)
+
+    try:
+        rotator.initialize_clients()
+
+        if rotator.rollback_credentials(args.target):
+            logger.info("Operation completed successfully")
+            return 0
+        logger.error("Operation failed")
+        return 1
+
+    except Exception as e:
+        logger.error(f"Fatal error: {e}")
+        return 1
+
+
+def run_health(args, parser) -> int:
+    from .health import RotationHealthChecker
+
+    if args.serve and args.check:
+        parser.error("--check cannot be combined with --serve")
+    if args.serve and args.targets:
+        parser.error("--targets cannot be combined with --serve")
+    if not args.targets and (not args.secret_path or not args.sql_server):
+        parser.error("--secret-path and --sql-server are required unless --targets is given")
+    try:
+        required = RotationHealthChecker.required_backends(args.check)
+    except ValueError as e:
+        parser.error(str(e))
+    backends.require(sorted(required))
+
+    history = None
+    if not args.no_history:
+        from .history import DEFAULT_HISTORY_DB, HealthHistory
+
+        history = HealthHistory(args.history_db or DEFAULT_HISTORY_DB)
+
+    if args.targets:
+        return run_fleet_health(args, parser, history)
+
+    checker = RotationHealthChecker(
+        vault_url=args.vault_url,
+        vault_token=args.vault_token,
+        secret_path=args.secret_path,
+        sql_server=args.sql_server,
+        check_timeout=args.check_timeout,
+        namespace=args.namespace,
+        app_label=args.app_label,
+        cronjob_selector=args.cronjob_selector,
+        history=history
+    )
+
+    if args.serve:
+        from .exporter import HealthExporter
+
+        host, _, port = args.listen.rpartition(':')
+        HealthExporter(checker, interval=args.interval).serve(host or '127.0.0.1', int(port))
+        return 0
+
+    report = checker.generate_report(args.check)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        checker.print_summary(report)
+
+    return health_exit_code(args, report['overall_health'])
+
+
+def health_exit_code(args, overall_health: str) -> int:
+    if args.exit_code:
+        if overall_health == 'CRITICAL':
+            return 2
+        elif overall_health == 'WARNING':
+            return 1
+    return 0
+
+
+def run_fleet_health(args, parser, history) -> int:
+    from .fleet import FLEET_TARGET_FIELDS, check_fleet
+    from .targets import load_targets
+
+    if args.max_workers < 1 or args.max_per_endpoint < 1:
+        parser.error("--max-workers and --max-per-endpoint must be at least 1")
+
+    def stream(result: dict):
+        # One line per target as it finishes; the merged report follows at the end
+        if args.json:
+            print(json.dumps(result), flush=True)
+            return
+        report = result['report'] or {'issues': [result['error']], 'warnings': []}
+        print(f"{result['name']}: {result['overall_health']} - {len(report['issues'])} issue(s), "
+              f"{len(report['warnings'])} warning(s) in {result['duration_seconds']}s", flush=True)
+        for message in report['issues'] + report['warnings']:
+            print(f"    {message}", flush=True)
+
+    try:
+        targets = load_targets(args.targets, {
+            'secret_path': args.secret_path,
+            'sql_server': args.sql_server,
+            'vault_url': args.vault_url,
+            'kube_context': None,
+            'namespace': args.namespace,
+            'app_label': args.app_label,
+            'cronjob_selector': args.cronjob_selector,
+            'check_timeout': args.check_timeout,
+        }, fields=FLEET_TARGET_FIELDS, name_fields=('secret_path',))
+        fleet = check_fleet(args.vault_token, targets, args.check, max_workers=args.max_workers,
+                            max_per_endpoint=args.max_per_endpoint, history=history, on_result=stream)
+    except Exception as e:
+        logger.error(f"Fatal error: {e}")
+        return 1
+
+    if args.results_file:
+        with open(args.results_file, 'w') as f:
+            json.dump(fleet, f, indent=2)
+    if args.json:
+        print(json.dumps({key: value for key, value in fleet.items() if key != 'targets'}))
+    else:
+        counts = ', '.join(f"{count} {state}" for state, count in fleet['targets_by_health'].items())
+        print(f"\nFleet Health: {fleet['overall_health']} ({counts}) in {fleet['duration_seconds']}s")
+
+    return health_exit_code(args, fleet['overall_health'])
+
+
+def run_history(args, parser) -> int:
+    from .history import DEFAULT_HISTORY_DB, DEFAULT_PERCENTILES, HealthHistory, format_time, parse_time
+
+    try:
+        since, until = parse_time(args.since), parse_time(args.until)
+    except ValueError as e:
+        parser.error(str(e))
+
+    path = args.history_db or DEFAULT_HISTORY_DB
+    if not os.path.exists(path):
+        logger.error(f"No health history at {path}; run the health command first")
+        return 1
+    history = HealthHistory(path)
+
+    if args.runs:
+        runs = history.runs(args.target, since, until, args.limit)
+        if args.json:
+            print(json.dumps(runs, indent=2))
+            return 0
+        for run in runs:
+            print(f"{run['time']}  {run['overall_health']:<9} {run['target']}")
+            for message in run['issues'] + run['warnings']:
+                print(f"    {message}")
+        return 0
+
+    results = []
+    for target, check, metric in history.list_series(args.target, args.check, args.metric):
+        if args.first_above is not None:
+            crossing = history.first_crossing(target, check, metric, args.first_above, since, until)
+            results.append({'target': target, 'check': check, 'metric': metric, 'threshold': args.first_above,
+                            'first_above': format_time(crossing[0]) if crossing else None,
+                            'value': crossing[1] if crossing else None})
+        else:
+            summary = history.summarize(target, check, metric, since, until,
+                                        args.percentile or DEFAULT_PERCENTILES)
+            if summary['count']:
+                results.append(summary)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    elif not results:
+        print("No matching samples in the range")
+    else:
+        for result in results:
+            name = f"{result['target']} {result['check']}.{result['metric']}"
+            if args.first_above is not None:
+                when = (f"first above {result['threshold']:g} at {result['first_above']} ({result['value']:g})"
+                        if result['first_above'] else f"never above {result['threshold']:g}")
+                print(f"{name}: {when}")
+            else:
+                percentiles = '  '.join(f"{key} {value:g}" for key, value in result['percentiles'].items())
+                print(f"{name}: n={result['count']}  min {result['min']:g}  {percentiles}  max {result['max']:g}  "
+                      f"latest {result['latest']:g} ({result['last']})")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    log_writer = configure_logging(args.log_format, args.log_file)
+
+    try:
+        return args.handler(args, args.parser)
+    except backends.MissingDependencyError as e:
+        print(e)
+        print(backends.INSTALL_HINT)
+        return 1
+    finally:
+        log_writer.stop()
@@ -0,0 +1,218 @@
+"""
+SQL Server connection string handling shared by rotation and health checks
+"""
+
+import re
+from typing import Dict, Iterator, Optional, Tuple
+
+# Application settings in the Vault secret that hold a connection string
+APP_CONNECTION_STRING_KEYS = ('ConnectionStrings__WorkoutTrackerWebContext', 'ConnectionStrings__DefaultConnection')
+
+# Keywords SqlClient and the ODBC driver accept, by component name
+KEYWORD_COMPONENTS = {
+    'server': 'server',
+    'data source': 'server',
+    'address': 'server',
+    'addr': 'server',
+    'network address': 'server',
+    'database': 'database',
+    'initial catalog': 'database',
+    'user id': 'user_id',
+    'uid': 'user_id',
+    'user': 'user_id',
+    'password': 'password',
+    'pwd': 'password',
+    'trustservercertificate': 'trust_cert',
+    'trust server certificate': 'trust_cert',
+    'integrated security': 'integrated_security',
+    'trusted_connection': 'integrated_security',
+}
+
+# Keyword written when a component has to be added
+COMPONENT_KEYWORDS = {
+    'server': 'Server',
+    'database': 'Database',
+    'user_id': 'User ID',
+    'password': 'Password',
+    'trust_cert': 'TrustServerCertificate',
+    'integrated_security': 'integrated security',
+}
+
+# One scan of the whole string: each match is a key=value pair and the
+# separator after it. Values may be quoted with "", '' or {} (ODBC), with the
+# closing quote doubled inside.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<key>[^=;]+)=[ \t]*
+    (?P<value>"(?:[^"]|"")*"(?=[ \t]*(?:;|\Z))
+             |'(?:[^']|'')*'(?=[ \t]*(?:;|\Z))
+             |\{(?:[^}]|\}\})*\}(?=[ \t]*(?:;|\Z))
+             |[^;]*)
+    [^;]*;?
+""", re.VERBOSE)
+
+# Values that must be quoted to survive a round trip
+NEEDS_QUOTING = re.compile(r'[;\'"{]|^\s|\s$')
+
+
+def unquote(value: str) -> str:
+    """Return a raw connection-string value without its quotes"""
+    if len(value) >= 2:
+        first, last = value[0], value[-1]
+        if first == last and first in '"\'':
+            return value[1:-1].replace(first * 2, first)
+        if first == '{' and last == '}':
+            return value[1:-1].replace('}}', '}')
+    return value
+
+
+def quote(value: str) -> str:
+    """Quote a value only if it contains a separator, a quote or edge whitespace"""
+    if NEEDS_QUOTING.search(value):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+class ConnectionString:
+    """A connection string that keeps every key, in order, exactly as written
+
+    The text itself is the model: parsing records where each keyword's value
+    sits in it, so str() returns the original string byte for byte (pool
+    sizes, timeouts, Encrypt and any other setting included). Assigning a
+    component, e.g. cs['password'] = ..., rewrites its value in place, under
+    every synonym and every repeat of the keyword (Password= and PWD=), so no
+    stale value is left for a driver to pick; a component the string does not
+    have is appended. Components are read and written by name ('server',
+    'database', 'user_id', 'password', 'trust_cert', 'integrated_security')
+    or by any keyword as written.
+    """
+
+    __slots__ = ('text', 'spans', 'occurrences')
+
+    def __init__(self, text: str):
+        self.text = text
+        self._scan()
+
+    def _scan(self):
+        # Lower-cased keyword -> (keyword as written, start, end of its value); the last occurrence wins
+        self.spans = {}
+        # (lower-cased keyword, start, end of its value) of every occurrence, repeats included
+        self.occurrences = []
+        for match in TOKEN_PATTERN.finditer(self.text):
+            key = match.group('key').strip()
+            if key:
+                start = match.start('value')
+                end = start + len(match.group('value').rstrip())
+                self.spans[key.lower()] = (key, start, end)
+                self.occurrences.append((key.lower(), start, end))
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return f"ConnectionString({list(self.keys())})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ConnectionString) and self.text == other.text
+
+    def _keyword(self, name: str) -> Optional[str]:
+        """Return the lower-cased keyword in the string for a component or keyword name"""
+        name = name.lower()
+        if name in self.spans:
+            return name
+        for keyword in self.spans:
+            if KEYWORD_COMPONENTS.get(keyword) == name:
+                return keyword
+        return None
+
+    def _keywords(self, name: str) -> set:
+        """Return every lower-cased keyword in the string that holds the same component as name"""
+        name = name.lower()
+        component = KEYWORD_COMPONENTS.get(name, name)
+        return {keyword for keyword in self.spans
+                if keyword == name or KEYWORD_COMPONENTS.get(keyword) == component}
+
+    def __contains__(self, name: str) -> bool:
+        return self._keyword(name) is not None
+
+    def __getitem__(self, name: str) -> str:
+        keyword = self._keyword(name)
+        if keyword is None:
+            raise KeyError(name)
+        _, start, end = self.spans[keyword]
+        return unquote(self.text[start:end])
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __setitem__(self, name: str, value: str):
+        self.update({name: value})
+
+    def update(self, values: Dict[str, str]):
+        """Rewrite several values with one splice and one rescan"""
+        text = self.text
+        appended = []
+        edits = []
+        for name, value in values.items():
+            keywords = self._keywords(name)
+            if not keywords:
+                appended.append(f"{COMPONENT_KEYWORDS.get(name, name)}={quote(value)}")
+            else:
+                edits.extend((start, end, quote(value)) for keyword, start, end in self.occurrences
+                             if keyword in keywords)
+        # Splice from the end so earlier offsets stay valid
+        for start, end, value in sorted(edits, reverse=True):
+            text = text[:start] + value + text[end:]
+        if appended:
+            separator = '' if not text or text.rstrip().endswith(';') else ';'
+            text += separator + ';'.join(appended)
+        self.text = text
+        self._scan()
+
+    def keys(self) -> Iterator[str]:
+        """Keywords as written, in order"""
+        return (key for key, _, _ in self.spans.values())
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """(keyword as written, value) pairs, in order"""
+        return ((key, unquote(self.text[start:end])) for key, start, end in self.spans.values())
+
+    def components(self) -> Dict[str, str]:
+        """The recognised components by name"""
+        return {KEYWORD_COMPONENTS[key.lower()]: value for key, value in self.items()
+                if key.lower() in KEYWORD_COMPONENTS}
+
+    def copy(self) -> 'ConnectionString':
+        duplicate = ConnectionString.__new__(ConnectionString)
+        duplicate.text, duplicate.spans, duplicate.occurrences = self.text, dict(self.spans), list(self.occurrences)
+        return duplicate
+
+    def with_credentials(self, user_id: str, password: str) -> 'ConnectionString':
+        """Return a copy that logs in as another principal, every other setting unchanged"""
+        updated = self.copy()
+        updated.update({'user_id': user_id, 'password': password})
+        return updated
+
+
+def parse_connection_string(conn_str: str) -> ConnectionString:
+    """Parse SQL Server connection string into components"""
+    return ConnectionString(conn_str)
+
+
+def build_connection_string(components) -> str:
+    """Build connection string from components
+
+    A ConnectionString is returned as written, so it keeps every setting; a
+    plain dict gets the standard layout.
+    """
+    if isinstance(components, ConnectionString):
+        return str(components)
+
+    conn_str = f"Server={components['server']};Database={components['database']}"
+    conn_str += f";TrustServerCertificate={components.get('trust_cert', 'True')}"
+    conn_str += f";integrated security={components.get('integrated_security', 'False')}"
+    conn_str += f";User ID={components['user_id']};Password={components['password']}"
+
+    return conn_str
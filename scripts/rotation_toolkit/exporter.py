@@ -0,0 +1,195 @@
+"""
+Prometheus exporter for the rotation health checks
+"""
+
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from .health import RotationHealthChecker
+
+logger = logging.getLogger(__name__)
+
+HEALTH_STATES = ('HEALTHY', 'WARNING', 'CRITICAL')
+CHECK_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+
+
+class HealthExporter:
+    """Re-runs the health checks on an interval and serves the cached results as Prometheus metrics
+
+    Scrapes only read the cached report, so they never reach Vault, SQL Server
+    or the Kubernetes API; remote load is set by the check interval alone.
+    """
+
+    def __init__(self, checker: RotationHealthChecker, interval: float = 60.0):
+        self.checker = checker
+        self.interval = interval
+        self.report = None
+        self.runs = 0
+        self.last_run_time = None
+        self.last_success_time = None
+        self.check_last_success = {}
+        self.durations = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def run_once(self):
+        """Run all checks once and fold the report into the cached metrics"""
+        try:
+            report = self.checker.generate_report()
+        except Exception as e:
+            logger.error(f"Health check run failed: {e}")
+            return
+
+        now = time.time()
+        with self.lock:
+            self.report = report
+            self.runs += 1
+            self.last_run_time = now
+            if report['overall_health'] != 'CRITICAL':
+                self.last_success_time = now
+
+            for key, _, _, _ in RotationHealthChecker.CHECKS:
+                if report[key] not in (False, None):
+                    self.check_last_success[key] = now
+
+            for name, seconds in report['timings'].items():
+                if name == 'total':
+                    continue
+                histogram = self.durations.setdefault(
+                    name, {'buckets': [0] * len(CHECK_DURATION_BUCKETS), 'sum': 0.0, 'count': 0}
+                )
+                for i, bound in enumerate(CHECK_DURATION_BUCKETS):
+                    if seconds <= bound:
+                        histogram['buckets'][i] += 1
+                histogram['sum'] += seconds
+                histogram['count'] += 1
+
+    def run_forever(self):
+        """Background loop: run the checks, then sleep until the next interval"""
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            self.run_once()
+            self.stopped.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> threading.Thread:
+        """Start the background check loop"""
+        thread = threading.Thread(target=self.run_forever, name='health-exporter', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+    def render_metrics(self) -> str:
+        """Render the cached results in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self.lock:
+            report = self.report
+
+            metric('sql_rotation_health_runs_total', 'counter',
+                   'Completed health check runs since the exporter started', [({}, self.runs)])
+
+            if report is None:
+                return '\n'.join(lines) + '\n'
+
+            metric('sql_rotation_health_status', 'gauge',
+                   'Overall rotation health; 1 for the current state',
+                   [({'state': state}, int(report['overall_health'] == state)) for state in HEALTH_STATES])
+            metric('sql_rotation_healthy', 'gauge',
+                   '1 if the last run reported no issues or warnings',
+                   [({}, int(report['overall_health'] == 'HEALTHY'))])
+            metric('sql_rotation_check_up', 'gauge',
+                   '1 if the check passed on the last run',
+                   [({'check': key}, int(report[key] not in (False, None)))
+                    for key, _, _, _ in RotationHealthChecker.CHECKS])
+            metric('sql_rotation_issues', 'gauge', 'Critical issues on the last run',
+                   [({}, len(report['issues']))])
+            metric('sql_rotation_warnings', 'gauge', 'Warnings on the last run',
+                   [({}, len(report['warnings']))])
+
+            if report['credential_info']:
+                metric('sql_rotation_credential_age_days', 'gauge',
+                       'Age of the current SQL credentials in days',
+                       [({}, report['credential_info']['age_days'])])
+            metric('sql_rotation_backup_versions', 'gauge',
+                   'Earlier secret versions available for rollback',
+                   [({}, len(report['backups'] or []))])
+
+            metric('sql_rotation_last_run_timestamp_seconds', 'gauge',
+                   'Unix time of the last completed health check run',
+                   [({}, f"{self.last_run_time:.3f}")])
+            if self.last_success_time is not None:
+                metric('sql_rotation_last_success_timestamp_seconds', 'gauge',
+                       'Unix time of the last run without critical issues',
+                       [({}, f"{self.last_success_time:.3f}")])
+            metric('sql_rotation_check_last_success_timestamp_seconds', 'gauge',
+                   'Unix time each check last passed',
+                   [({'check': key}, f"{value:.3f}") for key, value in sorted(self.check_last_success.items())])
+
+            lines.append('# HELP sql_rotation_check_duration_seconds Wall-clock time of each check')
+            lines.append('# TYPE sql_rotation_check_duration_seconds histogram')
+            for name, histogram in sorted(self.durations.items()):
+                for bound, count in zip(CHECK_DURATION_BUCKETS, histogram['buckets']):
+                    lines.append(f'sql_rotation_check_duration_seconds_bucket{{check="{name}",le="{bound}"}} {count}')
+                lines.append(f'sql_rotation_check_duration_seconds_bucket{{check="{name}",le="+Inf"}} '
+                             f'{histogram["count"]}')
+                lines.append(f'sql_rotation_check_duration_seconds_sum{{check="{name}"}} {histogram["sum"]:.3f}')
+                lines.append(f'sql_rotation_check_duration_seconds_count{{check="{name}"}} {histogram["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host: str, port: int):
+        """Serve /metrics, /report and /healthz until interrupted"""
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    self._send(200, 'text/plain; version=0.0.4; charset=utf-8', exporter.render_metrics())
+                elif path == '/report':
+                    with exporter.lock:
+                        report = exporter.report
+                    if report is None:
+                        self._send(503, 'application/json', json.dumps({'error': 'no report yet'}))
+                    else:
+                        self._send(200, 'application/json', json.dumps(report))
+                elif path == '/healthz':
+                    self._send(200, 'text/plain', 'ok\n')
+                else:
+                    self._send(404, 'text/plain', 'not found\n')
+
+            def _send(self, status: int, content_type: str, body: str):
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.start()
+        logger.info(f"Serving health metrics on http://{host}:{port}/metrics "
+                    f"(checks every {self.interval:g}s)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            server.server_close()
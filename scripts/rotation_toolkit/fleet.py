@@ -0,0 +1,150 @@
+"""
+Fleet health checks: many targets across Vault servers, clusters and namespaces in one process
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .audit import redact
+from .health import RotationHealthChecker
+from .kube import new_api_client
+from .vault import new_vault_client
+
+logger = logging.getLogger(__name__)
+
+FLEET_TARGET_FIELDS = ('secret_path', 'sql_server', 'vault_url', 'kube_context', 'namespace', 'app_label',
+                       'cronjob_selector', 'check_timeout')
+
+# Best to worst; the fleet is as healthy as its worst target
+HEALTH_STATES = ('HEALTHY', 'WARNING', 'CRITICAL')
+
+
+class SharedClients:
+    """One Vault client per server URL and one Kubernetes API client per kube context
+
+    Clients are created on first use and shared by every target on the same
+    endpoint, so connections and loaded configuration are reused across the
+    fleet. A kube_context of None means the in-cluster config, falling back
+    to the current kubeconfig context.
+    """
+
+    def __init__(self, vault_token: str, timeout: float):
+        self.vault_token = vault_token
+        self.timeout = timeout
+        self.vault_clients = {}
+        self.api_clients = {}
+        self.lock = threading.Lock()
+
+    def vault(self, url: str):
+        with self.lock:
+            if url not in self.vault_clients:
+                self.vault_clients[url] = new_vault_client(url, self.vault_token, timeout=self.timeout)
+            return self.vault_clients[url]
+
+    def kubernetes(self, context: Optional[str]):
+        with self.lock:
+            if context not in self.api_clients:
+                self.api_clients[context] = new_api_client(context)
+            return self.api_clients[context]
+
+
+def _endpoints(target: Dict, required: Iterable[str]) -> List[Tuple[str, str]]:
+    """The endpoints a target's checks reach, in a fixed order so slots are always taken alike"""
+    endpoints = []
+    if 'hvac' in required:
+        endpoints.append(('vault', target['vault_url']))
+    if 'kubernetes' in required:
+        endpoints.append(('kubernetes', target['kube_context'] or ''))
+    if 'pyodbc' in required:
+        endpoints.append(('sql', target['sql_server'].lower()))
+    return sorted(endpoints)
+
+
+def check_fleet(vault_token: str, targets: List[Dict], checks: Optional[Iterable[str]] = None,
+                max_workers: int = 8, max_per_endpoint: int = 2, history=None,
+                on_result: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Run the health checks for many targets concurrently and merge the reports
+
+    At most max_workers targets are checked at once, and at most
+    max_per_endpoint of them against the same Vault server, cluster or SQL
+    Server. Each target's checks still run concurrently within it, under
+    their own timeouts. on_result is called with each target's result as
+    soon as it finishes, on the calling thread. Returns the merged report,
+    with the targets in manifest order.
+    """
+    checks = list(checks) if checks is not None else None
+    required = RotationHealthChecker.required_backends(checks)
+    clients = SharedClients(vault_token, max((target['check_timeout'] for target in targets), default=15.0))
+    slots = {}
+    for target in targets:
+        for endpoint in _endpoints(target, required):
+            slots.setdefault(endpoint, threading.BoundedSemaphore(max_per_endpoint))
+
+    def run(target: Dict) -> Dict:
+        threading.current_thread().name = target['name']
+        result = {
+            'name': target['name'],
+            'secret_path': target['secret_path'],
+            'sql_server': target['sql_server'],
+            'kube_context': target['kube_context'],
+            'namespace': target['namespace'],
+            'overall_health': 'CRITICAL',
+            'error': None,
+            'report': None,
+        }
+
+        with ExitStack() as stack:
+            for endpoint in _endpoints(target, required):
+                stack.enter_context(slots[endpoint])
+            started = time.monotonic()
+            try:
+                checker = RotationHealthChecker(
+                    vault_url=target['vault_url'],
+                    vault_token=vault_token,
+                    secret_path=target['secret_path'],
+                    sql_server=target['sql_server'],
+                    check_timeout=target['check_timeout'],
+                    namespace=target['namespace'],
+                    app_label=target['app_label'],
+                    cronjob_selector=target['cronjob_selector'],
+                    api_client=clients.kubernetes(target['kube_context']) if 'kubernetes' in required else None,
+                    vault_client=clients.vault(target['vault_url']) if 'hvac' in required else None,
+                    history=history,
+                    target_name=target['name']
+                )
+                report = checker.generate_report(checks)
+                result['report'] = report
+                result['overall_health'] = report['overall_health']
+            except Exception as e:
+                result['error'] = redact(str(e))
+                logger.error(f"Health check of target {target['name']} failed: {result['error']}")
+            result['duration_seconds'] = round(time.monotonic() - started, 3)
+
+        return result
+
+    started_at = datetime.now().isoformat()
+    started = time.monotonic()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fleet') as executor:
+        futures = [executor.submit(run, target) for target in targets]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['name']] = result
+            if on_result is not None:
+                on_result(result)
+
+    ordered = [results[target['name']] for target in targets]
+    states = Counter(result['overall_health'] for result in ordered)
+    return {
+        'timestamp': started_at,
+        'overall_health': max(states, key=HEALTH_STATES.index),
+        'targets_by_health': {state: states.get(state, 0) for state in HEALTH_STATES},
+        'duration_seconds': round(time.monotonic() - started, 3),
+        'targets': ordered,
+    }
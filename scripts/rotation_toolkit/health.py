@@ -0,0 +1,610 @@
+"""
+Health checks for the credential rotation system
+
+Checks:
+- Last successful rotation timestamp
+- Credential age
+- System readiness for rotation
+- Vault connectivity
+- SQL Server connectivity
+- Kubernetes access
+
+Vault and Kubernetes are each read once per run and the checks run
+concurrently, each with its own timeout. Per-check timings are included in the
+report, and each report can be appended to a HealthHistory for trend queries.
+"""
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from . import backends
+from .audit import redact
+from .connection import parse_connection_string
+from .kube import (EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, EXTERNAL_SECRET_VERSION,
+                   _k8s_json, iter_k8s_items, new_api_client)
+from .vault import new_vault_client, parse_rotation_index
+
+logger = logging.getLogger(__name__)
+
+
+class HealthRun:
+    """Snapshots, timings and messages of one generate_report run
+
+    Every check thread holds the run it was started for. Once the report is
+    built the run is closed, so a check that outlived its timeout and
+    finishes later drops its timing and messages instead of filing them under
+    a later run.
+    """
+
+    def __init__(self):
+        self.vault_snapshot = None
+        self.kubernetes_snapshot = None
+        self.timings = {}
+        self.messages = {}
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def record(self, check: Optional[str], kind: str, message: str):
+        with self.lock:
+            if not self.closed:
+                self.messages.setdefault(check, {'issues': [], 'warnings': []})[kind].append(message)
+
+    def record_timing(self, name: str, seconds: float):
+        with self.lock:
+            if not self.closed:
+                self.timings[name] = seconds
+
+    def close(self):
+        """Stop accepting results and return (timings, messages)"""
+        with self.lock:
+            self.closed = True
+            return dict(self.timings), self.messages
+
+
+class RotationHealthChecker:
+    # (report key, check method, value when the check times out, timeout is critical)
+    CHECKS = (
+        ('vault_connectivity', 'check_vault_connectivity', False, True),
+        ('sql_connectivity', 'check_sql_connectivity', False, True),
+        ('kubernetes_access', 'check_kubernetes_access', False, True),
+        ('credential_info', 'check_credential_age', None, False),
+        ('backups', 'check_backup_retention', [], False),
+        ('rotation_schedule', 'check_rotation_schedule', None, False),
+    )
+
+    # Snapshots each check reads; a run only takes the snapshots its checks need
+    CHECK_SNAPSHOTS = {
+        'vault_connectivity': ('vault',),
+        'sql_connectivity': ('vault',),
+        'kubernetes_access': ('kubernetes',),
+        'credential_info': ('vault',),
+        'backups': ('vault',),
+        'rotation_schedule': ('kubernetes',),
+    }
+    SNAPSHOT_BACKENDS = {'vault': 'hvac', 'kubernetes': 'kubernetes'}
+
+    def __init__(self, vault_url: str, vault_token: str, secret_path: str, sql_server: str,
+                 check_timeout: float = 15.0, check_timeouts: Optional[Dict[str, float]] = None,
+                 namespace: str = "default", app_label: str = "workouttracker",
+                 cronjob_selector: str = "app=credential-rotator", api_client=None, vault_client=None,
+                 history=None, target_name: Optional[str] = None):
+        self.vault_url = vault_url
+        self.vault_token = vault_token
+        self.secret_path = secret_path
+        self.sql_server = sql_server
+        self.namespace = namespace
+        self.app_label = app_label
+        self.cronjob_selector = cronjob_selector
+        self.api_client = api_client
+        self.vault_client = vault_client
+        self.history = history
+        self.target_name = target_name or secret_path
+        self.check_timeout = check_timeout
+        self.check_timeouts = check_timeouts or {}
+        self.issues = []
+        self.warnings = []
+        self.timings = {}
+
+        # The latest run, for checks called outside generate_report; each check thread holds its own
+        self._run = HealthRun()
+        self._context = threading.local()
+        # Check or snapshot name -> its future, while a timed-out one is still running
+        self._running = {}
+
+    def _current_run(self) -> HealthRun:
+        return getattr(self._context, 'run', None) or self._run
+
+    def _record(self, kind: str, message: str):
+        """File a message under the check running on this thread, in that check's run"""
+        self._current_run().record(getattr(self._context, 'check', None), kind, message)
+            
+    def add_issue(self, issue: str):
+        """Add a critical issue"""
+        sanitized_issue = redact(issue)
+        self._record('issues', sanitized_issue)
+        logger.error(f"ISSUE: {sanitized_issue}")
+        
+    def add_warning(self, warning: str):
+        """Add a warning"""
+
+        sanitized_warning = redact(warning)
+        self._record('warnings', sanitized_warning)
+        logger.warning(f"WARNING: {sanitized_warning}")
+        
+    def snapshot_vault(self) -> dict:
+        """Authenticate once and read the secret and its metadata for this run"""
+        vault_client = self.vault_client or new_vault_client(self.vault_url, self.vault_token,
+                                                             timeout=self.check_timeout)
+        snapshot = {'client': vault_client, 'authenticated': vault_client.is_authenticated(),
+                    'data': None, 'version': None}
+        if snapshot['authenticated']:
+            response = vault_client.secrets.kv.v2.read_secret_version(path=self.secret_path)
+            if response:
+                snapshot['data'] = response['data']['data']
+                snapshot['version'] = response['data']['metadata']['version']
+        return snapshot
+        
+    def snapshot_kubernetes(self) -> dict:
+        """Load kube config once and build the API client shared by all checks"""
+        if self.api_client is not None:
+            return {'api_client': self.api_client}
+        return {'api_client': new_api_client()}
+        
+    def vault_snapshot(self) -> dict:
+        """Wait for and return this run's Vault snapshot"""
+        run = self._current_run()
+        if run.vault_snapshot is None:
+            run.vault_snapshot = self._immediate(self.snapshot_vault)
+        return run.vault_snapshot.result()
+        
+    def kubernetes_snapshot(self) -> dict:
+        """Wait for and return this run's Kubernetes snapshot"""
+        run = self._current_run()
+        if run.kubernetes_snapshot is None:
+            run.kubernetes_snapshot = self._immediate(self.snapshot_kubernetes)
+        return run.kubernetes_snapshot.result()
+        
+    def _immediate(self, func):
+        """Run func on the calling thread, wrapped like a submitted future"""
+        future = Future()
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+        return future
+        
+    def current_connection_string(self) -> str:
+        """Return the application connection string from the Vault snapshot"""
+        snapshot = self.vault_snapshot()
+        if snapshot['data'] is None:
+            raise Exception(f"Cannot read secret at path: {self.secret_path}")
+        return snapshot['data']['ConnectionStrings__WorkoutTrackerWebContext']
+        
+    def check_vault_connectivity(self) -> bool:
+        """Check if Vault is accessible and token is valid"""
+        try:
+            snapshot = self.vault_snapshot()
+            if not snapshot['authenticated']:
+                self.add_issue("Vault authentication failed")
+                return False
+                
+            # The snapshot already tried to read the secret
+            if snapshot['data'] is None:
+                self.add_issue(f"Cannot read secret at path: {self.secret_path}")
+                return False
+                
+            logger.info("Vault connectivity: OK")
+            return True
+            
+        except Exception as e:
+            self.add_issue(f"Vault connectivity failed: {e}")
+            return False
+            
+    def check_sql_connectivity(self) -> bool:
+        """Check SQL Server connectivity with current credentials"""
+        try:
+            # Get current credentials from the Vault snapshot
+            conn_str = self.current_connection_string()
+            
+            # Test connection
+            conn = backends.pyodbc().connect(conn_str, timeout=int(min(10, self._timeout_for('sql_connectivity'))))
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.close()
+            
+            logger.info("SQL Server connectivity: OK")
+            return True
+            
+        except Exception as e:
+            self.add_issue(f"SQL Server connectivity failed: {e}")
+            return False
+            
+    def check_kubernetes_access(self) -> bool:
+        """Check Kubernetes API access"""
+        try:
+            api_client = self.kubernetes_snapshot()['api_client']
+            request_timeout = self._timeout_for('kubernetes_access')
+            
+            k8s = backends.kubernetes_client()
+            v1 = k8s.CoreV1Api(api_client)
+            
+            # Test basic access, scoped to the application's pods and never decoded into models
+            _k8s_json(v1.list_namespaced_pod(
+                namespace=self.namespace,
+                label_selector=f"app={self.app_label}",
+                limit=1,
+                _preload_content=False,
+                _request_timeout=request_timeout
+            ))
+            
+            # Test External Secrets access
+            custom_api = k8s.CustomObjectsApi(api_client)
+            try:
+                _k8s_json(custom_api.list_namespaced_custom_object(
+                    group=EXTERNAL_SECRET_GROUP,
+                    version=EXTERNAL_SECRET_VERSION,
+                    namespace=self.namespace,
+                    plural=EXTERNAL_SECRET_PLURAL,
+                    limit=1,
+                    _preload_content=False,
+                    _request_timeout=request_timeout
+                ))
+            except:
+                self.add_warning("Cannot access External Secrets - may need manual secret refresh")
+            
+            logger.info("Kubernetes access: OK")
+            return True
+            
+        except Exception as e:
+            self.add_issue(f"Kubernetes access failed: {e}")
+            return False
+            
+    def check_credential_age(self) -> Optional[dict]:
+        """Check the age of current credentials"""
+        try:
+            conn_str = self.current_connection_string()
+            
+            # Parse username to extract timestamp if present
+            username = parse_connection_string(conn_str).get('user_id')
+            if not username:
+                self.add_warning("Cannot parse username from connection string")
+                return None
+            
+            # Check if username has timestamp format (user.YYYYMMDDHHMM)
+            timestamp_match = re.search(r'\.(\d{12})$', username)
+            if timestamp_match:
+                timestamp_str = timestamp_match.group(1)
+                try:
+                    created_date = datetime.strptime(timestamp_str, '%Y%m%d%H%M')
+                    age_days = (datetime.now() - created_date).days
+                    
+                    credential_info = {
+                        'username': username,
+                        'created_date': created_date.isoformat(),
+                        'age_days': age_days
+                    }
+                    
+                    if age_days > 45:
+                        self.add_warning(f"Credentials are {age_days} days old - consider rotation")
+                    elif age_days > 30:
+                        self.add_warning(f"Credentials are {age_days} days old - rotation due soon")
+                    else:
+                        logger.info(f"Credential age: {age_days} days (OK)")
+                        
+                    return credential_info
+                    
+                except ValueError:
+                    self.add_warning(f"Cannot parse timestamp from username: {username}")
+                    
+            else:
+                self.add_warning(f"Username does not contain timestamp: {username}")
+                
+            return None
+            
+        except Exception as e:
+            self.add_warning(f"Cannot check credential age: {e}")
+            return None
+            
+    def check_backup_retention(self) -> List[str]:
+        """Check which earlier secret versions are available for rollback"""
+        try:
+            vault_client = self.vault_snapshot()['client']
+            
+            # Old credentials are kept as KV v2 versions, indexed in custom_metadata
+            # by the rotation script; one metadata read covers both
+            try:
+                metadata = vault_client.secrets.kv.v2.read_secret_metadata(path=self.secret_path)['data']
+            except Exception as e:
+                self.add_warning(f"Cannot read secret metadata (may not have read permission): {e}")
+                return []
+                
+            current_version = metadata['current_version']
+            versions = metadata.get('versions') or {}
+            index = parse_rotation_index(metadata)
+                    
+            rollback_points = []
+            for version in sorted(index, reverse=True):
+                info = versions.get(str(version))
+                if version == current_version or not info:
+                    continue
+                if info.get('destroyed') or info.get('deletion_time'):
+                    continue
+                rollback_points.append(f"v{version} ({index[version].get('username', 'unknown')})")
+                
+            if rollback_points:
+                logger.info(f"Found {len(rollback_points)} rollback version(s)")
+            else:
+                self.add_warning("No rollback versions found in rotation index")
+                
+            previous_version = (index.get(current_version) or {}).get('previous_version')
+            if previous_version:
+                info = versions.get(str(previous_version)) or {}
+                if not info or info.get('destroyed') or info.get('deletion_time'):
+                    self.add_warning(f"Version {previous_version} replaced by the last rotation is no longer "
+                                     f"available - rollback of the last rotation is not possible")
+                    
+            return rollback_points
+                
+        except Exception as e:
+            self.add_warning(f"Cannot check backup retention: {e}")
+            return []
+            
+    def check_rotation_schedule(self) -> Optional[dict]:
+        """Check if automated rotation is scheduled"""
+        try:
+            batch_api = backends.kubernetes_client().BatchV1Api(self.kubernetes_snapshot()['api_client'])
+            
+            def summarize(cronjob: dict) -> dict:
+                metadata = cronjob['metadata']
+                spec = cronjob.get('spec') or {}
+                return {
+                    'name': metadata['name'],
+                    'namespace': metadata.get('namespace'),
+                    'schedule': spec.get('schedule'),
+                    'suspended': spec.get('suspend', False),
+                    'last_schedule': (cronjob.get('status') or {}).get('lastScheduleTime')
+                }
+                
+            def find_cronjobs(label_selector: str) -> List[dict]:
+                # Pages are reduced to the few fields we report before the next one is fetched
+                return [
+                    job for job in iter_k8s_items(
+                        batch_api.list_cron_job_for_all_namespaces,
+                        summarize,
+                        label_selector=label_selector,
+                        _request_timeout=self._timeout_for('rotation_schedule')
+                    )
+                    if 'credential' in job['name'].lower() and 'rotation' in job['name'].lower()
+                ]
+                
+            # Look for credential rotation CronJob, by label first
+            rotation_cronjobs = find_cronjobs(self.cronjob_selector)
+            if not rotation_cronjobs and self.cronjob_selector:
+                rotation_cronjobs = find_cronjobs("")
+                if rotation_cronjobs:
+                    self.add_warning(f"Rotation CronJob does not match selector '{self.cronjob_selector}'")
+                    
+            if rotation_cronjobs:
+                logger.info(f"Found {len(rotation_cronjobs)} rotation CronJob(s)")
+                for job in rotation_cronjobs:
+                    if job['suspended']:
+                        self.add_warning(f"CronJob {job['name']} is suspended")
+            else:
+                self.add_warning("No automated rotation CronJob found")
+                
+            return rotation_cronjobs
+            
+        except Exception as e:
+            self.add_warning(f"Cannot check rotation schedule: {e}")
+            return None
+            
+    @classmethod
+    def select_checks(cls, checks: Optional[Iterable[str]] = None) -> List[tuple]:
+        """Return the CHECKS entries to run, in check order; None selects all of them"""
+        if checks is None:
+            return list(cls.CHECKS)
+        checks = set(checks)
+        unknown = checks - {key for key, _, _, _ in cls.CHECKS}
+        if unknown:
+            raise ValueError(f"Unknown check(s): {', '.join(sorted(unknown))}")
+        return [entry for entry in cls.CHECKS if entry[0] in checks]
+
+    @classmethod
+    def required_backends(cls, checks: Optional[Iterable[str]] = None) -> Set[str]:
+        """Return the client libraries the selected checks import"""
+        modules = set()
+        for key, _, _, _ in cls.select_checks(checks):
+            modules.update(cls.SNAPSHOT_BACKENDS[snapshot] for snapshot in cls.CHECK_SNAPSHOTS[key])
+            if key == 'sql_connectivity':
+                modules.add('pyodbc')
+        return modules
+
+    def _timeout_for(self, name: str) -> float:
+        return self.check_timeouts.get(name, self.check_timeout)
+        
+    def _timed(self, run: HealthRun, name: str, func):
+        """Run func as check `name` of run on the current thread, recording its wall-clock time"""
+        self._context.run, self._context.check = run, name
+        started = time.monotonic()
+        try:
+            return func()
+        finally:
+            run.record_timing(name, round(time.monotonic() - started, 3))
+            self._context.run, self._context.check = None, None
+
+    def _submit(self, executor: ThreadPoolExecutor, run: HealthRun, name: str, func) -> Optional[Future]:
+        """Start check or snapshot `name`, unless it is still running from an earlier run
+
+        Returns None for a check that is still running; a snapshot that is
+        still running is shared instead. Either way at most one thread per
+        check or snapshot is ever left running.
+        """
+        running = self._running.get(name)
+        if running is not None and not running.done():
+            return running if name.endswith('_snapshot') else None
+        future = executor.submit(self._timed, run, name, func)
+        self._running[name] = future
+        return future
+
+    def _report_timeout(self, run: HealthRun, key: str, message: str, critical: bool):
+        self._context.run, self._context.check = run, key
+        try:
+            if critical:
+                self.add_issue(message)
+            else:
+                self.add_warning(message)
+        finally:
+            self._context.run, self._context.check = None, None
+            
+    def generate_report(self, checks: Optional[Iterable[str]] = None) -> dict:
+        """Generate comprehensive health report
+
+        Vault and Kubernetes are each snapshotted once per run and the checks
+        run concurrently against the shared snapshot, each bounded by its own
+        timeout. A check that times out is reported as failed; its thread is
+        left to finish in the background, and whatever it records then is
+        dropped. Until it finishes, later runs report that check as failed
+        rather than start it again. checks limits the run to a subset of
+        CHECKS; snapshots no selected check reads are skipped.
+        """
+        logger.info("Starting credential rotation health check...")
+        started = time.monotonic()
+        
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'vault_connectivity': False,
+            'sql_connectivity': False,
+            'kubernetes_access': False,
+            'credential_info': None,
+            'backups': [],
+            'rotation_schedule': None,
+            'issues': [],
+            'warnings': [],
+            'timings': {},
+            'checks': [],
+            'overall_health': 'UNKNOWN'
+        }
+        
+        selected = self.select_checks(checks)
+        report['checks'] = [key for key, _, _, _ in selected]
+        snapshots = {snapshot for key in report['checks'] for snapshot in self.CHECK_SNAPSHOTS[key]}
+        
+        run = self._run = HealthRun()
+        
+        # Snapshots and checks share one pool; checks block on the snapshot they need
+        executor = ThreadPoolExecutor(max_workers=len(selected) + len(snapshots), thread_name_prefix='health')
+        try:
+            if 'vault' in snapshots:
+                run.vault_snapshot = self._submit(executor, run, 'vault_snapshot', self.snapshot_vault)
+            if 'kubernetes' in snapshots:
+                run.kubernetes_snapshot = self._submit(executor, run, 'kubernetes_snapshot', self.snapshot_kubernetes)
+            
+            futures = {}
+            for key, method, _, _ in selected:
+                futures[key] = (self._submit(executor, run, key, getattr(self, method)), time.monotonic())
+                
+            for key, method, timeout_value, critical in selected:
+                future, submitted = futures[key]
+                timeout = self._timeout_for(key)
+                if future is None:
+                    report[key] = timeout_value
+                    self._report_timeout(run, key, f"{method} is still running from an earlier run", critical)
+                    continue
+                try:
+                    report[key] = future.result(timeout=max(0.0, submitted + timeout - time.monotonic()))
+                except FutureTimeoutError:
+                    report[key] = timeout_value
+                    run.record_timing(key, timeout)
+                    self._report_timeout(run, key, f"{method} timed out after {timeout}s", critical)
+        finally:
+            executor.shutdown(wait=False)
+            
+        # Compile issues and warnings in check order, independent of completion order
+        timings, messages = run.close()
+        for check in [None, 'vault_snapshot', 'kubernetes_snapshot'] + report['checks']:
+            report['issues'].extend(messages.get(check, {}).get('issues', []))
+            report['warnings'].extend(messages.get(check, {}).get('warnings', []))
+        self.issues = report['issues']
+        self.warnings = report['warnings']
+        self.timings = timings
+        
+        report['timings'] = dict(timings)
+        report['timings']['total'] = round(time.monotonic() - started, 3)
+        
+        # Determine overall health
+        if self.issues:
+            report['overall_health'] = 'CRITICAL'
+        elif self.warnings:
+            report['overall_health'] = 'WARNING'
+        else:
+            report['overall_health'] = 'HEALTHY'
+
+        if self.history is not None:
+            try:
+                self.history.append(self.target_name, report)
+            except Exception as e:
+                logger.warning(f"Cannot append report to health history {self.history.path}: {e}")
+            
+        return report
+        
+    def print_summary(self, report: dict):
+        """Print human-readable summary"""
+        print("\n" + "="*60)
+        print("SQL CREDENTIAL ROTATION HEALTH CHECK")
+        print("="*60)
+        
+        print(f"\nOverall Health: {report['overall_health']}")
+        print(f"Check Time: {report['timestamp']}")
+        
+        def mark(key: str) -> str:
+            if key not in report.get('checks', [key]):
+                return '- (not checked)'
+            return '✓' if report[key] else '✗'
+            
+        print(f"\nConnectivity Checks:")
+        print(f"  Vault:      {mark('vault_connectivity')}")
+        print(f"  SQL Server: {mark('sql_connectivity')}")
+        print(f"  Kubernetes: {mark('kubernetes_access')}")
+        
+        if report['credential_info']:
+            cred = report['credential_info']
+            print(f"\nCredential Information:")
+            print(f"  Username: {cred['username']}")
+            print(f"  Age: {cred['age_days']} days")
+            print(f"  Created: {cred['created_date']}")
+            
+        if report['backups']:
+            print(f"\nRollback Versions: {len(report['backups'])} available")
+            
+        if report['rotation_schedule']:
+            print(f"\nScheduled Rotation:")
+            for job in report['rotation_schedule']:
+                status = "Active" if not job['suspended'] else "Suspended"
+                print(f"  {job['name']}: {job['schedule']} ({status})")
+                
+        if report.get('timings'):
+            print(f"\nCheck Timings:")
+            for name, seconds in report['timings'].items():
+                print(f"  {name + ':':<22}{seconds * 1000:8.0f} ms")
+                
+        if report['issues']:
+            print(f"\n🚨 CRITICAL ISSUES ({len(report['issues'])}):")
+            for issue in report['issues']:
+                print(f"  • {issue}")
+                
+        if report['warnings']:
+            print(f"\n⚠️  WARNINGS ({len(report['warnings'])}):")
+            for warning in report['warnings']:
+                print(f"  • {warning}")
+                
+        if report['overall_health'] == 'HEALTHY':
+            print(f"\n✅ System is healthy and ready for credential rotation!")
+            
+        print("\n" + "="*60)
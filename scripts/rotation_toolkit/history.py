@@ -0,0 +1,203 @@
+"""
+Append-only store of health reports, with indexed range and percentile queries
+
+Every report is one row in `runs` (its time, overall state and the full
+report, zlib-compressed JSON) plus one row per measurement in `samples`:
+each check's duration ('seconds') and result ('up'), the credential age,
+the rollback versions and the issue and warning counts. `samples` is a
+WITHOUT ROWID table clustered on (target, check, metric, ts), so a query for
+one series over a time range reads only that range, however many months
+the file holds. `series` lists the stored series, so the summary never has
+to scan `samples` to find them.
+
+Only the standard library's sqlite3 is used; it is imported with this module,
+which the CLI never loads at startup.
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .stats import percentile
+
+DEFAULT_HISTORY_DB = os.path.join(os.path.expanduser('~'), '.cache', 'rotation_toolkit', 'health-history.db')
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL,
+    ts REAL NOT NULL,
+    overall TEXT NOT NULL,
+    report BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (ts);
+CREATE TABLE IF NOT EXISTS samples (
+    target TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    ts REAL NOT NULL,
+    run_id INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (target, check_name, metric, ts, run_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series (
+    target TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    first_ts REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (target, check_name, metric)
+) WITHOUT ROWID;
+"""
+
+# Relative times accepted by --since/--until, e.g. 30d, 12h, 90m
+RELATIVE_TIME = re.compile(r'^(\d+(?:\.\d+)?)([smhdw])$')
+RELATIVE_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_time(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Unix time for an ISO date/time or a duration ago such as '30d'; None stays None"""
+    if value is None:
+        return None
+    match = RELATIVE_TIME.match(value.strip())
+    if match:
+        delta = timedelta(**{RELATIVE_UNITS[match.group(2)]: float(match.group(1))})
+        return (time.time() if now is None else now) - delta.total_seconds()
+    try:
+        return datetime.fromisoformat(value.strip()).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time {value!r}: use an ISO date/time or a duration such as 30d, 12h or 90m")
+
+
+def format_time(ts: float) -> str:
+    return datetime.fromtimestamp(ts).isoformat(timespec='seconds')
+
+
+def report_samples(report: dict) -> List[Tuple[str, str, float]]:
+    """(check, metric, value) for every measurement in a health report"""
+    samples = [(name, 'seconds', float(seconds)) for name, seconds in report.get('timings', {}).items()]
+    for check in report.get('checks', []):
+        samples.append((check, 'up', float(report.get(check) not in (False, None))))
+    if report.get('credential_info'):
+        samples.append(('credential_info', 'age_days', float(report['credential_info']['age_days'])))
+    if 'backups' in report.get('checks', []):
+        samples.append(('backups', 'versions', float(len(report['backups'] or []))))
+    samples.append(('overall', 'issues', float(len(report.get('issues', [])))))
+    samples.append(('overall', 'warnings', float(len(report.get('warnings', [])))))
+    return samples
+
+
+class HealthHistory:
+    """One SQLite file of health reports for any number of targets"""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_DB):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10)
+        if not self._initialized:
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    def append(self, target: str, report: dict) -> int:
+        """Store a report and its samples in one transaction; returns the run id"""
+        ts = datetime.fromisoformat(report['timestamp']).timestamp()
+        blob = zlib.compress(json.dumps(report, separators=(',', ':'), default=str).encode('utf-8'))
+        samples = report_samples(report)
+        with closing(self._connect()) as connection, connection:
+            run_id = connection.execute(
+                "INSERT INTO runs (target, ts, overall, report) VALUES (?, ?, ?, ?)",
+                (target, ts, report['overall_health'], blob)
+            ).lastrowid
+            connection.executemany(
+                "INSERT OR REPLACE INTO samples (target, check_name, metric, ts, run_id, value) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(target, check, metric, ts, run_id, value) for check, metric, value in samples]
+            )
+            connection.executemany(
+                "INSERT INTO series (target, check_name, metric, first_ts, last_ts) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (target, check_name, metric) DO UPDATE SET "
+                "first_ts = MIN(first_ts, excluded.first_ts), last_ts = MAX(last_ts, excluded.last_ts)",
+                [(target, check, metric, ts, ts) for check, metric, _ in samples]
+            )
+        return run_id
+
+    def list_series(self, target: Optional[str] = None, check: Optional[str] = None,
+                    metric: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """(target, check, metric) of every stored series matching the filters"""
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT target, check_name, metric FROM series ORDER BY 1, 2, 3").fetchall()
+        return [row for row in rows
+                if (target is None or row[0] == target) and (check is None or row[1] == check)
+                and (metric is None or row[2] == metric)]
+
+    def values(self, target: str, check: str, metric: str, since: Optional[float] = None,
+               until: Optional[float] = None) -> List[Tuple[float, float]]:
+        """(ts, value) of one series in [since, until), oldest first"""
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT ts, value FROM samples WHERE target = ? AND check_name = ? AND metric = ? "
+                "AND ts >= ? AND ts < ? ORDER BY ts",
+                (target, check, metric, -math.inf if since is None else since,
+                 math.inf if until is None else until)
+            ).fetchall()
+
+    def summarize(self, target: str, check: str, metric: str, since: Optional[float] = None,
+                  until: Optional[float] = None, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict:
+        """Count, min, max, mean, percentiles and latest value of one series over a range"""
+        rows = self.values(target, check, metric, since, until)
+        ordered = sorted(value for _, value in rows)
+        summary = {'target': target, 'check': check, 'metric': metric, 'count': len(rows)}
+        if rows:
+            summary.update({
+                'first': format_time(rows[0][0]),
+                'last': format_time(rows[-1][0]),
+                'min': ordered[0],
+                'max': ordered[-1],
+                'mean': round(sum(ordered) / len(ordered), 6),
+                'latest': rows[-1][1],
+            })
+            summary['percentiles'] = {f"p{p:g}": percentile(ordered, p) for p in percentiles}
+        return summary
+
+    def first_crossing(self, target: str, check: str, metric: str, threshold: float,
+                       since: Optional[float] = None, until: Optional[float] = None) -> Optional[Tuple[float, float]]:
+        """(ts, value) of the first sample in the range above threshold, or None"""
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT ts, value FROM samples WHERE target = ? AND check_name = ? AND metric = ? "
+                "AND ts >= ? AND ts < ? AND value > ? ORDER BY ts LIMIT 1",
+                (target, check, metric, -math.inf if since is None else since,
+                 math.inf if until is None else until, threshold)
+            ).fetchone()
+
+    def runs(self, target: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+             limit: int = 50) -> List[Dict]:
+        """The most recent runs in the range, newest first, with their issues and warnings"""
+        bounds = (-math.inf if since is None else since, math.inf if until is None else until)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT target, ts, overall, report FROM runs WHERE ts >= ? AND ts < ? AND (? IS NULL OR target = ?) "
+                "ORDER BY ts DESC LIMIT ?", bounds + (target, target, limit)
+            ).fetchall()
+        runs = []
+        for run_target, ts, overall, blob in rows:
+            report = json.loads(zlib.decompress(blob))
+            runs.append({'target': run_target, 'time': format_time(ts), 'overall_health': overall,
+                         'issues': report.get('issues', []), 'warnings': report.get('warnings', [])})
+        return runs
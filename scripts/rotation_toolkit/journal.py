@@ -0,0 +1,88 @@
+"""
+Checkpoint journal that lets an interrupted rotation resume where it stopped
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from . import backends
+from .vault import VaultSecretStore
+
+logger = logging.getLogger(__name__)
+
+# Stored next to the rotated secret, like the legacy _backup_ paths
+JOURNAL_SUFFIX = "_rotation_journal"
+
+# Checkpoints in the order a rotation reaches them
+JOURNAL_STATES = ('started', 'login_created', 'vault_updated', 'secret_synced', 'rolled_out', 'completed')
+
+# States a new rotation may start over from
+FINISHED_STATES = ('completed', 'abandoned')
+
+
+class RotationJournal:
+    """The state of the current rotation of one secret, kept in Vault KV v2
+
+    A rotation begins by writing the credentials it generated, then records a
+    checkpoint after each step. Every write uses check-and-set against the
+    journal version last seen, so two runs can never drive the same rotation
+    and a run that lost the race fails before touching SQL Server. The
+    generated password lives only here (and, once switched, in the secret
+    itself) and is left out of the final 'completed' entry.
+    """
+
+    def __init__(self, vault_store: VaultSecretStore, secret_path: str):
+        self.vault_store = vault_store
+        self.path = f"{secret_path}{JOURNAL_SUFFIX}"
+        self.entry = None
+        self.version = 0
+
+    def load(self) -> Optional[Dict]:
+        """Read the journal; returns the entry, or None if no rotation was ever journaled"""
+        try:
+            self.entry, self.version = self.vault_store.read(self.path, refresh=True)
+        except backends.hvac().exceptions.InvalidPath:
+            self.entry, self.version = None, 0
+        return self.entry
+
+    @property
+    def resumable(self) -> bool:
+        """Whether the loaded journal describes a rotation that did not finish"""
+        return bool(self.entry) and self.entry.get('state') not in FINISHED_STATES
+
+    def reached(self, state: str) -> bool:
+        """Whether the loaded rotation has completed the step that ends in state"""
+        if not self.resumable:
+            return False
+        current = self.entry['state']
+        return current in JOURNAL_STATES and JOURNAL_STATES.index(current) >= JOURNAL_STATES.index(state)
+
+    def discard(self):
+        """Give up on an unfinished rotation; the next begin() overwrites it"""
+        self.entry = {**self.entry, 'state': 'abandoned'}
+
+    def begin(self, old_username: str, new_username: str, new_password: str, **fields):
+        """Record a new rotation before any change is made"""
+        now = datetime.utcnow().isoformat()
+        self._write({
+            'state': 'started',
+            'old_username': old_username,
+            'new_username': new_username,
+            'new_password': new_password,
+            **fields,
+            'started_at': now,
+            'updated_at': now,
+        })
+
+    def checkpoint(self, state: str, **fields):
+        """Record that the rotation reached state, with any values later steps need"""
+        entry = {**self.entry, **fields, 'state': state, 'updated_at': datetime.utcnow().isoformat()}
+        if state in FINISHED_STATES:
+            entry.pop('new_password', None)
+        self._write(entry)
+        logger.info(f"Rotation checkpoint: {state}")
+
+    def _write(self, entry: Dict):
+        written = self.vault_store.write(self.path, entry, cas=self.version)
+        self.entry, self.version = entry, written['version']
@@ -0,0 +1,481 @@
+"""
+Kubernetes helpers: raw paged lists, watch streams and rollout tracking
+"""
+
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from . import backends, tracing, transport
+
+logger = logging.getLogger(__name__)
+
+EXTERNAL_SECRET_GROUP = "external-secrets.io"
+EXTERNAL_SECRET_VERSION = "v1beta1"
+EXTERNAL_SECRET_PLURAL = "externalsecrets"
+
+# Items per list request; keeps memory flat regardless of cluster size
+K8S_PAGE_SIZE = 100
+
+
+def new_api_client(context: Optional[str] = None):
+    """API client on the shared transport for a kubeconfig context
+
+    Without a context, the in-cluster configuration is used, falling back to
+    the current kubeconfig context.
+    """
+    config = backends.kubernetes_config()
+    configuration = backends.kubernetes_client().Configuration()
+    if context is None:
+        try:
+            config.load_incluster_config(client_configuration=configuration)
+        except config.ConfigException:
+            config.load_kube_config(client_configuration=configuration)
+    else:
+        config.load_kube_config(context=context, client_configuration=configuration)
+    return transport.kubernetes_api_client(configuration)
+
+
+def _parse_k8s_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parse an RFC 3339 timestamp as written by the API server"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+    except ValueError:
+        return None
+
+
+def _k8s_json(response) -> dict:
+    """Decode a raw (_preload_content=False) API response without building client models"""
+    try:
+        return json.loads(response.data)
+    finally:
+        response.release_conn()
+
+
+def iter_k8s_pages(list_func, page_size: int = K8S_PAGE_SIZE, **kwargs):
+    """Yield decoded list pages using limit/continue so only one page is held at a time"""
+    token = None
+    while True:
+        if token:
+            kwargs['_continue'] = token
+        with tracing.client_span('kubernetes', list_func.__name__, {'k8s.namespace': kwargs.get('namespace')}) as span:
+            page = _k8s_json(list_func(limit=page_size, _preload_content=False, **kwargs))
+            span.set_attribute('k8s.items', len(page.get('items') or []))
+        yield page
+        token = (page.get('metadata') or {}).get('continue')
+        if not token:
+            return
+
+
+def iter_k8s_items(list_func, extract=None, page_size: int = K8S_PAGE_SIZE, **kwargs):
+    """Yield list items page by page, reduced by extract(item) before the page is dropped"""
+    for page in iter_k8s_pages(list_func, page_size=page_size, **kwargs):
+        for item in page.get('items') or []:
+            yield extract(item) if extract else item
+
+
+def iter_watch_events(list_func, resource_version: str, timeout_seconds: int, **kwargs):
+    """Yield watch events decoded one line at a time from the raw HTTP stream"""
+    response = list_func(watch=True, resource_version=resource_version, timeout_seconds=timeout_seconds,
+                         allow_watch_bookmarks=True, _preload_content=False, **kwargs)
+    try:
+        buffer = b''
+        for chunk in response.stream():
+            buffer += chunk
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def format_label_selector(labels: Dict[str, str]) -> str:
+    """Format matchLabels as an equality-based label selector"""
+    return ','.join(f"{key}={value}" for key, value in sorted(labels.items()))
+
+
+def _deployment_summary(deployment: dict) -> dict:
+    """The parts of a Deployment a rollout needs: name, desired replicas and pod labels"""
+    spec = deployment.get('spec') or {}
+    return {
+        'name': deployment['metadata']['name'],
+        'replicas': spec.get('replicas', 1),
+        'selector': (spec.get('selector') or {}).get('matchLabels') or {},
+        'pod_labels': ((spec.get('template') or {}).get('metadata') or {}).get('labels') or {},
+    }
+
+
+def _pod_ready(pod: dict) -> bool:
+    """Whether a pod is Ready and not on its way out"""
+    if pod['metadata'].get('deletionTimestamp'):
+        return False
+    for condition in (pod.get('status') or {}).get('conditions') or []:
+        if condition.get('type') == 'Ready':
+            return condition.get('status') == 'True'
+    return False
+
+
+def _selects(selector: dict, labels: Dict[str, str]) -> bool:
+    """Whether a PodDisruptionBudget's label selector matches a pod's labels"""
+    for key, value in (selector.get('matchLabels') or {}).items():
+        if labels.get(key) != value:
+            return False
+    for requirement in selector.get('matchExpressions') or []:
+        key, operator, values = requirement.get('key'), requirement.get('operator'), requirement.get('values') or []
+        if operator == 'In' and labels.get(key) not in values:
+            return False
+        if operator == 'NotIn' and labels.get(key) in values:
+            return False
+        if operator == 'Exists' and key not in labels:
+            return False
+        if operator == 'DoesNotExist' and key in labels:
+            return False
+    return True
+
+
+class RolloutTracker:
+    """Follows ExternalSecret sync, Secret updates and Deployment rollouts via watch events
+
+    Every wait does one list to pick up the current state and resourceVersion,
+    then watches from that version and returns as soon as an event satisfies
+    the condition. All waits share a single deadline so the whole rollout is
+    bounded by one timeout.
+    """
+
+    def __init__(self, namespace: str = "default", timeout: int = 300, api_client=None):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.deadline = None
+        k8s = backends.kubernetes_client()
+        self.core_api = k8s.CoreV1Api(api_client)
+        self.apps_api = k8s.AppsV1Api(api_client)
+        self.custom_api = k8s.CustomObjectsApi(api_client)
+        self.policy_api = k8s.PolicyV1Api(api_client)
+        self.authorization_api = k8s.AuthorizationV1Api(api_client)
+
+    def start(self):
+        """Start the shared deadline for all subsequent waits"""
+        self.deadline = time.monotonic() + self.timeout
+
+    def remaining(self) -> float:
+        """Seconds left before the shared deadline"""
+        if self.deadline is None:
+            self.start()
+        return self.deadline - time.monotonic()
+
+    def _watch_until(self, list_func, predicate, description: str, **list_kwargs) -> dict:
+        """List, then watch from the listed resourceVersion until predicate(obj) is true"""
+        api_exception = backends.api_exception()
+        resource_version = None
+
+        while True:
+            remaining = self.remaining()
+            if remaining <= 0:
+                raise TimeoutError(f"Timed out waiting for {description}")
+
+            if resource_version is None:
+                for page in iter_k8s_pages(list_func, **list_kwargs):
+                    # The first page's resourceVersion is the snapshot the list was served from
+                    if resource_version is None:
+                        resource_version = page['metadata']['resourceVersion']
+                    for item in page.get('items') or []:
+                        if predicate(item):
+                            return item
+
+            try:
+                with tracing.client_span('kubernetes', f"watch {list_func.__name__}",
+                                         {'k8s.namespace': list_kwargs.get('namespace')}) as span:
+                    events = 0
+                    for event in iter_watch_events(list_func, resource_version,
+                                                   max(1, int(remaining)), **list_kwargs):
+                        events += 1
+                        span.set_attribute('k8s.watch.events', events)
+                        obj = event['object']
+                        if event['type'] == 'ERROR':
+                            # 410 Gone: our resourceVersion is too old, relist
+                            if obj.get('code') == 410:
+                                resource_version = None
+                                break
+                            raise Exception(f"Watch error while waiting for {description}: {obj.get('message')}")
+
+                        resource_version = obj['metadata']['resourceVersion']
+                        if event['type'] in ('ADDED', 'MODIFIED') and predicate(obj):
+                            return obj
+            except api_exception as e:
+                if e.status != 410:
+                    raise
+                resource_version = None
+
+    def _watch_collection_until(self, list_func, predicate, description: str, **list_kwargs) -> Dict[str, dict]:
+        """List, then watch, keeping name -> object for the whole selection until predicate(objects) is true"""
+        api_exception = backends.api_exception()
+        resource_version = None
+        objects = {}
+
+        while True:
+            remaining = self.remaining()
+            if remaining <= 0:
+                raise TimeoutError(f"Timed out waiting for {description}")
+
+            if resource_version is None:
+                objects = {}
+                for page in iter_k8s_pages(list_func, **list_kwargs):
+                    if resource_version is None:
+                        resource_version = page['metadata']['resourceVersion']
+                    for item in page.get('items') or []:
+                        objects[item['metadata']['name']] = item
+                if predicate(objects):
+                    return objects
+
+            try:
+                with tracing.client_span('kubernetes', f"watch {list_func.__name__}",
+                                         {'k8s.namespace': list_kwargs.get('namespace')}) as span:
+                    events = 0
+                    for event in iter_watch_events(list_func, resource_version,
+                                                   max(1, int(remaining)), **list_kwargs):
+                        events += 1
+                        span.set_attribute('k8s.watch.events', events)
+                        obj = event['object']
+                        if event['type'] == 'ERROR':
+                            if obj.get('code') == 410:
+                                resource_version = None
+                                break
+                            raise Exception(f"Watch error while waiting for {description}: {obj.get('message')}")
+
+                        resource_version = obj['metadata']['resourceVersion']
+                        if event['type'] in ('ADDED', 'MODIFIED'):
+                            objects[obj['metadata']['name']] = obj
+                        elif event['type'] == 'DELETED':
+                            objects.pop(obj['metadata']['name'], None)
+                        else:
+                            continue
+                        if predicate(objects):
+                            return objects
+            except api_exception as e:
+                if e.status != 410:
+                    raise
+                resource_version = None
+
+    def can_i(self, verb: str, resource: str, group: str = '', subresource: str = '') -> bool:
+        """Ask the API server, with a SelfSubjectAccessReview, whether we may verb resource in the namespace"""
+        body = {'apiVersion': 'authorization.k8s.io/v1', 'kind': 'SelfSubjectAccessReview',
+                'spec': {'resourceAttributes': {'namespace': self.namespace, 'verb': verb, 'group': group,
+                                                'resource': resource, 'subresource': subresource}}}
+        with tracing.client_span('kubernetes', 'create_self_subject_access_review',
+                                 {'k8s.namespace': self.namespace, 'k8s.verb': verb, 'k8s.resource': resource}):
+            review = _k8s_json(self.authorization_api.create_self_subject_access_review(
+                body=body, _preload_content=False
+            ))
+        return bool((review.get('status') or {}).get('allowed'))
+
+    def get_external_secret(self, name: str) -> dict:
+        """Get an ExternalSecret object"""
+        with tracing.client_span('kubernetes', 'get_namespaced_custom_object', {'k8s.namespace': self.namespace}):
+            return self.custom_api.get_namespaced_custom_object(
+                group=EXTERNAL_SECRET_GROUP,
+                version=EXTERNAL_SECRET_VERSION,
+                namespace=self.namespace,
+                plural=EXTERNAL_SECRET_PLURAL,
+                name=name
+            )
+
+    def get_secret_version(self, name: str) -> Optional[str]:
+        """Get the current resourceVersion of a Secret, or None if it does not exist"""
+        try:
+            # Raw read: only metadata.resourceVersion is used, the payload is never modelled
+            with tracing.client_span('kubernetes', 'read_namespaced_secret', {'k8s.namespace': self.namespace}):
+                secret = _k8s_json(self.core_api.read_namespaced_secret(
+                    name=name, namespace=self.namespace, _preload_content=False
+                ))
+            return secret['metadata']['resourceVersion']
+        except backends.api_exception() as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def wait_for_external_secret_sync(self, name: str, requested_at: datetime) -> dict:
+        """Wait until the ExternalSecret reports Ready with a refresh at or after requested_at"""
+        # refreshTime has one-second resolution
+        requested_at = requested_at.replace(microsecond=0)
+
+        def synced(obj: dict) -> bool:
+            status = obj.get('status') or {}
+            refresh_time = _parse_k8s_timestamp(status.get('refreshTime'))
+            if refresh_time is None or refresh_time < requested_at:
+                return False
+            for condition in status.get('conditions') or []:
+                if condition.get('type') == 'Ready':
+                    if condition.get('status') != 'True':
+                        raise Exception(f"ExternalSecret {name} sync failed: {condition.get('message')}")
+                    return True
+            return False
+
+        obj = self._watch_until(
+            self.custom_api.list_namespaced_custom_object,
+            synced,
+            f"ExternalSecret {name} to sync",
+            group=EXTERNAL_SECRET_GROUP,
+            version=EXTERNAL_SECRET_VERSION,
+            namespace=self.namespace,
+            plural=EXTERNAL_SECRET_PLURAL,
+            field_selector=f"metadata.name={name}"
+        )
+        logger.info(f"ExternalSecret {name} synced at {obj['status']['refreshTime']}")
+        return obj
+
+    def wait_for_secret_update(self, name: str, previous_version: Optional[str]) -> str:
+        """Wait until the Secret's resourceVersion moves past previous_version"""
+        obj = self._watch_until(
+            self.core_api.list_namespaced_secret,
+            lambda secret: secret['metadata']['resourceVersion'] != previous_version,
+            f"Secret {name} to be updated",
+            namespace=self.namespace,
+            field_selector=f"metadata.name={name}"
+        )
+        version = obj['metadata']['resourceVersion']
+        logger.info(f"Secret {name} updated (resourceVersion {previous_version} -> {version})")
+        return version
+
+    def describe_deployments(self, label_selector: str, names: Optional[List[str]] = None) -> List[dict]:
+        """Summarise the Deployments matching label_selector, or the named ones in the order given"""
+        deployments = list(iter_k8s_items(
+            self.apps_api.list_namespaced_deployment,
+            _deployment_summary,
+            namespace=self.namespace,
+            label_selector=None if names else label_selector
+        ))
+        if not names:
+            return deployments
+        by_name = {deployment['name']: deployment for deployment in deployments}
+        missing = [name for name in names if name not in by_name]
+        if missing:
+            raise Exception(f"Deployment(s) not found in {self.namespace}: {', '.join(missing)}")
+        return [by_name[name] for name in names]
+
+    def restart_deployments(self, label_selector: str, names: Optional[List[str]] = None) -> Dict[str, int]:
+        """Trigger a rolling restart of matching (or the named) Deployments, returning name -> new generation"""
+        if not names:
+            names = list(iter_k8s_items(
+                self.apps_api.list_namespaced_deployment,
+                lambda deployment: deployment['metadata']['name'],
+                namespace=self.namespace,
+                label_selector=label_selector
+            ))
+
+        restarted_at = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        patch = {
+            'spec': {'template': {'metadata': {'annotations': {
+                'kubectl.kubernetes.io/restartedAt': restarted_at
+            }}}}
+        }
+
+        generations = {}
+        for name in names:
+            with tracing.client_span('kubernetes', 'patch_namespaced_deployment',
+                                     {'k8s.namespace': self.namespace, 'k8s.deployment': name}):
+                patched = _k8s_json(self.apps_api.patch_namespaced_deployment(
+                    name=name, namespace=self.namespace, body=patch, _preload_content=False
+                ))
+            generations[name] = patched['metadata']['generation']
+            logger.info(f"Restarted Deployment {name} (generation {generations[name]})")
+
+        return generations
+
+    def wait_for_deployment_rollout(self, name: str, generation: int) -> dict:
+        """Wait until a Deployment has fully rolled out the given generation"""
+
+        def rolled_out(obj: dict) -> bool:
+            spec = obj.get('spec') or {}
+            status = obj.get('status') or {}
+
+            for condition in status.get('conditions') or []:
+                if condition.get('type') == 'Progressing' and condition.get('reason') == 'ProgressDeadlineExceeded':
+                    raise Exception(f"Deployment {name} exceeded its progress deadline")
+
+            if status.get('observedGeneration', 0) < generation:
+                return False
+
+            desired = spec.get('replicas', 1)
+            updated = status.get('updatedReplicas', 0)
+            available = status.get('availableReplicas', 0)
+            total = status.get('replicas', 0)
+
+            # Same criteria as `kubectl rollout status`
+            return updated >= desired and total <= updated and available >= updated
+
+        obj = self._watch_until(
+            self.apps_api.list_namespaced_deployment,
+            rolled_out,
+            f"Deployment {name} rollout",
+            namespace=self.namespace,
+            field_selector=f"metadata.name={name}"
+        )
+        logger.info(f"Deployment {name} rolled out: "
+                    f"{obj['status'].get('availableReplicas', 0)} replicas available")
+        return obj
+
+    def list_pods(self, selector: Dict[str, str]) -> List[dict]:
+        """Name, creation time and readiness of the pods a Deployment selects, oldest first"""
+        pods = iter_k8s_items(
+            self.core_api.list_namespaced_pod,
+            lambda pod: {'name': pod['metadata']['name'],
+                         'created': pod['metadata'].get('creationTimestamp') or '',
+                         'ready': _pod_ready(pod)},
+            namespace=self.namespace,
+            label_selector=format_label_selector(selector)
+        )
+        return sorted(pods, key=lambda pod: (pod['created'], pod['name']))
+
+    def disruptions_allowed(self, pod_labels: Dict[str, str]) -> Optional[int]:
+        """Disruptions the strictest PodDisruptionBudget covering these pods allows now, or None if none does"""
+        allowed = [
+            (budget.get('status') or {}).get('disruptionsAllowed', 0)
+            for budget in iter_k8s_items(self.policy_api.list_namespaced_pod_disruption_budget,
+                                         namespace=self.namespace)
+            if _selects((budget.get('spec') or {}).get('selector') or {}, pod_labels)
+        ]
+        return min(allowed) if allowed else None
+
+    def evict_pod(self, name: str) -> bool:
+        """Evict a pod through the Eviction API; returns False if a PodDisruptionBudget refused it
+
+        A pod that no longer exists counts as evicted.
+        """
+        body = {'apiVersion': 'policy/v1', 'kind': 'Eviction',
+                'metadata': {'name': name, 'namespace': self.namespace}}
+        try:
+            with tracing.client_span('kubernetes', 'create_namespaced_pod_eviction',
+                                     {'k8s.namespace': self.namespace, 'k8s.pod': name}):
+                self.core_api.create_namespaced_pod_eviction(
+                    name=name, namespace=self.namespace, body=body, _preload_content=False
+                ).release_conn()
+            return True
+        except backends.api_exception() as e:
+            if e.status == 404:
+                return True
+            if e.status == 429:
+                return False
+            raise
+
+    def wait_for_pods_replaced(self, selector: Dict[str, str], evicted: Iterable[str], replicas: int):
+        """Wait until every evicted pod is gone and replicas selected pods are Ready"""
+        evicted: Set[str] = set(evicted)
+
+        def replaced(pods: Dict[str, dict]) -> bool:
+            if evicted & set(pods):
+                return False
+            return sum(1 for pod in pods.values() if _pod_ready(pod)) >= replicas
+
+        self._watch_collection_until(
+            self.core_api.list_namespaced_pod,
+            replaced,
+            f"{len(evicted)} evicted pod(s) to be replaced",
+            namespace=self.namespace,
+            label_selector=format_label_selector(selector)
+        )
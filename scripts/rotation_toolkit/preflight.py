@@ -0,0 +1,129 @@
+"""
+Read-only pre-flight checks: every permission a rotation needs, asked of Vault, Kubernetes and SQL Server at once
+"""
+
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from . import tracing
+from .journal import JOURNAL_SUFFIX
+from .kube import EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, RolloutTracker
+from .sql import PREFLIGHT_SQL, SQLSession, quote_identifier
+from .standby import STANDBY_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# hvac's default KV v2 mount, which VaultSecretStore uses
+KV_MOUNT_POINT = 'secret'
+
+# (API group, resource, subresource, verb) the rotation uses, and those only wave rollouts add
+KUBERNETES_REQUIREMENTS = (
+    (EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, '', 'get'),
+    (EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, '', 'patch'),
+    (EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, '', 'list'),
+    (EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, '', 'watch'),
+    ('', 'secrets', '', 'get'),
+    ('', 'secrets', '', 'list'),
+    ('', 'secrets', '', 'watch'),
+    ('apps', 'deployments', '', 'list'),
+    ('apps', 'deployments', '', 'watch'),
+    ('apps', 'deployments', '', 'patch'),
+)
+WAVE_KUBERNETES_REQUIREMENTS = (
+    ('', 'pods', '', 'list'),
+    ('', 'pods', '', 'watch'),
+    ('', 'pods', 'eviction', 'create'),
+    ('policy', 'poddisruptionbudgets', '', 'list'),
+)
+
+
+def vault_requirements(secret_path: str, standby: bool = False) -> Dict[str, Tuple[str, ...]]:
+    """Vault capabilities needed on each path: the secret and its metadata, the journal and the standby pool"""
+    required = {
+        f"{KV_MOUNT_POINT}/data/{secret_path}": ('read', 'update'),
+        f"{KV_MOUNT_POINT}/metadata/{secret_path}": ('read', 'update'),
+        f"{KV_MOUNT_POINT}/data/{secret_path}{JOURNAL_SUFFIX}": ('read', 'create', 'update'),
+    }
+    if standby:
+        required[f"{KV_MOUNT_POINT}/data/{secret_path}{STANDBY_SUFFIX}"] = ('read', 'create', 'update')
+    return required
+
+
+def check_vault(vault_client, required: Dict[str, Tuple[str, ...]]) -> List[str]:
+    """Missing capabilities, from one capabilities-self request for every path"""
+    with tracing.client_span('vault', 'capabilities-self', {'vault.paths': len(required)}):
+        response = vault_client.sys.get_capabilities(paths=list(required))
+    granted = response.get('data') or response
+
+    missing = []
+    for path, capabilities in required.items():
+        held = set(granted.get(path) or ())
+        if 'root' in held:
+            continue
+        if 'deny' in held:
+            held = set()
+        lacking = [capability for capability in capabilities if capability not in held]
+        if lacking:
+            missing.append(f"Vault: {', '.join(lacking)} on {path}")
+    return missing
+
+
+def check_kubernetes(tracker: RolloutTracker, group: str, resource: str, subresource: str,
+                     verb: str) -> List[str]:
+    """A one-item list if the SelfSubjectAccessReview for one verb is denied"""
+    if tracker.can_i(verb, resource, group, subresource):
+        return []
+    qualified = f"{resource}/{subresource}" if subresource else resource
+    if group:
+        qualified = f"{qualified}.{group}"
+    return [f"Kubernetes: {verb} {qualified} in namespace {tracker.namespace}"]
+
+
+def check_sql(session: SQLSession, database: str, login: str) -> Tuple[List[str], List[str]]:
+    """(missing, warnings) from one HAS_PERMS_BY_NAME batch run as the session's login"""
+    rows = session.execute(f"USE {quote_identifier(database)};\n{PREFLIGHT_SQL}", operation='preflight')
+    missing, warnings = [], []
+    for permission, granted, required in rows:
+        if granted:
+            continue
+        if required:
+            missing.append(f"SQL Server: {permission} for login {login}")
+        else:
+            warnings.append(f"SQL Server: {permission} for login {login}")
+    return missing, warnings
+
+
+def run_preflight(vault_client, tracker: RolloutTracker, session: SQLSession, login: str, secret_path: str,
+                  database: str, standby: bool = False, waves: bool = False,
+                  max_workers: Optional[int] = None) -> Dict:
+    """Run every check concurrently; returns what is missing, warnings and the elapsed seconds
+
+    Nothing is written anywhere: Vault gets one capabilities-self request,
+    the API server one SelfSubjectAccessReview per verb and SQL Server one
+    batch. A check that errors is reported as missing, with its error.
+    """
+    checks = {'Vault capabilities': lambda: check_vault(vault_client, vault_requirements(secret_path, standby)),
+              'SQL Server permissions': lambda: check_sql(session, database, login)}
+    for requirement in KUBERNETES_REQUIREMENTS + (WAVE_KUBERNETES_REQUIREMENTS if waves else ()):
+        checks[f"Kubernetes {requirement[3]} {requirement[1]}"] = (
+            lambda requirement=requirement: check_kubernetes(tracker, *requirement))
+
+    started = time.monotonic()
+    missing, warnings = [], []
+    with ThreadPoolExecutor(max_workers=max_workers or len(checks), thread_name_prefix='preflight') as executor:
+        futures = {name: executor.submit(contextvars.copy_context().run, check) for name, check in checks.items()}
+        for name, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                missing.append(f"{name}: check failed: {e}")
+                continue
+            if isinstance(result, tuple):
+                result, result_warnings = result
+                warnings.extend(result_warnings)
+            missing.extend(result)
+
+    return {'missing': missing, 'warnings': warnings, 'seconds': round(time.monotonic() - started, 3)}
@@ -0,0 +1,154 @@
+"""
+Capacity probe: load-test a login at the application's connection demand before Vault is switched to it
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from . import backends
+from .connection import parse_connection_string
+from .stats import percentile
+
+logger = logging.getLogger(__name__)
+
+# SqlClient's pool size when a connection string does not set Max Pool Size
+DEFAULT_MAX_POOL_SIZE = 100
+
+# A catalog read in the application database: every login cloned from the
+# current one sees the same objects, so both logins do the same work
+DEFAULT_PROBE_QUERY = """
+SELECT TOP (100) s.name, o.name, o.type_desc, o.modify_date
+FROM sys.objects o
+JOIN sys.schemas s ON s.schema_id = o.schema_id
+ORDER BY o.modify_date DESC;
+"""
+
+PROBE_MAX_CONNECTIONS = 200
+PROBE_QUERIES_PER_CONNECTION = 5
+PROBE_PERCENTILES = (50, 95, 99)
+
+# Allowed slowdown of the new login against the current one, as a fraction plus a floor for timer noise
+PROBE_BUDGET = 0.5
+PROBE_NOISE_FLOOR_MS = 5.0
+
+
+def pool_demand(connection_strings: Iterable[str], replicas: int) -> int:
+    """Connections the application can hold open: one pool per distinct connection string in every pod
+
+    A Max Pool Size that is not a number counts as SqlClient's default.
+    """
+    per_pod = 0
+    for conn_str in set(connection_strings):
+        components = parse_connection_string(conn_str)
+        max_pool_size = (components.get('max pool size') or '').strip()
+        if components.get('pooling', 'true').strip().lower() in ('false', 'no'):
+            per_pod += 1
+        elif not max_pool_size:
+            per_pod += DEFAULT_MAX_POOL_SIZE
+        else:
+            try:
+                per_pod += int(max_pool_size)
+            except ValueError:
+                logger.warning(f"Max Pool Size '{max_pool_size}' is not a number - "
+                               f"counting the default of {DEFAULT_MAX_POOL_SIZE}")
+                per_pod += DEFAULT_MAX_POOL_SIZE
+    return per_pod * max(replicas, 1)
+
+
+def probe_login(conn_str: str, connections: int, queries: Sequence[str] = (DEFAULT_PROBE_QUERY,),
+                queries_per_connection: int = PROBE_QUERIES_PER_CONNECTION, timeout: int = 10) -> Dict:
+    """Open `connections` connections at once as one login and run the read workload on each
+
+    Every connection is held open until all of them have connected (or
+    failed to), so the server sees the full concurrency before any query
+    runs. Returns the connection and query counts, the errors seen and the
+    connect-time and query-latency percentiles in milliseconds.
+    """
+    pyodbc = backends.pyodbc()
+    all_open = threading.Barrier(connections)
+    connect_ms, query_ms, errors = [], [], []
+    lock = threading.Lock()
+
+    def record(samples: List[float], started: float):
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            samples.append(elapsed)
+
+    def worker(index: int):
+        conn = None
+        started = time.perf_counter()
+        try:
+            conn = pyodbc.connect(conn_str, timeout=timeout, autocommit=True)
+            record(connect_ms, started)
+        except pyodbc.Error as e:
+            with lock:
+                errors.append(f"connect: {e}")
+        try:
+            all_open.wait(timeout)
+        except threading.BrokenBarrierError:
+            pass
+        if conn is None:
+            return
+
+        try:
+            cursor = conn.cursor()
+            for i in range(queries_per_connection):
+                started = time.perf_counter()
+                cursor.execute(queries[(index + i) % len(queries)])
+                cursor.fetchall()
+                record(query_ms, started)
+            cursor.close()
+        except pyodbc.Error as e:
+            with lock:
+                errors.append(f"query: {e}")
+        finally:
+            conn.close()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix='probe') as executor:
+        list(executor.map(worker, range(connections)))
+
+    connect_ms.sort()
+    query_ms.sort()
+    return {
+        'connections': connections,
+        'connected': len(connect_ms),
+        'queries': len(query_ms),
+        'errors': errors,
+        'connect_ms': {f"p{p}": percentile(connect_ms, p) for p in PROBE_PERCENTILES},
+        'query_ms': {f"p{p}": percentile(query_ms, p) for p in PROBE_PERCENTILES},
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+def compare_probes(current: Dict, new: Dict, budget: float = PROBE_BUDGET,
+                   noise_floor_ms: float = PROBE_NOISE_FLOOR_MS) -> List[str]:
+    """One message for each way the new login did worse than the current one beyond the budget"""
+    problems = []
+    if new['connected'] < current['connected']:
+        problems.append(f"{new['connected']}/{new['connections']} connections opened "
+                        f"(current login: {current['connected']})")
+    if new['queries'] < current['queries']:
+        problems.append(f"{new['queries']} queries completed (current login: {current['queries']})")
+    for metric, label in (('connect_ms', 'connect time'), ('query_ms', 'query latency')):
+        for name, value in new[metric].items():
+            base = current[metric].get(name)
+            if value is None or base is None:
+                continue
+            if value > base * (1 + budget) + noise_floor_ms:
+                problems.append(f"{label} {name} {value:.1f} ms (current login: {base:.1f} ms)")
+    return problems
+
+
+def format_probe(result: Dict) -> str:
+    """One-line summary of a probe for the log"""
+    def spread(values: Dict[str, Optional[float]]) -> str:
+        return '/'.join('-' if value is None else f"{value:.1f}" for value in values.values())
+
+    names = '/'.join(result['connect_ms'])
+    return (f"{result['connected']}/{result['connections']} connected, {result['queries']} queries, "
+            f"{len(result['errors'])} error(s) in {result['seconds']:g}s; "
+            f"connect {names} {spread(result['connect_ms'])} ms, query {names} {spread(result['query_ms'])} ms")
@@ -0,0 +1,114 @@
+"""
+Always On availability group replicas: the same login, with the same SID, on every secondary
+"""
+
+import contextvars
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .connection import ConnectionString
+from .sql import (DROP_LOGIN_SQL, REPLICA_DISCOVERY_SQL, REPLICA_LOGIN_SQL, REPLICA_VERIFY_SQL, SQLSession,
+                  quote_identifier)
+
+logger = logging.getLogger(__name__)
+
+# TCP://host:port, as in read_only_routing_url
+ROUTING_URL = re.compile(r'^tcp://(?P<host>[^:/]+)(?::(?P<port>\d+))?/?$', re.IGNORECASE)
+
+
+def replica_address(replica_server_name: str, read_only_routing_url: Optional[str] = None) -> str:
+    """The Server value that reaches a replica: its read-only routing address if it has one, else its name"""
+    match = ROUTING_URL.match((read_only_routing_url or '').strip())
+    if match:
+        return match.group('host') + (f",{match.group('port')}" if match.group('port') else '')
+    return replica_server_name
+
+
+def discover_replicas(session: SQLSession, database: str, login: str,
+                      discover: bool = True) -> Tuple[bytes, Optional[bytes], List[str]]:
+    """(SID, password hash or None, addresses of the other replicas) of login, read on the primary
+
+    Raises if the login does not exist. Without discovery, or outside an
+    availability group, the replica list is empty.
+    """
+    rows = session.execute(f"USE {quote_identifier(database)};\n{REPLICA_DISCOVERY_SQL}", (login, discover),
+                           operation='discover replicas')
+    if not rows:
+        raise Exception(f"Login {login} not found on the primary")
+    sid, password_hash = rows[0][0], rows[0][1]
+    addresses = [replica_address(name, url) for _, _, name, url in rows if name]
+    return bytes(sid), bytes(password_hash) if password_hash else None, addresses
+
+
+def on_replica(credentials: ConnectionString, address: str, database: Optional[str] = None,
+               read_only: bool = False) -> ConnectionString:
+    """credentials pointed at one replica, optionally in another database or with read-only intent"""
+    updated = credentials.copy()
+    values = {'server': address}
+    if database is not None:
+        values['database'] = database
+    if read_only:
+        values['ApplicationIntent'] = 'ReadOnly'
+    updated.update(values)
+    return updated
+
+
+def fan_out(replicas: Sequence[str], func: Callable[[str], None], description: str) -> Dict[str, str]:
+    """Run func(address) for every replica at once; returns the error of each replica that failed"""
+    errors = {}
+    if not replicas:
+        return errors
+    with ThreadPoolExecutor(max_workers=len(replicas), thread_name_prefix='replica') as executor:
+        futures = {address: executor.submit(contextvars.copy_context().run, func, address) for address in replicas}
+        for address, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                errors[address] = str(e)
+                logger.error(f"{description} on replica {address} failed: {e}")
+    return errors
+
+
+def provision_replica_login(admin: ConnectionString, credentials: ConnectionString, address: str, sid: bytes,
+                            password_hash: Optional[bytes]):
+    """Create credentials' login on one replica with the primary's SID, then log in with it to verify
+
+    admin is the login that creates it. The check connects to the
+    application database with read-only intent, as read-routed application
+    connections do, so it fails unless the replicated database user maps to
+    the new login.
+    """
+    username, password = credentials['user_id'], credentials['password']
+    session = SQLSession(str(on_replica(admin, address, database='master')))
+    try:
+        session.execute(REPLICA_LOGIN_SQL, (username, password, password_hash, sid), operation='replica login')
+    finally:
+        session.close()
+
+    session = SQLSession(str(on_replica(credentials, address, read_only=True)))
+    try:
+        rows = session.execute(REPLICA_VERIFY_SQL, operation='replica login check')
+    finally:
+        session.close()
+    if not rows or bytes(rows[0][0]) != sid:
+        raise Exception(f"Login {username} has a different SID on the replica")
+
+
+def drop_replica_login(credentials: ConnectionString, address: str, username: str,
+                       drained: Callable[[SQLSession], bool]) -> bool:
+    """Drop a login on one replica once no session uses it there; its database user goes with the primary's
+
+    drained(session) is given a session in the replica's master database and
+    waits for the login's sessions on that replica to close. If it returns
+    False the login is kept, and so is False.
+    """
+    session = SQLSession(str(on_replica(credentials, address, database='master')))
+    try:
+        if not drained(session):
+            return False
+        session.execute(DROP_LOGIN_SQL, (username,), operation='replica drop login')
+        return True
+    finally:
+        session.close()
@@ -0,0 +1,1065 @@
+"""
+SQL Server credential rotation and rollback for one Vault secret
+"""
+
+import json
+import logging
+import re
+import secrets
+import string
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from . import tracing
+from .connection import APP_CONNECTION_STRING_KEYS, ConnectionString, build_connection_string, parse_connection_string
+from .journal import RotationJournal
+from .kube import (EXTERNAL_SECRET_GROUP, EXTERNAL_SECRET_PLURAL, EXTERNAL_SECRET_VERSION,
+                   RolloutTracker, new_api_client)
+from .preflight import run_preflight
+from .probe import (DEFAULT_PROBE_QUERY, PROBE_BUDGET, PROBE_MAX_CONNECTIONS, compare_probes, format_probe,
+                    pool_demand, probe_login)
+from .replicas import discover_replicas, drop_replica_login, fan_out, provision_replica_login
+from .standby import StandbyPool
+from .sql import (DROP_LOGIN_SQL, PROVISION_LOGIN_SQL, SESSION_COUNT_SQL, SQL_LOAD_SQL, TRAFFIC_SQL, SQLSession,
+                  quote_identifier)
+from .traffic import QUIET_DEADLINE, QUIET_INTERVAL, QUIET_WINDOW, QuietWindowScheduler, format_traffic
+from .vault import (LEGACY_BACKUP_TIMESTAMP, ROTATION_INDEX_PREFIX, ROTATION_INDEX_SIZE,
+                    VaultSecretStore, connect_vault, parse_rotation_index)
+from .waves import WaveRollout
+
+logger = logging.getLogger(__name__)
+
+# Session drain polling: fast while sessions are closing, backing off while the count is stuck
+DRAIN_POLL_MIN = 0.25
+DRAIN_POLL_MAX = 5.0
+
+
+class SQLCredentialRotator:
+    def __init__(self, vault_url: str, vault_token: str, secret_path: str,
+                 sql_server: str, database: str = "WorkoutTrackerWeb",
+                 namespace: str = "default", app_label: str = "workouttracker",
+                 external_secret_name: str = "workouttracker-secrets",
+                 rollout_timeout: int = 300, drain_timeout: float = 300,
+                 tracer: Optional[tracing.Tracer] = None, target_name: Optional[str] = None,
+                 resume: bool = True, standby_pool_size: int = 0,
+                 deployments: Optional[List[str]] = None, wave_size: int = 0, wave_pause: float = 0,
+                 max_login_rate: Optional[float] = None, max_sql_sessions: Optional[int] = None,
+                 capacity_probe: bool = False, probe_max_connections: int = PROBE_MAX_CONNECTIONS,
+                 probe_queries: Optional[List[str]] = None, probe_budget: float = PROBE_BUDGET,
+                 preflight: bool = True, replicas: Optional[List[str]] = None, replica_discovery: bool = True,
+                 wait_for_quiet: bool = False, quiet_window: float = QUIET_WINDOW,
+                 quiet_interval: float = QUIET_INTERVAL, quiet_deadline: float = QUIET_DEADLINE,
+                 quiet_max_sessions: Optional[float] = None, quiet_max_requests: Optional[float] = None,
+                 quiet_max_transactions: Optional[float] = None, skip_if_busy: bool = False):
+        self.vault_url = vault_url
+        self.vault_token = vault_token
+        self.secret_path = secret_path
+        self.sql_server = sql_server
+        self.database = database
+        self.namespace = namespace
+        self.app_label = app_label
+        self.external_secret_name = external_secret_name
+        self.rollout_timeout = rollout_timeout
+        self.drain_timeout = drain_timeout
+        self.tracer = tracer or tracing.Tracer()
+        self.target_name = target_name or secret_path
+        self.resume = resume
+        self.standby_pool_size = standby_pool_size
+        self.deployments = deployments or None
+        self.wave_size = wave_size
+        self.wave_pause = wave_pause
+        self.max_login_rate = max_login_rate
+        self.max_sql_sessions = max_sql_sessions
+        self.capacity_probe = capacity_probe
+        self.probe_max_connections = probe_max_connections
+        self.probe_queries = probe_queries or [DEFAULT_PROBE_QUERY]
+        self.probe_budget = probe_budget
+        self.preflight = preflight
+        self.replicas = replicas or []
+        self.replica_discovery = replica_discovery
+        self.replica_addresses = None
+        self.wait_for_quiet = wait_for_quiet
+        self.quiet_window = quiet_window
+        self.quiet_interval = quiet_interval
+        self.quiet_deadline = quiet_deadline
+        self.quiet_max_sessions = quiet_max_sessions
+        self.quiet_max_requests = quiet_max_requests
+        self.quiet_max_transactions = quiet_max_transactions
+        self.skip_if_busy = skip_if_busy
+        self.vault_client = None
+        self.api_client = None
+        self.rollout_tracker = None
+        self.vault_store = None
+        self.journal = None
+        self.standby_pool = None
+        self.sql_sessions = {}
+        self.current_credentials = None
+        self.new_credentials = None
+        self.timings = {}
+        
+    def initialize_clients(self, vault_client=None, api_client=None):
+        """Initialize the Vault client, reusing shared clients when given
+
+        Kubernetes is only set up by initialize_kubernetes once a run gets past
+        the point where it needs the cluster, so rollbacks and dry runs
+        without pre-flight checks never load the kubernetes client.
+        """
+        try:
+            # Initialize Vault client
+            if vault_client is not None:
+                self.vault_client = vault_client
+            else:
+                self.vault_client = connect_vault(self.vault_url, self.vault_token)
+            self.vault_store = VaultSecretStore(self.vault_client)
+            self.journal = RotationJournal(self.vault_store, self.secret_path)
+            self.standby_pool = StandbyPool(self.vault_store, self.secret_path)
+            self.api_client = api_client
+
+            logger.info("Successfully initialized Vault client")
+            
+        except Exception as e:
+            logger.error(f"Failed to initialize clients: {e}")
+            raise
+
+    def initialize_kubernetes(self):
+        """Initialize the Kubernetes client and rollout tracker on first use"""
+        if self.rollout_tracker is None:
+            if self.api_client is None:
+                self.api_client = new_api_client()
+            self.rollout_tracker = RolloutTracker(self.namespace, self.rollout_timeout, self.api_client)
+            logger.info("Successfully initialized Kubernetes client")
+        return self.rollout_tracker
+
+    def generate_secure_password(self, length: int = 16) -> str:
+        """Generate a secure password for SQL Server"""
+        # SQL Server password requirements:
+        # - At least 8 characters
+        # - Must contain characters from at least 3 of these 4 categories:
+        #   - Uppercase letters
+        #   - Lowercase letters  
+        #   - Numbers
+        #   - Special characters
+        
+        uppercase = string.ascii_uppercase
+        lowercase = string.ascii_lowercase
+        digits = string.digits
+        special = "!@#$%^&*"
+        
+        # Ensure at least one character from each category
+        password = [
+            secrets.choice(uppercase),
+            secrets.choice(lowercase),
+            secrets.choice(digits),
+            secrets.choice(special)
+        ]
+        
+        # Fill the rest with random characters from all categories
+        all_chars = uppercase + lowercase + digits + special
+        for _ in range(length - 4):
+            password.append(secrets.choice(all_chars))
+            
+        # Shuffle the password
+        secrets.SystemRandom().shuffle(password)
+        
+        return ''.join(password)
+
+    def generate_username(self, current_username: str, taken=()) -> str:
+        """Name a new login after the current one's prefix and the current minute
+
+        The name sorts after the current login and every name in taken, so a
+        dropped login's name is never issued again as long as taken holds the
+        rotation index's names (see indexed_usernames).
+        """
+        prefix = current_username.split('.')[0]
+        moment = datetime.now().replace(second=0, microsecond=0)
+        for username in (current_username, *taken):
+            match = re.fullmatch(rf'{re.escape(prefix)}\.(\d{{12}})', username)
+            if match:
+                moment = max(moment, datetime.strptime(match.group(1), '%Y%m%d%H%M') + timedelta(minutes=1))
+        return f"{prefix}.{moment.strftime('%Y%m%d%H%M')}"
+
+    def indexed_usernames(self) -> List[str]:
+        """Login names in the rotation index, which a new login's name must sort after
+
+        After a rollback the current login is older than logins the index
+        still lists; without them the next name could repeat one of those.
+        """
+        try:
+            index, _ = self.load_rotation_index()
+        except Exception as e:
+            logger.warning(f"Cannot read the rotation index to rule out reused login names: {e}")
+            return []
+        return [entry['username'] for entry in index.values() if entry.get('username')]
+
+    def get_current_credentials(self) -> ConnectionString:
+        """Retrieve current credentials from Vault"""
+        try:
+            data, version = self.vault_store.read(self.secret_path)
+            
+            connection_string = data['ConnectionStrings__WorkoutTrackerWebContext']
+            credentials = parse_connection_string(connection_string)
+            
+            logger.info(f"Successfully retrieved current credentials from Vault (version {version})")
+            return credentials
+            
+        except Exception as e:
+            logger.error(f"Failed to retrieve current credentials: {e}")
+            raise
+
+    def get_sql_session(self, credentials: ConnectionString) -> SQLSession:
+        """Get the shared session for the principal in credentials, opening it if needed"""
+        username = credentials['user_id']
+        session = self.sql_sessions.get(username)
+        if session is None:
+            session = SQLSession(build_connection_string(credentials))
+            self.sql_sessions[username] = session
+        return session
+
+    def close_sql_session(self, username: str):
+        """Close the session held for a principal, e.g. before dropping its login"""
+        session = self.sql_sessions.pop(username, None)
+        if session is not None:
+            session.close()
+
+    def close_sql_sessions(self):
+        """Close every session opened during this run"""
+        for username in list(self.sql_sessions):
+            self.close_sql_session(username)
+
+    def run_preflight_checks(self) -> bool:
+        """Check every Vault, Kubernetes and SQL Server permission the run needs, at once and read-only"""
+        result = run_preflight(self.vault_client, self.rollout_tracker, self.get_sql_session(self.current_credentials),
+                               self.current_credentials['user_id'], self.secret_path, self.database,
+                               standby=bool(self.standby_pool_size), waves=bool(self.wave_size))
+        for warning in result['warnings']:
+            logger.warning(f"Pre-flight: optional permission missing - {warning}")
+        if result['missing']:
+            logger.error(f"Pre-flight found {len(result['missing'])} missing permission(s) "
+                         f"in {result['seconds']:g}s:")
+            for missing in result['missing']:
+                logger.error(f"  {missing}")
+            return False
+        logger.info(f"Pre-flight checks passed in {result['seconds']:g}s")
+        return True
+
+    def sample_traffic(self) -> Optional[Tuple[int, int, int]]:
+        """Return (cumulative transactions, active sessions, open transactions), or None without VIEW SERVER STATE
+
+        The transaction count is the application database's; sessions and
+        open transactions are those of the application's login.
+        """
+        rows = self.get_sql_session(self.current_credentials).execute(
+            f"USE {quote_identifier(self.database)};\n{TRAFFIC_SQL}", (self.current_credentials['user_id'],),
+            operation='traffic sample'
+        )
+        can_view, transactions, active_sessions, open_transactions = rows[0]
+        if not can_view:
+            return None
+        return transactions or 0, active_sessions, open_transactions
+
+    def wait_for_quiet_window(self, dry_run: bool = False) -> bool:
+        """Defer the start until a whole quiet_window of SQL Server traffic is under the quiet_max_* limits
+
+        Gives up waiting after quiet_deadline seconds: the rotation then
+        starts anyway, or with skip_if_busy this returns False. A dry run
+        does not wait; it takes one sample and reports it.
+        """
+        if all(limit is None for limit in (self.quiet_max_sessions, self.quiet_max_requests,
+                                           self.quiet_max_transactions)):
+            logger.warning("No quiet limits set - starting now")
+            return True
+
+        scheduler = QuietWindowScheduler(self.sample_traffic, self.quiet_max_sessions, self.quiet_max_requests,
+                                         self.quiet_max_transactions, window=self.quiet_window,
+                                         interval=self.quiet_interval, deadline=self.quiet_deadline)
+        if dry_run:
+            result = scheduler.sample_now()
+            if result is None:
+                logger.info("DRY RUN: Cannot see SQL Server traffic (VIEW SERVER STATE missing) - would start now")
+            else:
+                state = {True: 'quiet', False: 'busy', None: 'sampled'}[result['quiet']]
+                logger.info(f"DRY RUN: SQL Server {state} now - {format_traffic(result['load'], scheduler.thresholds)}; "
+                            f"would wait up to {self.quiet_deadline:g}s for {self.quiet_window:g}s of quiet traffic")
+            return True
+
+        logger.info(f"Waiting for {self.quiet_window:g}s of quiet SQL Server traffic "
+                    f"(deadline {self.quiet_deadline:g}s)")
+        result = scheduler.wait()
+        if result['quiet'] is None:
+            logger.warning("Cannot see SQL Server traffic (VIEW SERVER STATE missing) - starting now")
+            return True
+
+        summary = format_traffic(result['load'], scheduler.thresholds)
+        if result['quiet']:
+            logger.info(f"SQL Server quiet after {result['waited']:g}s - {summary}")
+            return True
+        logger.warning(f"SQL Server still busy after {result['waited']:g}s ({result['windows']} window(s)); "
+                       f"quietest window: {summary}")
+        if self.skip_if_busy:
+            return False
+        logger.warning("Quiet deadline reached - starting the rotation anyway")
+        return True
+
+    def test_sql_connection(self, credentials: ConnectionString) -> bool:
+        """Test SQL Server connection with given credentials"""
+        try:
+            self.get_sql_session(credentials).execute("SELECT 1", operation='connection test')
+
+            logger.info("SQL connection test successful")
+            return True
+
+        except Exception as e:
+            logger.error(f"SQL connection test failed: {e}")
+            return False
+
+    def create_new_sql_user(self, current_creds: ConnectionString, new_username: str, new_password: str) -> bool:
+        """Create new SQL Server user with same permissions as current user"""
+        try:
+            # Input validation for security
+            if not re.match(r'^[a-zA-Z0-9_.@-]+$', new_username):
+                raise ValueError(f"Invalid username format: {new_username}")
+
+            if len(new_password) < 8 or len(new_password) > 128:
+                raise ValueError("Password length must be between 8 and 128 characters")
+
+            # Login, user, privilege snapshot and diff, the missing grants and the
+            # verification go to the server as one transactional batch; identifiers
+            # are quoted server-side with QUOTENAME
+            session = self.get_sql_session(current_creds)
+            rows = session.execute(
+                f"USE {quote_identifier(self.database)};\n{PROVISION_LOGIN_SQL}",
+                (new_username, new_password, current_creds['user_id']),
+                operation='provision login'
+            )
+            role_count, permission_count, applied_count, extra_count = rows[0]
+
+            logger.info(f"Successfully created new SQL user: {new_username} "
+                        f"({role_count} role(s), {permission_count} permission(s) verified, "
+                        f"{applied_count} applied)")
+            if extra_count:
+                logger.warning(f"{new_username} holds {extra_count} privilege(s) the current user does not")
+            return self.provision_replicas(current_creds, new_username, new_password)
+
+        except Exception as e:
+            logger.error(f"Failed to create new SQL user: {e}")
+            return False
+
+    def provision_replicas(self, current_creds: ConnectionString, new_username: str, new_password: str) -> bool:
+        """Create the new login on every other availability group replica at once, with the primary's SID
+
+        The replicas are the other replicas of the database's availability
+        group plus any given explicitly. The login gets the SID it has on the
+        primary, so the database user, which the group replicates, maps to it
+        on every secondary; it also gets the primary's password hash when the
+        current login may read it (CONTROL SERVER), else the same password.
+        Every replica is then checked by logging in as the new login with
+        read-only intent, again all at once.
+        """
+        sid, password_hash, discovered = discover_replicas(self.get_sql_session(current_creds), self.database,
+                                                           new_username, self.replica_discovery)
+        self.replica_addresses = list(dict.fromkeys(discovered + self.replicas))
+        if not self.replica_addresses:
+            return True
+
+        new_creds = current_creds.with_credentials(new_username, new_password)
+        errors = fan_out(self.replica_addresses,
+                         lambda address: provision_replica_login(current_creds, new_creds, address, sid, password_hash),
+                         f"Creating login {new_username}")
+        if errors:
+            return False
+        logger.info(f"Login {new_username} created and verified on {len(self.replica_addresses)} replica(s) "
+                    f"with SID 0x{sid.hex()}" + ("" if password_hash else " (password set, hash not readable)"))
+        return True
+
+    def availability_replicas(self) -> List[str]:
+        """Addresses of the other replicas, discovered through the new login if this run has not yet"""
+        if self.replica_addresses is None:
+            _, _, discovered = discover_replicas(self.get_sql_session(self.new_credentials), self.database,
+                                                 self.new_credentials['user_id'], self.replica_discovery)
+            self.replica_addresses = list(dict.fromkeys(discovered + self.replicas))
+        return self.replica_addresses
+
+    def replenish_standby_pool(self, credentials: ConnectionString) -> int:
+        """Provision and verify standby logins cloned from credentials until the pool is full
+
+        Standbys an interrupted top-up left pending are retried first. Returns
+        the number of standbys verified by this call.
+        """
+        pool = self.standby_pool
+        pool.load()
+        source_user = credentials['user_id']
+        verified = 0
+
+        for login in pool.pending:
+            if not self.provision_standby(credentials, login['username'], login['password']):
+                return verified
+            verified += 1
+
+        indexed = self.indexed_usernames() if len(pool.logins) < self.standby_pool_size else []
+        while len(pool.logins) < self.standby_pool_size:
+            username = self.generate_username(source_user, pool.usernames() + indexed)
+            password = self.generate_secure_password()
+            pool.add_pending(username, password, source_user)
+            if not self.provision_standby(credentials, username, password):
+                break
+            verified += 1
+
+        logger.info(f"Standby pool holds {len(pool.verified)} of {self.standby_pool_size} verified login(s)")
+        return verified
+
+    def provision_standby(self, credentials: ConnectionString, username: str, password: str) -> bool:
+        """Create a pending standby login, test it and mark it verified"""
+        if not self.create_new_sql_user(credentials, username, password):
+            return False
+        standby_credentials = credentials.with_credentials(username, password)
+        working = self.test_sql_connection(standby_credentials)
+        self.close_sql_session(username)
+        if not working:
+            logger.error(f"Standby login {username} does not accept connections")
+            return False
+        self.standby_pool.mark_verified(username)
+        return True
+
+    def probe_login_capacity(self) -> bool:
+        """Load-test the new login at the application's connection demand, against the current login
+
+        The demand is every Deployment's replicas times the Max Pool Size of
+        each distinct connection string in the secret, capped at
+        probe_max_connections. Both logins open that many connections at once
+        and run the probe queries; the new login passes if it opened and
+        completed as many as the current one and its connect-time and query
+        percentiles are within probe_budget of the current login's.
+        """
+        try:
+            data, _ = self.vault_store.read(self.secret_path)
+            deployments = self.rollout_tracker.describe_deployments(f"app={self.app_label}", self.deployments)
+            replicas = sum(deployment['replicas'] for deployment in deployments)
+            demand = pool_demand([data[key] for key in APP_CONNECTION_STRING_KEYS if key in data], replicas)
+            # The probe needs at least one connection, whatever the pools or the cap say
+            connections = max(1, min(demand, self.probe_max_connections))
+            logger.info(f"Capacity probe: {connections} concurrent connection(s) "
+                        f"({replicas} replica(s), demand {demand})")
+
+            results = {}
+            for role, credentials in (('current', self.current_credentials), ('new', self.new_credentials)):
+                with tracing.span('rotation.capacity_probe', {'rotation.probe.login': role,
+                                                              'rotation.probe.connections': connections}):
+                    results[role] = probe_login(build_connection_string(credentials), connections,
+                                                self.probe_queries)
+                logger.info(f"Capacity probe of {role} login {credentials['user_id']}: {format_probe(results[role])}")
+
+            problems = compare_probes(results['current'], results['new'], self.probe_budget)
+            for problem in problems:
+                logger.error(f"Capacity probe: new login {problem}")
+            return not problems
+
+        except Exception as e:
+            logger.error(f"Capacity probe failed: {e}")
+            return False
+
+    def update_vault_secret(self, new_credentials: ConnectionString, backup_old: bool = True) -> bool:
+        """Update credentials in Vault, indexing the previous version for rollback"""
+        try:
+            # The secret was read once by get_current_credentials; reuse that copy
+            current_data, current_version = self.vault_store.read(self.secret_path)
+
+            updated_data = current_data.copy()
+            new_conn_str = build_connection_string(new_credentials)
+
+            # Swap only the login in each stored string so per-app pool and timeout settings survive
+            for key in APP_CONNECTION_STRING_KEYS:
+                if key in current_data:
+                    updated_data[key] = str(parse_connection_string(current_data[key]).with_credentials(
+                        new_credentials['user_id'], new_credentials['password']))
+                else:
+                    updated_data[key] = new_conn_str
+
+            written = self.vault_store.write(self.secret_path, updated_data, cas=current_version)
+
+            logger.info(f"Successfully updated Vault secret (version {current_version} -> {written['version']})")
+
+            if backup_old:
+                # The old credentials stay in KV version history; index them for rollback
+                previous_username = parse_connection_string(
+                    current_data.get('ConnectionStrings__WorkoutTrackerWebContext', '')
+                ).get('user_id')
+                if not self.record_rotation(written['version'], new_credentials['user_id'], written['created_time'],
+                                            previous_version=current_version,
+                                            previous_username=previous_username):
+                    logger.warning(f"Rollback by username unavailable - use --rollback {current_version}")
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to update Vault secret: {e}")
+            return False
+
+    def get_target_secret_name(self) -> str:
+        """Get the name of the Kubernetes Secret the ExternalSecret writes to"""
+        external_secret = self.rollout_tracker.get_external_secret(self.external_secret_name)
+        target = (external_secret.get('spec') or {}).get('target') or {}
+        return target.get('name') or self.external_secret_name
+
+    def trigger_external_secret_refresh(self, target_secret: str, previous_version: Optional[str]) -> bool:
+        """Force the External Secret Operator to refresh and wait until the target Secret is updated"""
+        try:
+            requested_at = datetime.utcnow()
+
+            # Merge-patch only the annotation rather than sending the whole object back
+            with tracing.client_span('kubernetes', 'patch_namespaced_custom_object',
+                                     {'k8s.namespace': self.namespace}):
+                self.rollout_tracker.custom_api.patch_namespaced_custom_object(
+                    group=EXTERNAL_SECRET_GROUP,
+                    version=EXTERNAL_SECRET_VERSION,
+                    namespace=self.namespace,
+                    plural=EXTERNAL_SECRET_PLURAL,
+                    name=self.external_secret_name,
+                    body={'metadata': {'annotations': {'force-sync': str(int(time.time()))}}}
+                )
+            logger.info("Triggered external secret refresh")
+
+            self.rollout_tracker.wait_for_external_secret_sync(self.external_secret_name, requested_at)
+            self.rollout_tracker.wait_for_secret_update(target_secret, previous_version)
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to refresh external secret: {e}")
+            return False
+
+    def sample_sql_load(self) -> Optional[Tuple[int, int]]:
+        """Return SQL Server's (cumulative logins, user sessions), or None without VIEW SERVER STATE"""
+        rows = self.get_sql_session(self.new_credentials).execute(SQL_LOAD_SQL, operation='server load')
+        can_view, logins, sessions = rows[0]
+        if not can_view:
+            return None
+        return logins or 0, sessions
+
+    def wait_for_rollout(self) -> bool:
+        """Restart the application Deployments and wait for the rollout to complete
+
+        With wave_size set, pods are replaced a wave at a time within their
+        PodDisruptionBudgets and SQL Server load limits (see WaveRollout);
+        otherwise every Deployment gets a rolling restart at once.
+        """
+        try:
+            if self.wave_size:
+                deployments = self.rollout_tracker.describe_deployments(f"app={self.app_label}", self.deployments)
+                if not deployments:
+                    logger.warning(f"No Deployments found with label app={self.app_label}")
+                    return False
+
+                WaveRollout(self.rollout_tracker, self.wave_size, self.sample_sql_load,
+                            max_login_rate=self.max_login_rate, max_sessions=self.max_sql_sessions,
+                            wave_pause=self.wave_pause).run(deployments)
+
+                logger.info(f"All {len(deployments)} Deployment(s) rolled out with new credentials")
+                return True
+
+            generations = self.rollout_tracker.restart_deployments(f"app={self.app_label}", self.deployments)
+            if not generations:
+                logger.warning(f"No Deployments found with label app={self.app_label}")
+                return False
+
+            for name, generation in generations.items():
+                self.rollout_tracker.wait_for_deployment_rollout(name, generation)
+
+            logger.info(f"All {len(generations)} Deployment(s) rolled out with new credentials")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error waiting for rollout: {e}")
+            return False
+
+    def count_login_sessions(self, username: str, session: Optional[SQLSession] = None) -> Optional[Tuple[int, int]]:
+        """Return (sessions, running requests) under a login, or None if they cannot be seen
+
+        Counts on the primary, or on session's server if given. Without VIEW
+        SERVER STATE the session DMVs only show our own session, which would
+        look like a drained login.
+        """
+        rows = (session or self.get_sql_session(self.new_credentials)).execute(
+            SESSION_COUNT_SQL, (username,), operation='session count'
+        )
+        can_view, sessions, requests = rows[0]
+        if not can_view:
+            return None
+        return sessions, requests
+
+    def wait_for_session_drain(self, username: str, session: Optional[SQLSession] = None,
+                               replica: Optional[str] = None) -> bool:
+        """Wait until no session remains under a login, for at most drain_timeout seconds
+
+        Polls every DRAIN_POLL_MIN seconds while sessions are closing and backs
+        off up to DRAIN_POLL_MAX while the count does not move. Returns False if
+        sessions remain at the deadline or cannot be observed, so the caller
+        keeps the login rather than cutting live connections. With session,
+        the sessions counted are those on replica, the server it is connected to.
+        """
+        where = f" on replica {replica}" if replica else ""
+        if session is None:
+            # Our own session under the old login must not count against the drain
+            self.close_sql_session(username)
+
+        deadline = time.monotonic() + self.drain_timeout
+        interval = DRAIN_POLL_MIN
+        previous = None
+        try:
+            while True:
+                counts = self.count_login_sessions(username, session)
+                if counts is None:
+                    logger.warning(f"Cannot see other logins' sessions{where} (VIEW SERVER STATE missing) - "
+                                   f"not dropping {username}{where}")
+                    return False
+
+                sessions, requests = counts
+                if sessions == 0:
+                    logger.info(f"All sessions under {username}{where} have closed")
+                    return True
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"{sessions} session(s) ({requests} running request(s)) still open under "
+                                   f"{username}{where} after {self.drain_timeout}s")
+                    return False
+
+                if previous is None or sessions < previous:
+                    interval = DRAIN_POLL_MIN
+                    logger.info(f"Waiting for {sessions} session(s) ({requests} running request(s)) "
+                                f"under {username}{where} to close")
+                else:
+                    interval = min(interval * 2, DRAIN_POLL_MAX)
+                previous = sessions
+                time.sleep(min(interval, remaining))
+
+        except Exception as e:
+            logger.error(f"Failed to check sessions of {username}{where}: {e}")
+            return False
+
+    def cleanup_old_sql_user(self, old_username: str) -> bool:
+        """Remove old SQL Server user after successful rotation"""
+        try:
+            # Our own session under the old login would block DROP LOGIN
+            self.close_sql_session(old_username)
+
+            session = self.get_sql_session(self.new_credentials)
+            session.execute(
+                f"USE {quote_identifier(self.database)};\n{DROP_LOGIN_SQL}",
+                (old_username,),
+                operation='drop login'
+            )
+
+            logger.info(f"Successfully removed old SQL user: {old_username}")
+
+            # The primary dropped the database user; each replica still has its own login, and read-routed
+            # connections to a replica may still be using it
+            replicas = self.availability_replicas()
+            in_use = []
+
+            def drop(address: str):
+                if not drop_replica_login(self.new_credentials, address, old_username,
+                                          lambda session: self.wait_for_session_drain(old_username, session, address)):
+                    in_use.append(address)
+
+            errors = fan_out(replicas, drop, f"Dropping login {old_username}")
+            if in_use:
+                logger.warning(f"Old login {old_username} kept on {len(in_use)} replica(s) where it may still be "
+                               f"in use: {', '.join(sorted(in_use))}")
+            if errors:
+                logger.warning(f"Old login {old_username} kept on {len(errors)} replica(s): {', '.join(errors)}")
+            if in_use or errors:
+                return False
+            if replicas:
+                logger.info(f"Removed old login {old_username} from {len(replicas)} replica(s)")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to cleanup old SQL user: {e}")
+            return False
+
+    def load_rotation_index(self) -> Tuple[Dict[int, Dict], Dict]:
+        """Read the secret's KV metadata and return (rotation index, metadata)
+
+        The index maps KV version -> {username, created_time, previous_version}
+        and lives in the secret's custom_metadata, so it comes back with the
+        same request that reports which versions still exist.
+        """
+        metadata = self.vault_store.read_metadata(self.secret_path)
+        return parse_rotation_index(metadata), metadata
+
+    def record_rotation(self, version: int, username: str, created_time: str,
+                        previous_version: Optional[int] = None, previous_username: Optional[str] = None,
+                        index: Optional[Dict[int, Dict]] = None, metadata: Optional[Dict] = None) -> bool:
+        """Add a version to the rotation index, keeping the newest ROTATION_INDEX_SIZE entries"""
+        try:
+            if index is None or metadata is None:
+                index, metadata = self.load_rotation_index()
+
+            # The version we rotated away from may predate the index
+            if previous_version and previous_version not in index and previous_username:
+                previous_info = (metadata.get('versions') or {}).get(str(previous_version)) or {}
+                index[previous_version] = {
+                    'username': previous_username,
+                    'created_time': previous_info.get('created_time'),
+                    'previous_version': None,
+                }
+
+            index[version] = {
+                'username': username,
+                'created_time': created_time,
+                'previous_version': previous_version,
+            }
+
+            custom_metadata = {
+                key: value for key, value in (metadata.get('custom_metadata') or {}).items()
+                if not key.startswith(ROTATION_INDEX_PREFIX)
+            }
+            for indexed_version in sorted(index)[-ROTATION_INDEX_SIZE:]:
+                custom_metadata[f"{ROTATION_INDEX_PREFIX}{indexed_version}"] = json.dumps(
+                    index[indexed_version], separators=(',', ':')
+                )
+
+            self.vault_store.update_custom_metadata(self.secret_path, custom_metadata)
+            logger.info(f"Recorded version {version} ({username}) in rotation index")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to update rotation index: {e}")
+            return False
+
+    def resolve_rollback_version(self, target: str, index: Dict[int, Dict], metadata: Dict) -> int:
+        """Resolve 'latest', a KV version number or a rotated username to a KV version"""
+        current_version = metadata['current_version']
+
+        if target == 'latest':
+            entry = index.get(current_version) or {}
+            version = entry.get('previous_version') or current_version - 1
+        elif target.isdigit():
+            version = int(target)
+        else:
+            matches = [v for v, entry in index.items()
+                       if entry.get('username') == target and v != current_version]
+            if not matches:
+                raise ValueError(f"No indexed version found for username: {target}")
+            version = max(matches)
+
+        if version < 1 or version == current_version:
+            raise ValueError(f"No earlier version to roll back to (current version {current_version})")
+
+        info = (metadata.get('versions') or {}).get(str(version))
+        if not info or info.get('destroyed') or info.get('deletion_time'):
+            raise ValueError(f"Version {version} of the secret is no longer available")
+
+        return version
+
+    def rollback_credentials(self, target: str) -> bool:
+        """Rollback to previous credentials using KV v2 version history
+
+        target is 'latest', a rotated username, a KV version number, or a
+        legacy backup timestamp (YYYYMMDD_HHMMSS) from before versioned rollback.
+        """
+        return self._traced_run('rotation.rollback', self._rollback_credentials, target, rollback_target=target)
+
+    def _rollback_credentials(self, target: str) -> bool:
+        try:
+            if LEGACY_BACKUP_TIMESTAMP.match(target):
+                return self.rollback_legacy_backup(target)
+
+            index, metadata = self.load_rotation_index()
+            version = self.resolve_rollback_version(target, index, metadata)
+            current_version = metadata['current_version']
+
+            restored_data = self.vault_store.read_version(self.secret_path, version)
+
+            # Restore as a new version, guarded against a concurrent change
+            written = self.vault_store.write(self.secret_path, restored_data, cas=current_version)
+
+            restored_user = parse_connection_string(
+                restored_data.get('ConnectionStrings__WorkoutTrackerWebContext', '')
+            ).get('user_id', 'unknown')
+            self.record_rotation(written['version'], restored_user, written['created_time'],
+                                 previous_version=current_version, index=index, metadata=metadata)
+
+            logger.info(f"Successfully rolled back to version {version} ({restored_user}) "
+                        f"as version {written['version']}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to rollback credentials: {e}")
+            return False
+
+    def rollback_legacy_backup(self, backup_timestamp: str) -> bool:
+        """Rollback from a timestamped backup path written by earlier versions of this script"""
+        try:
+            backup_path = f"{self.secret_path}_backup_{backup_timestamp}"
+
+            # Get backup secret
+            backup_data, _ = self.vault_store.read(backup_path)
+            current_version = self.vault_store.read_metadata(self.secret_path)['current_version']
+
+            # Restore to main secret path, guarded against a concurrent change
+            self.vault_store.write(self.secret_path, backup_data, cas=current_version)
+
+            logger.info(f"Successfully rolled back to backup: {backup_timestamp}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to rollback credentials: {e}")
+            return False
+
+    def span_attributes(self, **extra) -> Dict:
+        """Attributes identifying this target on a run's root span"""
+        return {
+            'rotation.target': self.target_name,
+            'rotation.secret_path': self.secret_path,
+            'rotation.sql_server': self.sql_server,
+            'rotation.database': self.database,
+            'k8s.namespace': self.namespace,
+            **{f"rotation.{key}": value for key, value in extra.items()},
+        }
+
+    def _traced_run(self, name: str, func, *args, **attributes) -> bool:
+        """Run func(*args) as the root span of one trace; func returns success"""
+        with self.tracer.span(name, self.span_attributes(**attributes)) as root:
+            if self.tracer.exporters:
+                logger.info(f"Tracing {name} as trace {root.trace_id}")
+            success = func(*args)
+            if not success:
+                root.set_attribute('rotation.outcome', 'failure')
+                root.set_error(f"{name} failed")
+        return success
+
+    def _timed(self, name: str, func, *args, **kwargs):
+        """Run func(*args, **kwargs) as rotation step `name` in its own span, recording its wall-clock time"""
+        started = time.monotonic()
+        with tracing.span(f"rotation.{name}", {'rotation.step': name}) as span:
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self.timings[name] = round(time.monotonic() - started, 3)
+            if result is False:
+                span.set_attribute('rotation.outcome', 'failure')
+                span.set_error(f"{name} failed")
+            return result
+
+    def _checkpoint(self, state: str, **fields):
+        """Journal that the rotation reached state"""
+        self._timed(f"checkpoint_{state}", self.journal.checkpoint, state, **fields)
+
+    def rotate_credentials(self, dry_run: bool = False) -> bool:
+        """Main credential rotation process
+
+        The rotation is a sequence of journaled steps: the generated
+        credentials and a checkpoint after each step are kept in Vault, and a
+        run that finds an unfinished journal resumes after its last checkpoint
+        instead of creating another login.
+
+        With standby_pool_size set, the rotation switches to a verified
+        standby login when the pool has one, and tops the pool back up once
+        the rotation has completed.
+
+        Unless preflight is off, every permission the run needs is checked
+        first, dry runs included (see run_preflight_checks).
+
+        With wait_for_quiet set, the run holds before it changes anything
+        until SQL Server traffic is quiet (see wait_for_quiet_window), then
+        repeats the pre-flight checks.
+
+        With capacity_probe set, Vault is switched only once the new login
+        passes probe_login_capacity. A failed probe stops the run after
+        'login_created', so a rerun probes the same login again.
+
+        The run is one trace with a span per step. Each step's wall-clock
+        time is also recorded in self.timings, with the whole run under 'total'.
+        """
+        return self._traced_run('rotation.rotate', self._rotate_credentials, dry_run, dry_run=dry_run)
+
+    def _rotate_credentials(self, dry_run: bool) -> bool:
+        self.timings = {}
+        started = time.monotonic()
+        journal = self.journal
+        try:
+            logger.info("Starting SQL credential rotation process")
+
+            # A run that was interrupted left its credentials and last checkpoint in the journal
+            self._timed('load_journal', journal.load)
+            if journal.resumable and not self.resume:
+                logger.warning(f"Discarding unfinished rotation to {journal.entry['new_username']} "
+                               f"(state '{journal.entry['state']}') - its login may need manual cleanup")
+                journal.discard()
+            if journal.resumable:
+                logger.info(f"Resuming rotation to {journal.entry['new_username']} after step "
+                            f"'{journal.entry['state']}' (started {journal.entry['started_at']})")
+
+            # Step 1: Get current credentials
+            self.current_credentials = self._timed('get_current_credentials', self.get_current_credentials)
+            current_username = self.current_credentials['user_id']
+            vault_switched = False
+
+            from_standby = journal.resumable and journal.entry.get('standby', False)
+            if journal.resumable:
+                new_username = journal.entry['new_username']
+                if current_username == new_username:
+                    # Vault already serves the new login, possibly written just before the interruption
+                    vault_switched = True
+                    self.new_credentials = self.current_credentials.copy()
+                    current_username = journal.entry['old_username']
+                elif current_username == journal.entry['old_username'] and not journal.reached('vault_updated'):
+                    self.new_credentials = self.current_credentials.copy()
+                    self.new_credentials['user_id'] = new_username
+                    self.new_credentials['password'] = journal.entry['new_password']
+                else:
+                    raise Exception(f"Vault secret changed since the interrupted rotation started (now "
+                                    f"{current_username}); check it, then rerun with --no-resume")
+            else:
+                # Step 2: Take a verified standby login, or generate new credentials
+                standby = None
+                if self.standby_pool_size:
+                    self._timed('load_standby_pool', self.standby_pool.load)
+                    standby = self.standby_pool.peek()
+
+                self.new_credentials = self.current_credentials.copy()
+                if standby is not None:
+                    from_standby = True
+                    new_username = standby['username']
+                    self.new_credentials['user_id'] = new_username
+                    self.new_credentials['password'] = standby['password']
+                    logger.info(f"Using verified standby login: {new_username} (verified {standby['verified_at']})")
+                else:
+                    new_username = self.generate_username(current_username,
+                                                          self.standby_pool.usernames() + self.indexed_usernames())
+                    self.new_credentials['user_id'] = new_username
+                    self.new_credentials['password'] = self.generate_secure_password()
+                    logger.info(f"Generated new credentials for user: {new_username}")
+            
+            if self.preflight or not dry_run:
+                self._timed('initialize_kubernetes', self.initialize_kubernetes)
+
+            # Read-only and concurrent: a missing permission stops the run before it changes anything
+            if self.preflight and not self._timed('preflight', self.run_preflight_checks):
+                raise Exception("Pre-flight checks failed - nothing was changed by this run")
+
+            # The rollout's pool refill should land when the application is quietest; waits before Vault changes
+            if self.wait_for_quiet and not vault_switched and not journal.reached('vault_updated'):
+                if not self._timed('wait_for_quiet', self.wait_for_quiet_window, dry_run):
+                    raise Exception("SQL Server stayed busy until the quiet deadline - Vault not switched")
+
+                # The wait can last hours: grants, RBAC and the Vault token are checked again before any change
+                if self.preflight and not dry_run and not self._timed('preflight_after_wait',
+                                                                      self.run_preflight_checks):
+                    raise Exception("Pre-flight checks failed after the quiet-window wait - Vault not switched")
+
+            if dry_run:
+                if journal.resumable:
+                    logger.info(f"DRY RUN: Would resume credential rotation after step '{journal.entry['state']}'")
+                else:
+                    logger.info("DRY RUN: Would proceed with credential rotation")
+                return True
+
+            # Nothing changes anywhere until the generated credentials are journaled
+            resumed = journal.resumable
+            if not resumed:
+                self._timed('begin_journal', journal.begin, current_username, new_username,
+                            self.new_credentials['password'], standby=from_standby)
+            
+            if not journal.reached('login_created') and from_standby:
+                # Taken out of the pool only once the journal holds its password
+                if resumed:
+                    self.standby_pool.load()
+                self._timed('take_standby', self.standby_pool.remove, new_username)
+
+                # The standby was tested when it was pooled; one batch applies anything
+                # granted to the current user since, and verifies the privileges match
+                if not self._timed('verify_standby', self.create_new_sql_user,
+                                   self.current_credentials, new_username, self.new_credentials['password']):
+                    raise Exception("Standby login could not be given the current user's privileges")
+
+                self._checkpoint('login_created')
+
+            elif not journal.reached('login_created'):
+                # Step 3: Test current connection
+                if not self._timed('test_current_credentials', self.test_sql_connection, self.current_credentials):
+                    raise Exception("Current credentials are not working")
+                
+                # Step 4: Create new SQL user (a no-op for a login an interrupted run already created)
+                if not self._timed('create_new_sql_user', self.create_new_sql_user,
+                                   self.current_credentials, new_username, self.new_credentials['password']):
+                    raise Exception("Failed to create new SQL user")
+                
+                # Step 5: Test new credentials
+                if not self._timed('test_new_credentials', self.test_sql_connection, self.new_credentials):
+                    raise Exception("New credentials are not working")
+
+                self._checkpoint('login_created')
+            
+            # Everything left runs as the new principal
+            self.close_sql_session(current_username)
+            
+            if not journal.reached('vault_updated'):
+                # Record the target Secret's version before Vault changes so an early
+                # ESO refresh cannot be mistaken for the state we are waiting to leave
+                target_secret = self._timed('get_target_secret_name', self.get_target_secret_name)
+                previous_secret_version = None
+                if not vault_switched:
+                    previous_secret_version = self._timed('get_secret_version',
+                                                          self.rollout_tracker.get_secret_version, target_secret)
+
+                    # The application's whole connection load goes to the new login from here on
+                    if self.capacity_probe and not self._timed('probe_capacity', self.probe_login_capacity):
+                        raise Exception("New login failed the capacity probe - Vault not switched")
+                
+                    # Step 6: Update Vault secret
+                    if not self._timed('update_vault_secret', self.update_vault_secret, self.new_credentials):
+                        raise Exception("Failed to update Vault secret")
+
+                self._checkpoint('vault_updated', target_secret=target_secret,
+                                 previous_secret_version=previous_secret_version)
+            else:
+                target_secret = journal.entry['target_secret']
+                previous_secret_version = journal.entry['previous_secret_version']
+            
+            if not journal.reached('secret_synced'):
+                # Step 7: Trigger external secret refresh and wait for the Secret to change
+                self.rollout_tracker.start()
+                if not self._timed('refresh_external_secret', self.trigger_external_secret_refresh,
+                                   target_secret, previous_secret_version):
+                    logger.warning("External secret refresh not confirmed - may need manual intervention")
+                self._checkpoint('secret_synced')
+            
+            if not journal.reached('rolled_out'):
+                # Step 8: Restart the application and wait for the rollout to complete
+                logger.info("Waiting for application Deployments to roll out with new credentials...")
+                if not self._timed('rollout', self.wait_for_rollout):
+                    logger.warning("Deployments may not have rolled out properly - verify manually")
+                self._checkpoint('rolled_out')
+            
+            # Step 9: Drop the old user once the last session under it has closed
+            old_login_dropped = False
+            if not self._timed('drain_sessions', self.wait_for_session_drain, current_username):
+                logger.warning(f"Old user {current_username} kept because it may still be in use - "
+                               "manual cleanup required")
+            elif not self._timed('cleanup_old_sql_user', self.cleanup_old_sql_user, current_username):
+                logger.warning(f"Failed to cleanup old user {current_username} - manual cleanup required")
+            else:
+                old_login_dropped = True
+            self._checkpoint('completed', old_login_dropped=old_login_dropped)
+            
+            logger.info("SQL credential rotation completed successfully")
+
+            if self.standby_pool_size:
+                # After the rotation window: refill the pool for the next rotation
+                try:
+                    self._timed('replenish_standby_pool', self.replenish_standby_pool, self.new_credentials)
+                except Exception as e:
+                    logger.warning(f"Standby pool not topped up: {e}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Credential rotation failed: {e}")
+            return False
+            
+        finally:
+            self.close_sql_sessions()
+            self.timings['total'] = round(time.monotonic() - started, 3)
+            if self.vault_store is not None:
+                logger.info(f"Vault round trips this run: {self.vault_store.round_trips}")
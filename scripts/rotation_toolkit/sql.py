@@ -0,0 +1,361 @@
+"""
+SQL Server sessions and the T-SQL batches run during rotation
+"""
+
+import logging
+from typing import List, Tuple
+
+from . import backends, tracing
+
+logger = logging.getLogger(__name__)
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a SQL Server identifier the same way QUOTENAME does"""
+    return '[' + name.replace(']', ']]') + ']'
+
+
+# Every database-level privilege of the principals @current_user and @new_user
+# in one set-based query: role memberships (class NULL, major_id = role) and
+# permissions on any securable, with state G (grant), W (with grant option) or D (deny)
+PRIVILEGE_SNAPSHOT_SQL = """
+SELECT u.name, NULL, rm.role_principal_id, 0, N'MEMBER', 'G'
+FROM sys.database_role_members rm
+JOIN sys.database_principals u ON rm.member_principal_id = u.principal_id
+WHERE u.name IN (@current_user, @new_user)
+UNION ALL
+SELECT u.name, p.class, p.major_id, p.minor_id, p.permission_name COLLATE DATABASE_DEFAULT, p.state
+FROM sys.database_permissions p
+JOIN sys.database_principals u ON p.grantee_principal_id = u.principal_id
+WHERE u.name IN (@current_user, @new_user) AND p.state IN ('G', 'W', 'D')"""
+
+# Runs as the current principal. Parameters: new login, new password, current login.
+# Snapshots both principals, applies only what the new user is missing, then
+# snapshots again and rolls everything back unless the new user has every
+# role, permission and the default schema of the current user. Returns the
+# new user's role and permission counts, the number of items applied, and
+# how many privileges the new user holds beyond the current user's.
+PROVISION_LOGIN_SQL = f"""
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @new_user sysname = ?;
+DECLARE @new_password nvarchar(128) = ?;
+DECLARE @current_user sysname = ?;
+DECLARE @sql nvarchar(max);
+DECLARE @message nvarchar(2048);
+DECLARE @applied int;
+DECLARE @default_schema sysname = (SELECT default_schema_name FROM sys.database_principals WHERE name = @current_user);
+
+DECLARE @before TABLE (principal sysname, class tinyint NULL, major_id int, minor_id int,
+                       permission_name nvarchar(128), state char(1));
+DECLARE @after TABLE (principal sysname, class tinyint NULL, major_id int, minor_id int,
+                      permission_name nvarchar(128), state char(1));
+DECLARE @missing TABLE (class tinyint NULL, major_id int, minor_id int, permission_name nvarchar(128), state char(1));
+
+BEGIN TRANSACTION;
+
+IF NOT EXISTS (SELECT 1 FROM sys.server_principals WHERE name = @new_user)
+BEGIN
+    SET @sql = N'CREATE LOGIN ' + QUOTENAME(@new_user) + N' WITH PASSWORD = ' + QUOTENAME(@new_password, '''');
+    EXEC sp_executesql @sql;
+END
+
+IF NOT EXISTS (SELECT 1 FROM sys.database_principals WHERE name = @new_user)
+BEGIN
+    SET @sql = N'CREATE USER ' + QUOTENAME(@new_user) + N' FOR LOGIN ' + QUOTENAME(@new_user) +
+        ISNULL(N' WITH DEFAULT_SCHEMA = ' + QUOTENAME(@default_schema), N'');
+    EXEC sp_executesql @sql;
+END
+ELSE IF @default_schema IS NOT NULL AND NOT EXISTS (
+    SELECT 1 FROM sys.database_principals WHERE name = @new_user AND default_schema_name = @default_schema)
+BEGIN
+    SET @sql = N'ALTER USER ' + QUOTENAME(@new_user) + N' WITH DEFAULT_SCHEMA = ' + QUOTENAME(@default_schema);
+    EXEC sp_executesql @sql;
+END
+
+INSERT INTO @before {PRIVILEGE_SNAPSHOT_SQL};
+
+INSERT INTO @missing
+SELECT class, major_id, minor_id, permission_name, state FROM @before WHERE principal = @current_user
+EXCEPT
+SELECT class, major_id, minor_id, permission_name, state FROM @before WHERE principal = @new_user;
+SET @applied = @@ROWCOUNT;
+
+-- One statement per missing item; a securable class without a case here
+-- stays missing and fails the verification below
+SET @sql = N'';
+SELECT @sql = @sql +
+    CASE
+        WHEN m.class IS NULL THEN
+            N'ALTER ROLE ' + QUOTENAME(USER_NAME(m.major_id)) + N' ADD MEMBER ' + QUOTENAME(@new_user)
+        ELSE
+            CASE m.state WHEN 'D' THEN N'DENY ' ELSE N'GRANT ' END + m.permission_name +
+            CASE m.class
+                WHEN 0 THEN N''
+                WHEN 1 THEN N' ON OBJECT::' + QUOTENAME(OBJECT_SCHEMA_NAME(m.major_id)) + N'.' +
+                    QUOTENAME(OBJECT_NAME(m.major_id)) +
+                    CASE WHEN m.minor_id <> 0 THEN N'(' + QUOTENAME(COL_NAME(m.major_id, m.minor_id)) + N')' ELSE N'' END
+                WHEN 3 THEN N' ON SCHEMA::' + QUOTENAME(SCHEMA_NAME(m.major_id))
+                WHEN 4 THEN N' ON ' +
+                    CASE dp.type WHEN 'R' THEN N'ROLE' WHEN 'A' THEN N'APPLICATION ROLE' ELSE N'USER' END +
+                    N'::' + QUOTENAME(dp.name)
+                WHEN 6 THEN N' ON TYPE::' + QUOTENAME(SCHEMA_NAME(t.schema_id)) + N'.' + QUOTENAME(t.name)
+            END +
+            N' TO ' + QUOTENAME(@new_user) +
+            CASE m.state WHEN 'W' THEN N' WITH GRANT OPTION' ELSE N'' END
+    END + N';'
+FROM @missing m
+LEFT JOIN sys.database_principals dp ON m.class = 4 AND dp.principal_id = m.major_id
+LEFT JOIN sys.types t ON m.class = 6 AND t.user_type_id = m.major_id
+WHERE m.class IS NULL OR m.class IN (0, 1, 3, 4, 6);
+
+IF @sql <> N''
+    EXEC sp_executesql @sql;
+
+-- Verify before committing; THROW rolls the whole batch back under XACT_ABORT
+INSERT INTO @after {PRIVILEGE_SNAPSHOT_SQL};
+
+SET @message = N'';
+SELECT TOP 5 @message = @message + N' ' +
+    CASE WHEN m.class IS NULL THEN N'role ' + ISNULL(USER_NAME(m.major_id), CAST(m.major_id AS nvarchar(11)))
+         ELSE m.state + N' ' + m.permission_name + N' (class ' + CAST(m.class AS nvarchar(3)) + N')' END + N';'
+FROM (
+    SELECT class, major_id, minor_id, permission_name, state FROM @after WHERE principal = @current_user
+    EXCEPT
+    SELECT class, major_id, minor_id, permission_name, state FROM @after WHERE principal = @new_user
+) m;
+IF @message <> N''
+BEGIN
+    SET @message = N'New user is missing privileges of the current user:' + @message;
+    THROW 50002, @message, 1;
+END
+
+IF @default_schema IS NOT NULL AND NOT EXISTS (
+    SELECT 1 FROM sys.database_principals WHERE name = @new_user AND default_schema_name = @default_schema)
+    THROW 50004, N'New user does not have the default schema of the current user', 1;
+
+COMMIT TRANSACTION;
+
+SELECT
+    (SELECT COUNT(*) FROM @after WHERE principal = @new_user AND class IS NULL) AS role_count,
+    (SELECT COUNT(*) FROM @after WHERE principal = @new_user AND class IS NOT NULL) AS permission_count,
+    @applied AS applied_count,
+    (SELECT COUNT(*) FROM (
+        SELECT class, major_id, minor_id, permission_name, state FROM @after WHERE principal = @new_user
+        EXCEPT
+        SELECT class, major_id, minor_id, permission_name, state FROM @after WHERE principal = @current_user
+    ) extra) AS extra_count;
+"""
+
+# Parameters: login to drop
+DROP_LOGIN_SQL = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @old_user sysname = ?;
+DECLARE @sql nvarchar(max) = N'';
+
+-- A session opened after the drain check must not be cut off
+IF EXISTS (SELECT 1 FROM sys.dm_exec_sessions WHERE login_name = @old_user AND is_user_process = 1)
+    THROW 50003, N'Login still has open sessions', 1;
+
+IF EXISTS (SELECT 1 FROM sys.database_principals WHERE name = @old_user)
+    SET @sql = @sql + N'DROP USER ' + QUOTENAME(@old_user) + N';';
+IF EXISTS (SELECT 1 FROM sys.server_principals WHERE name = @old_user)
+    SET @sql = @sql + N'DROP LOGIN ' + QUOTENAME(@old_user) + N';';
+
+EXEC sp_executesql @sql;
+"""
+
+# Run in the application database. Parameters: login, whether to list the
+# availability group's other replicas. Returns the login's SID and password
+# hash (NULL without CONTROL SERVER) on every row, with one row per other
+# replica of the group holding the database, or one row with NULL replica
+# columns if there are none or discovery is off.
+REPLICA_DISCOVERY_SQL = """
+SET NOCOUNT ON;
+DECLARE @login sysname = ?;
+DECLARE @discover bit = ?;
+
+SELECT p.sid, CAST(LOGINPROPERTY(p.name, 'PasswordHash') AS varbinary(256)),
+       r.replica_server_name, r.read_only_routing_url
+FROM sys.server_principals p
+LEFT JOIN (
+    SELECT ar.replica_server_name, ar.read_only_routing_url
+    FROM sys.availability_replicas ar
+    JOIN sys.availability_databases_cluster adc ON adc.group_id = ar.group_id
+    WHERE adc.database_name = DB_NAME() AND ar.replica_server_name <> @@SERVERNAME
+) r ON @discover = 1
+WHERE p.name = @login;
+"""
+
+# Run in master on a secondary replica. Parameters: login, password, password
+# hash (or NULL), SID. Creates the login with the primary's SID, so the
+# database user replicated from the primary maps to it, and with the primary's
+# password hash when it is known. A login of that name with another SID fails.
+REPLICA_LOGIN_SQL = """
+SET NOCOUNT ON;
+DECLARE @login sysname = ?;
+DECLARE @password nvarchar(128) = ?;
+DECLARE @password_hash varbinary(256) = ?;
+DECLARE @sid varbinary(85) = ?;
+DECLARE @sql nvarchar(max);
+
+IF EXISTS (SELECT 1 FROM sys.server_principals WHERE name = @login AND sid <> @sid)
+    THROW 50005, N'Login exists on this replica with a different SID', 1;
+
+IF NOT EXISTS (SELECT 1 FROM sys.server_principals WHERE name = @login)
+BEGIN
+    SET @sql = N'CREATE LOGIN ' + QUOTENAME(@login) + N' WITH PASSWORD = ' +
+        CASE WHEN @password_hash IS NULL THEN QUOTENAME(@password, '''')
+             ELSE CONVERT(nvarchar(600), @password_hash, 1) + N' HASHED' END +
+        N', SID = ' + CONVERT(nvarchar(200), @sid, 1);
+    EXEC sp_executesql @sql;
+END
+"""
+
+# Run as the new login on a replica. Returns the login's SID there.
+REPLICA_VERIFY_SQL = "SELECT SUSER_SID();"
+
+# Parameters: login. Returns whether session DMVs show other logins' sessions
+# (VIEW SERVER STATE), then the login's user sessions and running requests.
+SESSION_COUNT_SQL = """
+SET NOCOUNT ON;
+DECLARE @login sysname = ?;
+
+SELECT
+    HAS_PERMS_BY_NAME(NULL, NULL, 'VIEW SERVER STATE') AS can_view_sessions,
+    (SELECT COUNT(*)
+     FROM sys.dm_exec_sessions s
+     WHERE s.login_name = @login AND s.is_user_process = 1 AND s.session_id <> @@SPID) AS session_count,
+    (SELECT COUNT(*)
+     FROM sys.dm_exec_requests r
+     JOIN sys.dm_exec_sessions s ON r.session_id = s.session_id
+     WHERE s.login_name = @login AND s.is_user_process = 1 AND s.session_id <> @@SPID) AS request_count;
+"""
+
+# No parameters. Returns whether the DMVs are visible (VIEW SERVER STATE), the
+# server's cumulative login count (Logins/sec is a running total; the rate is
+# its change between samples) and the number of user sessions.
+SQL_LOAD_SQL = """
+SET NOCOUNT ON;
+
+SELECT
+    HAS_PERMS_BY_NAME(NULL, NULL, 'VIEW SERVER STATE') AS can_view_sessions,
+    (SELECT MAX(cntr_value)
+     FROM sys.dm_os_performance_counters
+     WHERE counter_name = N'Logins/sec' AND object_name LIKE N'%General Statistics%') AS login_count,
+    (SELECT COUNT(*)
+     FROM sys.dm_exec_sessions
+     WHERE is_user_process = 1) AS session_count;
+"""
+
+# Run in the application database. Parameters: login. Returns whether the
+# DMVs are visible (VIEW SERVER STATE), the database's cumulative transaction
+# count (Transactions/sec is a running total; the rate is its change between
+# samples), the login's sessions with a request running and the transactions
+# its sessions hold open. Every statement outside an explicit transaction is a
+# transaction of its own, so the count follows the database's request rate;
+# other databases on the server do not add to it.
+TRAFFIC_SQL = """
+SET NOCOUNT ON;
+DECLARE @login sysname = ?;
+
+SELECT
+    HAS_PERMS_BY_NAME(NULL, NULL, 'VIEW SERVER STATE') AS can_view_sessions,
+    (SELECT MAX(cntr_value)
+     FROM sys.dm_os_performance_counters
+     WHERE counter_name = N'Transactions/sec' AND object_name LIKE N'%:Databases%'
+       AND instance_name = DB_NAME()) AS transaction_count,
+    (SELECT COUNT(DISTINCT r.session_id)
+     FROM sys.dm_exec_requests r
+     JOIN sys.dm_exec_sessions s ON r.session_id = s.session_id
+     WHERE s.login_name = @login AND s.is_user_process = 1 AND s.session_id <> @@SPID) AS active_sessions,
+    (SELECT COALESCE(SUM(s.open_transaction_count), 0)
+     FROM sys.dm_exec_sessions s
+     WHERE s.login_name = @login AND s.is_user_process = 1 AND s.session_id <> @@SPID) AS open_transactions;
+"""
+
+# Run in the application database as the login that provisions the new one.
+# No parameters. Returns (permission, granted, required) for each permission
+# the rotation relies on: creating and dropping the login and its user,
+# adding the user to roles (only needed if the login is in any), and seeing
+# other sessions, without which drains and wave throttling cannot see load.
+PREFLIGHT_SQL = """
+SET NOCOUNT ON;
+
+SELECT N'ALTER ANY LOGIN', HAS_PERMS_BY_NAME(NULL, NULL, 'ALTER ANY LOGIN'), 1
+UNION ALL
+SELECT N'ALTER ANY USER', HAS_PERMS_BY_NAME(DB_NAME(), 'DATABASE', 'ALTER ANY USER'), 1
+UNION ALL
+SELECT N'ALTER ANY ROLE', HAS_PERMS_BY_NAME(DB_NAME(), 'DATABASE', 'ALTER ANY ROLE'),
+    CASE WHEN EXISTS (SELECT 1 FROM sys.database_role_members rm
+                      JOIN sys.database_principals u ON rm.member_principal_id = u.principal_id
+                      WHERE u.name = USER_NAME()) THEN 1 ELSE 0 END
+UNION ALL
+SELECT N'VIEW SERVER STATE', HAS_PERMS_BY_NAME(NULL, NULL, 'VIEW SERVER STATE'), 0;
+"""
+
+# SQLSTATEs that mean the connection itself is gone
+SQL_CONNECTION_LOST_STATES = ('08S01', '08003', '08007')
+
+
+class SQLSession:
+    """A reusable, authenticated connection for all work done as one SQL principal
+
+    The connection is opened lazily and kept in autocommit mode; scripts that
+    need atomicity manage their own transaction. A connection dropped while
+    idle is reopened once before the statement is retried.
+    """
+
+    def __init__(self, conn_str: str, timeout: int = 10):
+        self.conn_str = conn_str
+        self.timeout = timeout
+        self.conn = None
+        self.pyodbc = backends.pyodbc()
+
+    def connect(self):
+        """Open the connection if it is not already open"""
+        if self.conn is None:
+            with tracing.client_span('sqlserver', 'connect', {'db.system': 'mssql'}):
+                self.conn = self.pyodbc.connect(self.conn_str, timeout=self.timeout, autocommit=True)
+        return self.conn
+
+    def execute(self, sql: str, params: Tuple = (), operation: str = 'execute') -> List:
+        """Run a batch in one round trip and return the rows of its last result set
+
+        operation names the batch in trace spans, e.g. 'provision login'.
+        """
+        try:
+            return self._execute(sql, params, operation)
+        except self.pyodbc.Error as e:
+            if not e.args or e.args[0] not in SQL_CONNECTION_LOST_STATES:
+                raise
+            logger.warning("SQL connection lost, reconnecting")
+            self.close()
+            return self._execute(sql, params, operation)
+
+    def _execute(self, sql: str, params: Tuple, operation: str) -> List:
+        cursor = self.connect().cursor()
+        try:
+            with tracing.client_span('sqlserver', operation, {'db.system': 'mssql'}) as span:
+                cursor.execute(sql, params)
+                rows = []
+                # Walk every result set so errors raised late in the batch surface here
+                while True:
+                    if cursor.description is not None:
+                        rows = cursor.fetchall()
+                    if not cursor.nextset():
+                        break
+                span.set_attribute('db.rows', len(rows))
+            return rows
+        finally:
+            cursor.close()
+
+    def close(self):
+        """Close the connection"""
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except self.pyodbc.Error:
+                pass
+            self.conn = None
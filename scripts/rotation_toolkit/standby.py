@@ -0,0 +1,87 @@
+"""
+Pool of pre-provisioned standby logins that a rotation can switch to at once
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from . import backends
+from .vault import VaultSecretStore
+
+logger = logging.getLogger(__name__)
+
+# Stored next to the rotated secret, like the rotation journal
+STANDBY_SUFFIX = "_standby_pool"
+
+
+class StandbyPool:
+    """Standby logins for one secret, kept in Vault KV v2
+
+    Each entry holds a login's username and password, the login it was cloned
+    from and when it was verified. An entry is written as 'pending' before its
+    login is created, so a top-up that is interrupted leaves a record to retry
+    rather than an untracked login, and becomes 'verified' once the login has
+    the current user's privileges and accepted a connection. Rotations only
+    take verified entries. Every write uses check-and-set against the pool
+    version last seen, so two runs can never take the same standby.
+    """
+
+    def __init__(self, vault_store: VaultSecretStore, secret_path: str):
+        self.vault_store = vault_store
+        self.path = f"{secret_path}{STANDBY_SUFFIX}"
+        self.logins = []
+        self.version = 0
+
+    def load(self) -> List[Dict]:
+        """Read the pool; returns its entries, oldest first"""
+        try:
+            data, self.version = self.vault_store.read(self.path, refresh=True)
+            self.logins = list(data.get('logins', []))
+        except backends.hvac().exceptions.InvalidPath:
+            self.logins, self.version = [], 0
+        return self.logins
+
+    @property
+    def verified(self) -> List[Dict]:
+        return [login for login in self.logins if login.get('state') == 'verified']
+
+    @property
+    def pending(self) -> List[Dict]:
+        return [login for login in self.logins if login.get('state') != 'verified']
+
+    def usernames(self) -> List[str]:
+        return [login['username'] for login in self.logins]
+
+    def peek(self) -> Optional[Dict]:
+        """The verified standby a rotation would take next, without taking it"""
+        verified = self.verified
+        return verified[0] if verified else None
+
+    def add_pending(self, username: str, password: str, source_user: str):
+        """Record a standby before its login is created"""
+        self._write(self.logins + [{
+            'username': username,
+            'password': password,
+            'source_user': source_user,
+            'state': 'pending',
+            'created_at': datetime.utcnow().isoformat(),
+        }])
+
+    def mark_verified(self, username: str):
+        """Record that a standby login holds the current privileges and accepts connections"""
+        now = datetime.utcnow().isoformat()
+        self._write([{**login, 'state': 'verified', 'verified_at': now} if login['username'] == username else login
+                     for login in self.logins])
+
+    def remove(self, username: str) -> bool:
+        """Take a standby out of the pool; returns whether it was in it"""
+        remaining = [login for login in self.logins if login['username'] != username]
+        if len(remaining) == len(self.logins):
+            return False
+        self._write(remaining)
+        return True
+
+    def _write(self, logins: List[Dict]):
+        written = self.vault_store.write(self.path, {'logins': logins}, cas=self.version)
+        self.logins, self.version = logins, written['version']
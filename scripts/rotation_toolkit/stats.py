@@ -0,0 +1,13 @@
+"""
+Small statistics helpers shared by the capacity probe and the health history, with no imports of their own
+"""
+
+import math
+from typing import List, Optional
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values), max(1, math.ceil(p / 100 * len(values)))) - 1]
@@ -0,0 +1,171 @@
+"""
+Multi-target rotation driven by a JSON manifest
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .kube import new_api_client
+from .probe import PROBE_BUDGET, PROBE_MAX_CONNECTIONS
+from .rotator import SQLCredentialRotator
+from .tracing import Tracer
+from .traffic import QUIET_DEADLINE, QUIET_INTERVAL, QUIET_WINDOW
+from .vault import connect_vault
+
+logger = logging.getLogger(__name__)
+
+TARGET_FIELDS = ('secret_path', 'sql_server', 'database', 'namespace', 'app_label',
+                 'external_secret', 'rollout_timeout', 'drain_timeout', 'standby_pool',
+                 'deployments', 'wave_size', 'wave_pause', 'max_login_rate', 'max_sql_sessions',
+                 'capacity_probe', 'probe_max_connections', 'probe_queries', 'probe_budget', 'preflight',
+                 'replicas', 'replica_discovery', 'wait_for_quiet', 'quiet_window', 'quiet_interval',
+                 'quiet_deadline', 'quiet_max_sessions', 'quiet_max_requests', 'quiet_max_transactions',
+                 'skip_if_busy')
+
+
+def load_targets(path: str, defaults: Dict, fields: Tuple[str, ...] = TARGET_FIELDS,
+                 name_fields: Tuple[str, ...] = ('sql_server', 'database')) -> List[Dict]:
+    """Load a targets manifest and fill in per-target defaults
+
+    The manifest is JSON of the form::
+
+        {
+          "defaults": {"namespace": "web", "database": "WorkoutTrackerWeb"},
+          "targets": [
+            {"name": "prod-web", "secret_path": "workouttracker/prod", "sql_server": "sql-prod"},
+            {"name": "staging-web", "secret_path": "workouttracker/staging", "sql_server": "sql-stg"}
+          ]
+        }
+
+    Values are resolved per target, then from the manifest defaults, then
+    from the command-line arguments. fields lists the keys a target may set;
+    an unnamed target is named after its name_fields, joined with '/'.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+
+    manifest_defaults = {**defaults, **manifest.get('defaults', {})}
+    targets = []
+    names = set()
+
+    for index, entry in enumerate(manifest.get('targets', [])):
+        unknown = set(entry) - set(fields) - {'name'}
+        if unknown:
+            raise ValueError(f"Target {index}: unknown field(s) {', '.join(sorted(unknown))}")
+
+        target = {field: entry.get(field, manifest_defaults.get(field)) for field in fields}
+        for required in ('secret_path', 'sql_server'):
+            if not target[required]:
+                raise ValueError(f"Target {index}: '{required}' is required")
+
+        target['name'] = entry.get('name') or '/'.join(str(target[field]) for field in name_fields)
+        if target['name'] in names:
+            raise ValueError(f"Duplicate target name: {target['name']}")
+        names.add(target['name'])
+        targets.append(target)
+
+    if not targets:
+        raise ValueError(f"No targets defined in {path}")
+
+    return targets
+
+
+def rotate_targets(vault_url: str, vault_token: str, targets: List[Dict], dry_run: bool = False,
+                   max_workers: int = 4, max_per_server: int = 1,
+                   tracer: Optional[Tracer] = None, resume: bool = True) -> List[Dict]:
+    """Rotate many targets in one process using a bounded worker pool
+
+    Vault and Kubernetes clients are created once and shared by every worker.
+    At most max_per_server rotations run against the same SQL Server at once.
+    Each target's rotation is its own trace in the shared tracer. Returns one result per target, in manifest order.
+    """
+    vault_client = connect_vault(vault_url, vault_token)
+
+    # Dry runs only reach Kubernetes for their pre-flight checks
+    api_client = None
+    if not dry_run or any(target['preflight'] is not False for target in targets):
+        api_client = new_api_client()
+
+    server_slots = {}
+    for target in targets:
+        server_key = target['sql_server'].lower()
+        if server_key not in server_slots:
+            server_slots[server_key] = threading.BoundedSemaphore(max_per_server)
+
+    def run(target: Dict) -> Dict:
+        threading.current_thread().name = target['name']
+        result = {
+            'name': target['name'],
+            'secret_path': target['secret_path'],
+            'sql_server': target['sql_server'],
+            'database': target['database'],
+            'success': False,
+            'error': None,
+        }
+
+        with server_slots[target['sql_server'].lower()]:
+            started = time.monotonic()
+            result['started_at'] = datetime.now().isoformat()
+            try:
+                rotator = SQLCredentialRotator(
+                    vault_url=vault_url,
+                    vault_token=vault_token,
+                    secret_path=target['secret_path'],
+                    sql_server=target['sql_server'],
+                    database=target['database'],
+                    namespace=target['namespace'],
+                    app_label=target['app_label'],
+                    external_secret_name=target['external_secret'],
+                    rollout_timeout=target['rollout_timeout'],
+                    drain_timeout=target['drain_timeout'],
+                    standby_pool_size=target['standby_pool'] or 0,
+                    deployments=target['deployments'],
+                    wave_size=target['wave_size'] or 0,
+                    wave_pause=target['wave_pause'] or 0,
+                    max_login_rate=target['max_login_rate'],
+                    max_sql_sessions=target['max_sql_sessions'],
+                    capacity_probe=bool(target['capacity_probe']),
+                    probe_max_connections=target['probe_max_connections'] or PROBE_MAX_CONNECTIONS,
+                    probe_queries=target['probe_queries'],
+                    probe_budget=PROBE_BUDGET if target['probe_budget'] is None else target['probe_budget'],
+                    preflight=target['preflight'] is not False,
+                    replicas=target['replicas'],
+                    replica_discovery=target['replica_discovery'] is not False,
+                    wait_for_quiet=bool(target['wait_for_quiet']),
+                    quiet_window=QUIET_WINDOW if target['quiet_window'] is None else target['quiet_window'],
+                    quiet_interval=QUIET_INTERVAL if target['quiet_interval'] is None else target['quiet_interval'],
+                    quiet_deadline=QUIET_DEADLINE if target['quiet_deadline'] is None else target['quiet_deadline'],
+                    quiet_max_sessions=target['quiet_max_sessions'],
+                    quiet_max_requests=target['quiet_max_requests'],
+                    quiet_max_transactions=target['quiet_max_transactions'],
+                    skip_if_busy=bool(target['skip_if_busy']),
+                    tracer=tracer,
+                    target_name=target['name'],
+                    resume=resume
+                )
+                rotator.initialize_clients(vault_client=vault_client, api_client=api_client)
+                result['success'] = rotator.rotate_credentials(dry_run=dry_run)
+                if not result['success']:
+                    result['error'] = "Rotation failed - see log for details"
+            except Exception as e:
+                result['error'] = str(e)
+                logger.error(f"Rotation of target {target['name']} failed: {e}")
+            result['duration_seconds'] = round(time.monotonic() - started, 3)
+
+        return result
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, target): target['name'] for target in targets}
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['name']] = result
+            status = "succeeded" if result['success'] else "FAILED"
+            logger.info(f"Target {result['name']} {status} in {result['duration_seconds']}s")
+
+    return [results[target['name']] for target in targets]
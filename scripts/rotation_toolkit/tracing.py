@@ -0,0 +1,258 @@
+"""
+Span tracing for rotation runs, exported to an OTLP/HTTP collector or a JSON-lines file
+
+A run opens a root span with Tracer.span(); everything it calls opens child
+spans with the module-level span(), which is a no-op outside a traced run.
+Spans around remote calls are CLIENT spans, and every span records how many
+of them ran beneath it as rotation.round_trips. A trace is exported in one
+piece when its root span ends; export failures are logged, never raised.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "sql-credential-rotation"
+SCOPE_NAME = "rotation_toolkit"
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar('rotation_toolkit_span', default=None)
+
+
+class Span:
+    """One timed operation in a trace"""
+
+    def __init__(self, tracer: 'Tracer', name: str, parent: Optional['Span'], kind: int, attributes: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = STATUS_OK
+        self.status_message = ''
+        self.round_trips = 0
+        self.finished = [] if parent is None else parent.finished
+
+    @property
+    def duration(self) -> float:
+        """Seconds between start and end (or now, while the span is open)"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        if self.kind == SPAN_KIND_CLIENT:
+            ancestor = self.parent
+            while ancestor is not None:
+                ancestor.round_trips += 1
+                ancestor = ancestor.parent
+        else:
+            self.attributes['rotation.round_trips'] = self.round_trips
+        if 'rotation.outcome' not in self.attributes and self.kind == SPAN_KIND_INTERNAL:
+            self.attributes['rotation.outcome'] = 'success' if self.status == STATUS_OK else 'failure'
+        self.finished.append(self)
+
+    def to_dict(self) -> Dict:
+        """Flat representation used for JSON-lines export"""
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'kind': 'client' if self.kind == SPAN_KIND_CLIENT else 'internal',
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'status': 'ok' if self.status == STATUS_OK else 'error',
+            'status_message': self.status_message,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span when nothing is being traced"""
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class JSONLinesExporter:
+    """Append one JSON object per span to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, spans: List[Span], resource: Dict):
+        lines = [json.dumps({**span.to_dict(), 'resource': resource}) for span in spans]
+        with self.lock, open(self.path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+class OTLPHTTPExporter:
+    """POST traces to an OpenTelemetry collector using OTLP/HTTP with JSON encoding
+
+    endpoint is the collector base URL (e.g. http://tempo:4318, the OTLP/HTTP
+    port); spans are sent to <endpoint>/v1/traces.
+    """
+
+    def __init__(self, endpoint: str, timeout: float = 5.0, headers: Optional[Dict[str, str]] = None):
+        self.url = endpoint.rstrip('/')
+        if not self.url.endswith('/v1/traces'):
+            self.url += '/v1/traces'
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+
+    def export(self, spans: List[Span], resource: Dict):
+        import urllib.request  # pulls in http.client and ssl; only needed when exporting
+
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes(resource)},
+            'scopeSpans': [{
+                'scope': {'name': SCOPE_NAME},
+                'spans': [{
+                    'traceId': span.trace_id,
+                    'spanId': span.span_id,
+                    'parentSpanId': span.parent.span_id if span.parent else '',
+                    'name': span.name,
+                    'kind': span.kind,
+                    'startTimeUnixNano': str(span.start_ns),
+                    'endTimeUnixNano': str(span.end_ns),
+                    'attributes': _otlp_attributes(span.attributes),
+                    'status': {'code': span.status, 'message': span.status_message},
+                } for span in spans],
+            }],
+        }]}
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode('utf-8'),
+                                         headers=self.headers, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class Tracer:
+    """Creates root spans and hands finished traces to the configured exporters
+
+    With no exporters, spans are still created (their durations back the
+    rotator's step timings) but nothing is written anywhere.
+    """
+
+    def __init__(self, exporters: Optional[List] = None, service_name: str = SERVICE_NAME,
+                 resource_attributes: Optional[Dict] = None):
+        self.exporters = list(exporters or [])
+        self.resource = {'service.name': service_name, **(resource_attributes or {})}
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict] = None) -> Iterator[Span]:
+        """Open a span, as a child of the current span if there is one"""
+        parent = _current_span.get()
+        with _open_span(self if parent is None else parent.tracer, name, parent,
+                        SPAN_KIND_INTERNAL, attributes or {}) as span:
+            yield span
+
+    def export(self, spans: List[Span]):
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans, self.resource)
+            except Exception as e:
+                logger.warning(f"Failed to export trace with {type(exporter).__name__}: {e}")
+
+
+@contextmanager
+def _open_span(tracer: Tracer, name: str, parent: Optional[Span], kind: int, attributes: Dict) -> Iterator[Span]:
+    span = Span(tracer, name, parent, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        if parent is None and tracer.exporters:
+            tracer.export(span.finished)
+
+
+@contextmanager
+def span(name: str, attributes: Optional[Dict] = None, kind: int = SPAN_KIND_INTERNAL):
+    """Open a child of the current span; yields NOOP_SPAN when no run is being traced"""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    with _open_span(parent.tracer, name, parent, kind, attributes or {}) as child:
+        yield child
+
+
+def client_span(service: str, operation: str, attributes: Optional[Dict] = None):
+    """Open a CLIENT span around one request to a remote service"""
+    return span(f"{service} {operation}", {'peer.service': service, **(attributes or {})}, SPAN_KIND_CLIENT)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current else None
+
+
+def tracer_from_options(trace_file: Optional[str] = None, otlp_endpoint: Optional[str] = None) -> Tracer:
+    """Build a tracer from command-line options, falling back to the standard OTEL_* variables"""
+    exporters = []
+    if trace_file:
+        exporters.append(JSONLinesExporter(trace_file))
+    otlp_endpoint = otlp_endpoint or os.environ.get('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT') \
+        or os.environ.get('OTEL_EXPORTER_OTLP_ENDPOINT')
+    if otlp_endpoint:
+        exporters.append(OTLPHTTPExporter(otlp_endpoint))
+
+    resource_attributes = {}
+    for item in (os.environ.get('OTEL_RESOURCE_ATTRIBUTES') or '').split(','):
+        key, _, value = item.partition('=')
+        if key.strip() and value:
+            resource_attributes[key.strip()] = value.strip()
+    return Tracer(exporters, service_name=os.environ.get('OTEL_SERVICE_NAME') or SERVICE_NAME,
+                  resource_attributes=resource_attributes)
@@ -0,0 +1,130 @@
+"""
+Traffic-aware start: hold a rotation until SQL Server has been quiet for a whole window, or until a deadline
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Length of the window that must be quiet, seconds between samples, and how long the start may be deferred
+QUIET_WINDOW = 300.0
+QUIET_INTERVAL = 15.0
+QUIET_DEADLINE = 4 * 3600.0
+
+# Window averages compared with the thresholds, in report order
+TRAFFIC_METRICS = ('active_sessions', 'requests_per_second', 'open_transactions')
+
+
+class QuietWindowScheduler:
+    """Samples SQL Server traffic until one whole window is below every threshold
+
+    traffic returns (cumulative transactions in the application database,
+    active sessions and open transactions of the application's login), or
+    None without VIEW SERVER STATE. A sample is taken every interval seconds;
+    once the samples span window seconds, their averages are compared with
+    the thresholds (the request rate is the transaction count's change across
+    the window). A threshold of None is not checked. The window then slides
+    on by one sample.
+
+    wait() returns as soon as a window is quiet, or once deadline seconds
+    have passed, whichever comes first; at least one whole window is always
+    sampled. sample_now() takes a single sample without waiting.
+    """
+
+    def __init__(self, traffic: Callable[[], Optional[Tuple[int, int, int]]],
+                 max_active_sessions: Optional[float] = None, max_requests_per_second: Optional[float] = None,
+                 max_open_transactions: Optional[float] = None, window: float = QUIET_WINDOW,
+                 interval: float = QUIET_INTERVAL, deadline: float = QUIET_DEADLINE):
+        self.traffic = traffic
+        self.thresholds = {
+            'active_sessions': max_active_sessions,
+            'requests_per_second': max_requests_per_second,
+            'open_transactions': max_open_transactions,
+        }
+        self.interval = interval
+        self.window = window
+        self.deadline = deadline
+        self.samples = deque(maxlen=max(1, round(window / interval)) + 1)
+
+    def averages(self) -> Dict[str, float]:
+        """Traffic across the sampled window"""
+        (first, first_batches, _, _), (last, last_batches, _, _) = self.samples[0], self.samples[-1]
+        count = len(self.samples)
+        return {
+            'active_sessions': sum(sample[2] for sample in self.samples) / count,
+            'requests_per_second': max(0, last_batches - first_batches) / (last - first) if last > first else 0.0,
+            'open_transactions': sum(sample[3] for sample in self.samples) / count,
+        }
+
+    def over(self, load: Dict[str, Optional[float]]) -> Dict[str, float]:
+        """load / threshold for every metric over its threshold; a metric of None is not compared"""
+        return {metric: load[metric] / limit if limit else float('inf')
+                for metric, limit in self.thresholds.items()
+                if limit is not None and load[metric] is not None and load[metric] > limit}
+
+    def sample_now(self) -> Optional[Dict]:
+        """Whether traffic is quiet right now, from one sample, or None if traffic cannot be seen
+
+        A rate needs two samples, so requests_per_second is None and only the
+        session and transaction limits are compared; 'quiet' is None if
+        neither is set.
+        """
+        sample = self.traffic()
+        if sample is None:
+            return None
+        load = {'active_sessions': float(sample[1]), 'requests_per_second': None,
+                'open_transactions': float(sample[2])}
+        compared = any(limit is not None and load[metric] is not None for metric, limit in self.thresholds.items())
+        return {'quiet': not self.over(load) if compared else None, 'load': load}
+
+    def wait(self) -> Dict:
+        """Block until a quiet window or the deadline
+
+        Returns whether the start is quiet (None if traffic cannot be seen),
+        the seconds waited, the number of windows compared and the averages
+        of the window it stops on, or of the quietest window seen if none was
+        quiet.
+        """
+        started = time.monotonic()
+        windows = 0
+        quietest, quietest_score = None, None
+        while True:
+            sample = self.traffic()
+            if sample is None:
+                return {'quiet': None, 'waited': round(time.monotonic() - started, 3), 'windows': windows,
+                        'load': None}
+            self.samples.append((time.monotonic(), *sample))
+
+            if len(self.samples) == self.samples.maxlen:
+                windows += 1
+                load = self.averages()
+                over = self.over(load)
+                score = max(over.values(), default=0.0)
+                if quietest_score is None or score < quietest_score:
+                    quietest, quietest_score = load, score
+
+                waited = time.monotonic() - started
+                if not over:
+                    return {'quiet': True, 'waited': round(waited, 3), 'windows': windows, 'load': load}
+                if waited >= self.deadline:
+                    return {'quiet': False, 'waited': round(waited, 3), 'windows': windows, 'load': quietest}
+                if windows == 1 or windows % 10 == 0:
+                    logger.info(f"SQL Server busy - {format_traffic(load, self.thresholds)}; "
+                                f"deferring for at most {max(0, self.deadline - waited):.0f}s more")
+
+            time.sleep(self.interval)
+
+
+def format_traffic(load: Dict[str, Optional[float]], thresholds: Optional[Dict[str, Optional[float]]] = None) -> str:
+    """One-line summary of a window's averages, with their thresholds"""
+    labels = {'active_sessions': 'active sessions', 'requests_per_second': 'requests/s',
+              'open_transactions': 'open transactions'}
+    parts = []
+    for metric in TRAFFIC_METRICS:
+        limit = (thresholds or {}).get(metric)
+        value = '-' if load[metric] is None else f"{load[metric]:.1f}"
+        parts.append(f"{value} {labels[metric]}" + (f" (limit {limit:g})" if limit is not None else ""))
+    return ', '.join(parts)
@@ -0,0 +1,169 @@
+"""
+Shared HTTP transport for Vault and the Kubernetes API: keep-alive pools, retries and per-endpoint rate limits
+
+hvac (through requests) and the kubernetes client both send through urllib3,
+so one urllib3 Retry policy serves both:
+
+- a connection that could not be opened is retried for any method, since
+  nothing reached the server;
+- 429, 502, 503 and 504 responses and broken reads are retried only for
+  idempotent methods: GET, HEAD, OPTIONS and Vault's LIST. Writes
+  (check-and-set updates, patches, evictions) are never repeated;
+- retries back off exponentially from RETRY_BACKOFF, plus up to RETRY_JITTER
+  of random jitter, capped at RETRY_BACKOFF_MAX; a Retry-After header is
+  honoured up to RETRY_AFTER_MAX;
+- once the retries are spent the last response is returned, so callers see
+  the same hvac and ApiException errors as before.
+
+Every request also takes a token from a bucket for its endpoint
+(scheme://host:port). The buckets are shared by all clients in the process,
+so concurrent targets cannot flood one Vault or API server.
+
+requests and urllib3 are imported on first use, like the backends themselves.
+"""
+
+import random
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+from . import backends
+
+RETRY_ATTEMPTS = 4
+RETRY_BACKOFF = 0.05
+RETRY_BACKOFF_MAX = 2.0
+RETRY_JITTER = 0.05
+RETRY_AFTER_MAX = 10.0
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'LIST'))
+
+# Connections kept open per endpoint; a health run or a fleet shares one client across many threads
+POOL_MAXSIZE = 32
+
+# Requests per second per endpoint, on average and in a burst
+RATE_LIMIT = 50.0
+RATE_BURST = 20
+
+_retry_class = None
+_limiters: Dict[str, 'RateLimiter'] = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Token bucket: rate requests per second on average, up to burst at once
+
+    A caller that finds the bucket empty reserves the next token and sleeps
+    until it is due, so waiting callers are served in order without spinning.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def endpoint(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def limiter_for(url: str) -> RateLimiter:
+    """The rate limiter shared by every request to url's endpoint"""
+    key = endpoint(url)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter()
+        return _limiters[key]
+
+
+def retry_policy():
+    """A fresh urllib3 Retry with the shared policy"""
+    global _retry_class
+    if _retry_class is None:
+        from urllib3.util.retry import Retry
+
+        class CappedRetry(Retry):
+            """Honours Retry-After, but never for longer than RETRY_AFTER_MAX
+
+            The backoff cap and jitter are applied here rather than through
+            backoff_max and backoff_jitter, which urllib3 1.26 does not accept.
+            """
+
+            def get_backoff_time(self):
+                backoff = super().get_backoff_time()
+                if backoff <= 0:
+                    return 0
+                return min(RETRY_BACKOFF_MAX, backoff + random.uniform(0, RETRY_JITTER))
+
+            def get_retry_after(self, response):
+                retry_after = super().get_retry_after(response)
+                return None if retry_after is None else min(retry_after, RETRY_AFTER_MAX)
+
+        _retry_class = CappedRetry
+
+    return _retry_class(
+        total=RETRY_ATTEMPTS,
+        connect=RETRY_ATTEMPTS,
+        read=RETRY_ATTEMPTS,
+        status=RETRY_ATTEMPTS,
+        other=0,
+        allowed_methods=IDEMPOTENT_METHODS,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=RETRY_BACKOFF,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def vault_session():
+    """A requests Session for hvac with pooled connections, retries and rate limiting"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    class RateLimitedAdapter(HTTPAdapter):
+        def send(self, request, *args, **kwargs):
+            limiter_for(request.url).acquire()
+            return super().send(request, *args, **kwargs)
+
+    session = requests.Session()
+    adapter = RateLimitedAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=retry_policy())
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RateLimitedPoolManager:
+    """Wraps the kubernetes client's urllib3 PoolManager so each request takes a token first"""
+
+    def __init__(self, pool_manager):
+        self.pool_manager = pool_manager
+
+    def request(self, method: str, url: str, *args, **kwargs):
+        limiter_for(url).acquire()
+        return self.pool_manager.request(method, url, *args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.pool_manager, name)
+
+
+def kubernetes_api_client(configuration):
+    """An ApiClient for configuration with pooled connections, retries and rate limiting"""
+    configuration.retries = retry_policy()
+    configuration.connection_pool_maxsize = POOL_MAXSIZE
+    api_client = backends.kubernetes_client().ApiClient(configuration)
+    rest_client = api_client.rest_client
+    rest_client.pool_manager = RateLimitedPoolManager(rest_client.pool_manager)
+    return api_client
@@ -0,0 +1,105 @@
+"""
+HashiCorp Vault KV v2 access shared by rotation, rollback and health checks
+"""
+
+import json
+import re
+from typing import Dict, Optional, Tuple
+
+from . import backends, tracing, transport
+
+# Rotation index kept in the secret's KV v2 custom_metadata (limited to 64 keys)
+ROTATION_INDEX_PREFIX = "rotation-v"
+ROTATION_INDEX_SIZE = 20
+LEGACY_BACKUP_TIMESTAMP = re.compile(r'^\d{8}_\d{6}$')
+
+
+def new_vault_client(vault_url: str, vault_token: str, **kwargs):
+    """Create a Vault client on the shared transport, without contacting Vault"""
+    return backends.hvac().Client(url=vault_url, token=vault_token, session=transport.vault_session(), **kwargs)
+
+
+def connect_vault(vault_url: str, vault_token: str, **kwargs):
+    """Create an authenticated Vault client"""
+    vault_client = new_vault_client(vault_url, vault_token, **kwargs)
+    with tracing.client_span('vault', 'token lookup'):
+        authenticated = vault_client.is_authenticated()
+    if not authenticated:
+        raise Exception("Failed to authenticate with Vault")
+    return vault_client
+
+
+def parse_rotation_index(metadata: Dict) -> Dict[int, Dict]:
+    """Return the rotation index (KV version -> entry) stored in a secret's custom_metadata"""
+    index = {}
+    for key, value in (metadata.get('custom_metadata') or {}).items():
+        if key.startswith(ROTATION_INDEX_PREFIX):
+            index[int(key[len(ROTATION_INDEX_PREFIX):])] = json.loads(value)
+    return index
+
+
+class VaultSecretStore:
+    """KV v2 access for one rotation run: one read per secret, check-and-set writes
+
+    Secrets are cached with the KV version they were read at. Writes send that
+    version as the check-and-set parameter, so a concurrent change made after
+    our read makes the write fail instead of being silently overwritten.
+    Every request sent to Vault is counted in round_trips.
+    """
+
+    def __init__(self, vault_client):
+        self.vault_client = vault_client
+        self.cache = {}
+        self.round_trips = 0
+
+    def read(self, path: str, refresh: bool = False) -> Tuple[Dict[str, str], int]:
+        """Return (data, version) for the latest version of a secret"""
+        if refresh or path not in self.cache:
+            self.round_trips += 1
+            with tracing.client_span('vault', 'kv read', {'vault.path': path}):
+                response = self.vault_client.secrets.kv.v2.read_secret_version(path=path)
+            self.cache[path] = (response['data']['data'], response['data']['metadata']['version'])
+        data, version = self.cache[path]
+        return data.copy(), version
+
+    def version(self, path: str) -> int:
+        """Return the cached version of a secret, reading it if needed"""
+        return self.read(path)[1]
+
+    def read_version(self, path: str, version: int) -> Dict[str, str]:
+        """Return the data of a specific version of a secret"""
+        self.round_trips += 1
+        with tracing.client_span('vault', 'kv read', {'vault.path': path, 'vault.version': version}):
+            response = self.vault_client.secrets.kv.v2.read_secret_version(path=path, version=version)
+        return response['data']['data']
+
+    def read_metadata(self, path: str) -> Dict:
+        """Return the KV metadata of a secret: versions, current_version and custom_metadata"""
+        self.round_trips += 1
+        with tracing.client_span('vault', 'metadata read', {'vault.path': path}):
+            return self.vault_client.secrets.kv.v2.read_secret_metadata(path=path)['data']
+
+    def update_custom_metadata(self, path: str, custom_metadata: Dict[str, str]):
+        """Replace the custom_metadata of a secret"""
+        self.round_trips += 1
+        with tracing.client_span('vault', 'metadata write', {'vault.path': path}):
+            self.vault_client.secrets.kv.v2.update_metadata(path=path, custom_metadata=custom_metadata)
+
+    def write(self, path: str, data: Dict[str, str], cas: Optional[int] = None) -> Dict:
+        """Write a secret with check-and-set and return the new version's metadata
+
+        cas defaults to the cached version; use 0 to require that the path does
+        not exist yet.
+        """
+        if cas is None:
+            cas = self.version(path)
+
+        self.round_trips += 1
+        with tracing.client_span('vault', 'kv write', {'vault.path': path, 'vault.cas': cas}):
+            response = self.vault_client.secrets.kv.v2.create_or_update_secret(
+                path=path,
+                secret=data,
+                cas=cas
+            )
+        self.cache[path] = (data.copy(), response['data']['version'])
+        return response['data']
@@ -0,0 +1,158 @@
+"""
+Wave-based rollout: replace application pods a few at a time so SQL Server never sees every pool reconnect at once
+"""
+
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import tracing
+from .kube import RolloutTracker
+
+logger = logging.getLogger(__name__)
+
+# Backoff while a PodDisruptionBudget or SQL Server load holds the next wave back
+WAVE_RETRY_MIN = 1.0
+WAVE_RETRY_MAX = 10.0
+
+
+class WaveRollout:
+    """Replaces the pods of each Deployment in waves of at most wave_size
+
+    Pods are evicted through the Eviction API, so the API server refuses any
+    eviction a PodDisruptionBudget does not allow, and each wave is also
+    capped by the budgets' disruptionsAllowed up front. The replacement pods
+    start with the updated Secret; the next wave waits until the evicted pods
+    are gone and the Deployment is back to its desired count of Ready pods.
+
+    sql_load returns (cumulative logins, user sessions) for SQL Server, or
+    None without VIEW SERVER STATE. Before every wave after the first the
+    login rate since the previous sample and the session count are compared
+    with max_login_rate and max_sessions, and the wave is held back while
+    either is over its limit.
+
+    A Deployment whose budget allows no disruption even with every pod Ready
+    (e.g. one replica under minAvailable 1) is restarted with a surge rollout
+    instead, which never drops below the desired count.
+    """
+
+    def __init__(self, tracker: RolloutTracker, wave_size: int,
+                 sql_load: Optional[Callable[[], Optional[Tuple[int, int]]]] = None,
+                 max_login_rate: Optional[float] = None, max_sessions: Optional[int] = None,
+                 wave_pause: float = 0):
+        self.tracker = tracker
+        self.wave_size = wave_size
+        self.sql_load = sql_load
+        self.max_login_rate = max_login_rate
+        self.max_sessions = max_sessions
+        self.wave_pause = wave_pause
+        self.last_sample = None
+        self.waves = 0
+
+    def run(self, deployments: List[Dict]):
+        """Roll every Deployment in order; raises if one does not finish before the deadline"""
+        self.sample_load()
+        for deployment in deployments:
+            self.roll_deployment(deployment)
+
+    def roll_deployment(self, deployment: Dict):
+        name, selector, replicas = deployment['name'], deployment['selector'], deployment['replicas']
+
+        # Only the pods running now have the old credentials; replacements are never evicted
+        pending = [pod['name'] for pod in self.tracker.list_pods(selector)]
+        delay = WAVE_RETRY_MIN
+        wave = 0
+        logger.info(f"Rolling {len(pending)} pod(s) of Deployment {name} in waves of {self.wave_size}")
+
+        while pending:
+            allowed = self.tracker.disruptions_allowed(deployment['pod_labels'])
+            size = min(self.wave_size, len(pending), self.wave_size if allowed is None else allowed)
+
+            if size <= 0:
+                ready = sum(1 for pod in self.tracker.list_pods(selector) if pod['ready'])
+                if ready >= replicas:
+                    logger.warning(f"PodDisruptionBudget allows no disruption of Deployment {name} "
+                                   f"at {ready} Ready pod(s) - restarting it with a surge rollout")
+                    generation = self.tracker.restart_deployments(None, [name])[name]
+                    self.tracker.wait_for_deployment_rollout(name, generation)
+                    return
+                delay = self.hold(delay, f"PodDisruptionBudget of Deployment {name} allows no disruption "
+                                         f"({ready}/{replicas} pods Ready)")
+                continue
+
+            if self.waves:
+                self.wait_for_sql_headroom()
+
+            with tracing.span('rotation.rollout_wave', {'k8s.deployment': name, 'rollout.wave': wave + 1,
+                                                        'rollout.pods': size}):
+                evicted = []
+                for pod in pending[:size]:
+                    if not self.tracker.evict_pod(pod):
+                        break
+                    evicted.append(pod)
+
+                if not evicted:
+                    delay = self.hold(delay, f"Eviction from Deployment {name} refused by its PodDisruptionBudget")
+                    continue
+
+                wave += 1
+                self.waves += 1
+                pending = pending[len(evicted):]
+                logger.info(f"Deployment {name} wave {wave}: evicted {len(evicted)} pod(s), "
+                            f"{len(pending)} left")
+                self.tracker.wait_for_pods_replaced(selector, evicted, replicas)
+
+            delay = WAVE_RETRY_MIN
+            if pending and self.wave_pause:
+                time.sleep(min(self.wave_pause, max(0, self.tracker.remaining())))
+
+        logger.info(f"Deployment {name} rolled out in {wave} wave(s)")
+
+    def hold(self, delay: float, reason: str) -> float:
+        """Sleep before retrying a held-back wave; returns the next delay"""
+        if self.tracker.remaining() <= delay:
+            raise TimeoutError(f"{reason} at the rollout deadline")
+        logger.info(f"{reason} - retrying in {delay:g}s")
+        time.sleep(delay)
+        return min(delay * 2, WAVE_RETRY_MAX)
+
+    def sample_load(self) -> Optional[Tuple[Optional[float], int]]:
+        """(logins per second since the last sample, user sessions), or None if SQL Server load is not visible"""
+        if self.sql_load is None or (self.max_login_rate is None and self.max_sessions is None):
+            return None
+        try:
+            load = self.sql_load()
+        except Exception as e:
+            logger.warning(f"Could not sample SQL Server load: {e}")
+            return None
+        if load is None:
+            logger.warning("Cannot see SQL Server load (VIEW SERVER STATE missing) - waves are not throttled")
+            self.sql_load = None
+            return None
+
+        logins, sessions = load
+        now = time.monotonic()
+        rate = None
+        if self.last_sample is not None:
+            then, previous = self.last_sample
+            if now > then:
+                rate = max(0, logins - previous) / (now - then)
+        self.last_sample = (now, logins)
+        return rate, sessions
+
+    def wait_for_sql_headroom(self):
+        """Hold the next wave while SQL Server's login rate or session count is over its limit"""
+        delay = WAVE_RETRY_MIN
+        while True:
+            load = self.sample_load()
+            if load is None:
+                return
+            rate, sessions = load
+            over = []
+            if self.max_login_rate is not None and rate is not None and rate > self.max_login_rate:
+                over.append(f"{rate:.1f} logins/s (limit {self.max_login_rate:g})")
+            if self.max_sessions is not None and sessions > self.max_sessions:
+                over.append(f"{sessions} sessions (limit {self.max_sessions})")
+            if not over:
+                return
+            delay = self.hold(delay, f"SQL Server at {', '.join(over)}")
@@ -0,0 +1,58 @@
+"""
+Redaction of secrets in log messages (rotation_toolkit.audit.redact)
+
+Run from scripts/: python -m pytest -q tests
+"""
+
+import json
+
+import pytest
+
+from rotation_toolkit.audit import REDACTED, redact
+
+
+@pytest.mark.parametrize('message, expected', [
+    # Generated passwords draw on !@#$%^&*, so '&' and ',' are part of the value
+    ('Password=Ab&xyz!Q', 'Password=***'),
+    ('Server=sql;Password=Ab&x,yz!Q;Encrypt=True', 'Server=sql;Password=***;Encrypt=True'),
+    ('Server=sql;Pwd=Ab&xyz!Q', 'Server=sql;Pwd=***'),
+    # Quoted values are one token, separators and doubled quotes included
+    ('Password="a;b";Database=d', 'Password="***";Database=d'),
+    ('Password="a"";b";Database=d', 'Password="***";Database=d'),
+    ("pwd='a b';Database=d", "pwd='***';Database=d"),
+    ('pwd={a;b}}c};User ID=u', 'pwd={***};User ID=u'),
+    # Prefixed keys, as in the rotation journal and standby pool entries
+    ('{"new_password": "Zz9&abc", "old_password": "q\\"w,e"}', '{"new_password": "***", "old_password": "***"}'),
+    ("{'new_password': 'Zz9&abc'}", "{'new_password': '***'}"),
+    ('vault_token=abc;', 'vault_token=***;'),
+    ('https://vault/v1?token=abc&user=x', 'https://vault/v1?token=***'),
+    ('Authorization: Bearer abc.def', 'Authorization: Bearer ***'),
+])
+def test_secret_values_are_fully_masked(message, expected):
+    assert redact(message) == expected
+
+
+def test_vault_tokens_are_masked_anywhere():
+    assert redact('login with hvs.CAESIAbcdefghijklmnopqrstuv failed') == f'login with {REDACTED} failed'
+
+
+@pytest.mark.parametrize('message', [
+    # Prose that names a secret before a colon is the cause of a failure, not a value
+    'Failed to update Vault secret: check-and-set parameter did not match the current version',
+    'Failed to refresh external secret: Forbidden',
+    'Vault token: permission denied',
+])
+def test_error_messages_are_kept(message):
+    assert redact(message) == message
+
+
+def test_other_settings_are_kept():
+    message = 'Server=sql,1433;Database=WorkoutTrackerWeb;User ID=app.202601010000;Max Pool Size=100'
+    assert redact(message) == message
+
+
+def test_journal_entry_keeps_no_password():
+    entry = json.dumps({'new_username': 'app.202601010000', 'new_password': 'Ab&c,d"e;f!', 'state': 'begun'})
+    redacted = redact(entry)
+    assert 'Ab&' not in redacted and ',d' not in redacted and 'f!' not in redacted
+    assert json.loads(redacted)['new_password'] == REDACTED
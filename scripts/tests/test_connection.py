@@ -0,0 +1,40 @@
+"""
+Credential swaps in connection strings (rotation_toolkit.connection.ConnectionString)
+
+Run from scripts/: python -m pytest -q tests
+"""
+
+import pytest
+
+from rotation_toolkit.connection import parse_connection_string
+
+
+@pytest.mark.parametrize('text', [
+    'Server=sql;User ID=old;Password=old-pw;UID=old;PWD=old-pw;Max Pool Size=50',
+    'Server=sql;User ID=old;Password=old-pw;Password={old;pw}',
+    'Driver={ODBC Driver 18 for SQL Server};Server=sql;UID=old;User=old;PWD={old};Encrypt=yes',
+])
+def test_every_spelling_of_a_credential_is_rewritten(text):
+    parsed = parse_connection_string(text)
+    assert str(parsed) == text
+
+    swapped = parsed.with_credentials('new', 'n;w"pw')
+    assert 'old' not in str(swapped)
+    reparsed = parse_connection_string(str(swapped))
+    for key, value in reparsed.items():
+        if key.lower() in ('user id', 'uid', 'user'):
+            assert value == 'new'
+        elif key.lower() in ('password', 'pwd'):
+            assert value == 'n;w"pw'
+    assert list(reparsed.keys()) == list(parsed.keys())
+
+
+def test_other_settings_are_kept():
+    text = 'Server=sql;Uid=old;Pwd=old-pw;Password=old-pw;Connect Timeout=30;Encrypt=True'
+    swapped = parse_connection_string(text).with_credentials('new', 'new-pw')
+    assert str(swapped) == 'Server=sql;Uid=new;Pwd=new-pw;Password=new-pw;Connect Timeout=30;Encrypt=True'
+
+
+def test_missing_credentials_are_appended():
+    swapped = parse_connection_string('Server=sql;Database=db').with_credentials('new', 'new-pw')
+    assert str(swapped) == 'Server=sql;Database=db;User ID=new;Password=new-pw'